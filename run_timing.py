@@ -1,6 +1,12 @@
+import argparse
+
 from wizardtracker.timing_service import Runner
 
 
 if __name__ == '__main__':
-    r = Runner()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--asyncio', action='store_true')
+    args = parser.parse_args()
+
+    r = Runner(use_asyncio=args.asyncio)
     r.start()
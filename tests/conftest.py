@@ -0,0 +1,26 @@
+import pytest
+
+from peewee import SqliteDatabase
+
+from wizardtracker.models import (
+    PRAGMAS,
+    Race,
+    RaceLapResult,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.models.migrations import migrate
+
+
+MODELS = [Race, RaceReceiver, RaceRssi, RaceRssiChunk, RaceLapResult]
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A fresh, migrated database in place of wizardtracker.db.
+    db = SqliteDatabase(str(tmp_path / 'test.db'), pragmas=PRAGMAS)
+    with db.bind_ctx(MODELS):
+        migrate(db)
+        yield db
+    db.close()
@@ -0,0 +1,131 @@
+import numpy
+import pytest
+
+from wizardtracker.timing_service.filters import (
+    DEFAULT_FILTERS,
+    EmaFilter,
+    MedianFilter,
+    MovingAverageFilter,
+    create_filter_chain,
+    lowpass_filter,
+    parse_filter_specs
+)
+
+
+def generate_rssi(sample_count=500, receiver_count=4, seed=0):
+    rng = numpy.random.default_rng(seed)
+    return rng.integers(0, 256, (sample_count, receiver_count))
+
+
+def in_batches(rssi_filter, rssi, seed=0):
+    # Batches of whatever size turn up, the way the processor sees them.
+    rng = numpy.random.default_rng(seed)
+    batches = []
+    start = 0
+    while start < len(rssi):
+        end = start + int(rng.integers(1, 20))
+        batches.append(rssi_filter.process(
+            numpy.array(rssi[start:end], dtype=numpy.float64)))
+        start = end
+
+    return numpy.concatenate(batches)
+
+
+def baseline_filter(rssi):
+    # DataProcessor before filter chains, one sample at a time.
+    last = None
+    filtered = []
+    for sample in rssi.tolist():
+        if not last:
+            last = list(sample)
+        last = [lowpass_filter(l, v) for l, v in zip(last, sample)]
+        filtered.append(last)
+
+    return numpy.array(filtered)
+
+
+def test_default_chain_matches_baseline_exactly():
+    rssi = generate_rssi()
+    filtered = in_batches(create_filter_chain(DEFAULT_FILTERS), rssi)
+
+    assert numpy.array_equal(filtered, baseline_filter(rssi))
+
+
+def test_ema_per_receiver_alpha():
+    rssi = generate_rssi(receiver_count=2)
+    alphas = [0.05, 0.5]
+    filtered = in_batches(EmaFilter(alpha=alphas), rssi)
+
+    for receiver, alpha in enumerate(alphas):
+        last = float(rssi[0, receiver])
+        for i, value in enumerate(rssi[:, receiver].tolist()):
+            last = lowpass_filter(last, value, alpha)
+            assert filtered[i, receiver] == last
+
+
+@pytest.mark.parametrize('filter_type, reduce', [
+    (MovingAverageFilter, numpy.mean),
+    (MedianFilter, numpy.median),
+])
+def test_window_filters(filter_type, reduce):
+    window = 5
+    rssi = generate_rssi()
+    filtered = in_batches(filter_type(window=window), rssi)
+
+    # The first sample stands in for the ones before it.
+    padded = numpy.concatenate(
+        (numpy.tile(rssi[0], (window - 1, 1)), rssi)).astype(numpy.float64)
+    for i in range(len(rssi)):
+        expected = reduce(padded[i:i + window], axis=0)
+        assert numpy.allclose(filtered[i], expected)
+
+
+def test_window_per_receiver():
+    rssi = generate_rssi(receiver_count=2)
+    filtered = in_batches(MovingAverageFilter(window=[1, 3]), rssi)
+
+    assert numpy.array_equal(filtered[:, 0], rssi[:, 0])
+    assert numpy.allclose(filtered[2:, 1], (
+        rssi[:-2, 1] + rssi[1:-1, 1] + rssi[2:, 1]) / 3)
+
+
+def test_chain_runs_in_order():
+    rssi = generate_rssi()
+    specs = [{'type': 'median', 'window': 3}, {'type': 'ema', 'alpha': 0.2}]
+    filtered = in_batches(create_filter_chain(specs), rssi)
+
+    median = in_batches(MedianFilter(window=3), rssi)
+    expected = in_batches(EmaFilter(alpha=0.2), median)
+    assert numpy.array_equal(filtered, expected)
+
+
+def test_kalman_holds_a_steady_signal():
+    rssi = numpy.full((50, 3), 120)
+    filtered = in_batches(
+        create_filter_chain([{'type': 'kalman'}]), rssi)
+
+    assert numpy.array_equal(filtered, rssi)
+
+
+@pytest.mark.parametrize('specs', [
+    {'type': 'ema'},
+    ['ema'],
+    [{'type': 'butterworth'}],
+    [{'type': 'ema', 'beta': 1}],
+])
+def test_bad_specs(specs):
+    with pytest.raises(ValueError):
+        create_filter_chain(specs)
+
+
+def test_bad_parameters_fail_on_first_batch():
+    chain = create_filter_chain([{'type': 'mean', 'window': [3, 3]}])
+
+    with pytest.raises(ValueError):
+        chain.process(numpy.zeros((1, 4)))
+
+
+def test_parse_filter_specs():
+    assert parse_filter_specs('') == DEFAULT_FILTERS
+    assert parse_filter_specs('[{"type": "median", "window": 3}]') == [
+        {'type': 'median', 'window': 3}]
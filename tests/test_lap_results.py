@@ -0,0 +1,95 @@
+import json
+
+import numpy
+import pytest
+
+from wizardtracker.models import (
+    Race,
+    RaceLapResult,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.models.rssi_chunks import encode_chunk
+from wizardtracker.timing_service.lap_results import (
+    compute_lap_results,
+    get_lap_results
+)
+from wizardtracker.timing_service.timing import DETECTION_PARAMETERS
+
+
+def create_race(lap_seconds=10, laps=4, sample_rate=100):
+    # A quad passing the receiver every lap_seconds, as RSSI peaks.
+    race = Race.create(name='test')
+    receiver = RaceReceiver.create(receiver_id=0, frequency=5800, race=race)
+
+    timestamps = numpy.arange(0, lap_seconds * laps, 1 / sample_rate)
+    phase = (timestamps % lap_seconds) / lap_seconds
+    values = (50 + 150 * numpy.exp(-((phase - 0.5) * 20) ** 2)).astype(int)
+    RaceRssiChunk.create(
+        receiver=receiver, **encode_chunk(timestamps, values))
+
+    return race, receiver
+
+
+def test_computes_and_stores(database):
+    race, _ = create_race()
+    results = json.loads(get_lap_results(race.id))
+
+    assert results['race'] == race.id
+    assert results['parameters'] == DETECTION_PARAMETERS
+    [receiver] = results['receivers']
+    assert [lap['lap'] for lap in receiver['laps']] == [1, 2, 3]
+    assert all(
+        lap['duration'] == pytest.approx(10, abs=0.02)
+        for lap in receiver['laps'])
+
+    stored = RaceLapResult.get(RaceLapResult.race == race.id)
+    assert json.loads(stored.results) == results
+
+
+def test_serves_what_was_stored(database):
+    race, _ = create_race()
+    RaceLapResult.create(
+        race=race,
+        parameters=json.dumps(DETECTION_PARAMETERS, sort_keys=True),
+        results='stored')
+
+    assert get_lap_results(race.id) == 'stored'
+
+
+def test_other_parameters_recompute(database):
+    race, _ = create_race()
+    compute_lap_results(race.id)
+    parameters = dict(DETECTION_PARAMETERS, peak_threshold=0.9)
+
+    results = json.loads(get_lap_results(race.id, parameters))
+    assert results['parameters'] == parameters
+
+
+def test_unknown_race(database):
+    assert get_lap_results(1234) is None
+
+
+@pytest.mark.parametrize('model', [RaceRssi, RaceRssiChunk])
+def test_new_rssi_drops_lap_results(database, model):
+    race, receiver = create_race()
+    other_race, _ = create_race()
+    compute_lap_results(race.id)
+    compute_lap_results(other_race.id)
+
+    if model is RaceRssi:
+        RaceRssi.create(timestamp=50.0, value=100, receiver=receiver)
+    else:
+        RaceRssiChunk.create(
+            receiver=receiver, **encode_chunk([50.0], [100]))
+
+    assert [r.race_id for r in RaceLapResult.select()] == [other_race.id]
+
+
+def test_deleted_rssi_drops_lap_results(database):
+    race, _ = create_race()
+    compute_lap_results(race.id)
+    RaceRssiChunk.delete().execute()
+
+    assert RaceLapResult.select().count() == 0
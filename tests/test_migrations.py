@@ -0,0 +1,129 @@
+import datetime
+
+import pytest
+
+from peewee import (
+    BooleanField,
+    CharField,
+    DateTimeField,
+    FloatField,
+    ForeignKeyField,
+    IntegerField,
+    Model,
+    SqliteDatabase
+)
+
+from wizardtracker.models import (
+    Race,
+    RaceLapResult,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.models.migrations import MIGRATIONS, get_version, migrate
+
+
+MODELS = [Race, RaceReceiver, RaceRssi, RaceRssiChunk, RaceLapResult]
+
+
+def create_old_database(path):
+    # What tools/gen_db.py made before schema versions.
+    db = SqliteDatabase(path, pragmas=(('foreign_keys', 'on'),))
+
+    class OldModel(Model):
+        class Meta:
+            database = db
+
+    class Race(OldModel):
+        name = CharField()
+        created_on = DateTimeField(default=datetime.datetime.now)
+        complete = BooleanField(default=False)
+
+    class RaceReceiver(OldModel):
+        receiver_id = IntegerField()
+        frequency = IntegerField()
+        race = ForeignKeyField(
+            Race, backref='receivers', on_delete='cascade')
+
+    class RaceRssi(OldModel):
+        timestamp = FloatField()
+        receiver = ForeignKeyField(
+            RaceReceiver, backref='rssi', on_delete='cascade')
+        value = IntegerField()
+
+    db.create_tables([Race, RaceReceiver, RaceRssi])
+    race = Race.create(name='old')
+    receiver = RaceReceiver.create(receiver_id=0, frequency=5800, race=race)
+    RaceRssi.insert_many([
+        {'timestamp': i / 100, 'value': i % 256, 'receiver': receiver}
+        for i in range(100)]).execute()
+    db.close()
+
+
+def indexes(db, table):
+    return {index.name for index in db.get_indexes(table)}
+
+
+def test_fresh_database(database):
+    assert get_version(database) == len(MIGRATIONS)
+    assert set(database.get_tables()) == {
+        'race',
+        'racereceiver',
+        'racerssi',
+        'racerssichunk',
+        'racelapresult'}
+    assert 'racerssi_receiver_id_timestamp_value' in indexes(
+        database, 'racerssi')
+
+
+def test_migrate_twice(database):
+    assert migrate(database) == len(MIGRATIONS)
+    assert get_version(database) == len(MIGRATIONS)
+
+
+def test_existing_database(tmp_path):
+    path = str(tmp_path / 'old.db')
+    create_old_database(path)
+
+    db = SqliteDatabase(path)
+    assert get_version(db) == 0
+    assert 'racerssi_receiver_id' in indexes(db, 'racerssi')
+
+    with db.bind_ctx(MODELS):
+        migrate(db)
+
+        assert get_version(db) == len(MIGRATIONS)
+        assert indexes(db, 'racerssi') == {
+            'racerssi_receiver_id_timestamp_value'}
+        assert Race.get().name == 'old'
+        assert RaceRssi.select().count() == 100
+
+    db.close()
+
+
+def test_newer_database(tmp_path):
+    db = SqliteDatabase(str(tmp_path / 'new.db'))
+    db.execute_sql('PRAGMA user_version = {}'.format(len(MIGRATIONS) + 1))
+
+    with pytest.raises(RuntimeError):
+        migrate(db)
+
+    db.close()
+
+
+def test_failed_migration_changes_nothing(tmp_path, monkeypatch):
+    def fail(database):
+        database.execute_sql('CREATE TABLE half_done (id INTEGER)')
+        raise ValueError('Migration failed.')
+
+    db = SqliteDatabase(str(tmp_path / 'test.db'))
+    monkeypatch.setattr(
+        'wizardtracker.models.migrations.MIGRATIONS', MIGRATIONS + [fail])
+
+    with db.bind_ctx(MODELS), pytest.raises(ValueError):
+        migrate(db)
+
+    assert get_version(db) == len(MIGRATIONS)
+    assert 'half_done' not in db.get_tables()
+    db.close()
+
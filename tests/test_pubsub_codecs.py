@@ -0,0 +1,100 @@
+import array
+import struct
+
+import pytest
+
+from wizardtracker.pubsub_codecs import (
+    BATCH_KEY,
+    BINARY_HEADER,
+    BINARY_MAGIC,
+    BINARY_VERSION,
+    JsonCodec,
+    RssiBinaryCodec,
+    decode,
+    get_codec
+)
+
+
+def sample(rssi, timestamp=1234.567890123, sequence=None):
+    data = {'timestamp': timestamp, 'rssi': rssi}
+    if sequence is not None:
+        data['sequence'] = sequence
+
+    return data
+
+
+@pytest.mark.parametrize('rssi', [
+    [0, 128, 255],
+    [0, 1000, 65535],
+    [0.1, 2 / 3, 255.0, 1e-300],
+])
+def test_binary_round_trip(rssi):
+    data = sample(rssi, sequence=7)
+
+    assert decode(RssiBinaryCodec().encode(data)) == data
+
+
+def test_binary_batch_round_trip():
+    data = {BATCH_KEY: [
+        sample([i, i + 1], timestamp=1000 + i / 3, sequence=i)
+        for i in range(50)]}
+
+    assert decode(RssiBinaryCodec().encode(data)) == data
+
+
+def test_binary_without_sequence():
+    data = sample([1, 2, 3])
+    decoded = decode(RssiBinaryCodec().encode(data))
+
+    assert decoded == data
+    assert 'sequence' not in decoded
+
+
+def test_binary_keeps_integers_integers():
+    decoded = decode(RssiBinaryCodec().encode(sample([1, 2, 3])))
+
+    assert all(isinstance(r, int) for r in decoded['rssi'])
+
+
+def test_binary_floats_are_doubles():
+    # float32 would round these.
+    rssi = [100.123456789, 0.1]
+    payload = RssiBinaryCodec().encode(sample(rssi))
+
+    assert decode(payload)['rssi'] == rssi
+    assert len(payload) == BINARY_HEADER.size + 8 + 2 * 8
+
+
+def test_binary_still_reads_float32():
+    # What floats were packed as before, still around in streams.
+    values = array.array('f', [1.5, 2.25])
+    payload = BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, 0, 2, 2, 1) + \
+        struct.pack('<d', 10.0) + values.tobytes()
+
+    assert decode(payload) == sample([1.5, 2.25], timestamp=10.0)
+
+
+@pytest.mark.parametrize('data', [
+    {'filters': [{'type': 'ema', 'alpha': 0.1}]},
+    {'timestamp': 1.0, 'rssi': [1, 2], 'race': 'heat 1'},
+    {BATCH_KEY: [sample([1, 2]), sample([1, 2, 3])]},
+    {BATCH_KEY: []},
+    'text',
+])
+def test_binary_falls_back_to_json(data):
+    payload = RssiBinaryCodec().encode(data)
+
+    assert not payload.startswith(BINARY_MAGIC)
+    assert decode(payload) == data
+
+
+def test_json_round_trip():
+    data = {BATCH_KEY: [sample([0.5, 3], sequence=1)]}
+
+    assert decode(JsonCodec().encode(data)) == data
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('msgpack')
@@ -0,0 +1,159 @@
+import types
+
+import numpy
+import pytest
+
+from wizardtracker.models import Race, RaceReceiver, RaceRssi, RaceRssiChunk
+from wizardtracker.models.rssi_chunks import (
+    decode_chunk,
+    encode_chunk,
+    load_race_rssi,
+    load_rssi,
+    split_chunks
+)
+
+
+def generate(sample_count=1000, low=0, high=256, seed=0):
+    rng = numpy.random.default_rng(seed)
+    # Uneven gaps, like samples timestamped as they're read.
+    timestamps = 12345.678 + numpy.cumsum(
+        rng.uniform(0.001, 0.02, sample_count))
+    values = rng.integers(low, high, sample_count)
+
+    return timestamps, values
+
+
+def round_trip(timestamps, values):
+    return decode_chunk(types.SimpleNamespace(
+        **encode_chunk(timestamps, values)))
+
+
+@pytest.mark.parametrize('low, high, value_type', [
+    (0, 256, '|u1'),
+    (0, 65536, '<u2'),
+    (-5, 70000, '<i4'),
+    (-2 ** 40, 2 ** 40, '<i8'),
+])
+def test_round_trip(low, high, value_type):
+    timestamps, values = generate(low=low, high=high)
+    chunk = encode_chunk(timestamps, values)
+    decoded_timestamps, decoded_values = round_trip(timestamps, values)
+
+    assert chunk['value_type'] == value_type
+    assert chunk['sample_count'] == len(values)
+    assert numpy.array_equal(decoded_timestamps, timestamps)
+    assert numpy.array_equal(decoded_values, values)
+
+
+def test_round_trip_one_sample():
+    timestamps, values = round_trip([5.5], [200])
+
+    assert timestamps.tolist() == [5.5]
+    assert values.tolist() == [200]
+
+
+def test_round_trip_wrapping_deltas():
+    # Differences that don't fit the value type wrap, and wrap back.
+    values = [0, 255, 0, 255, 1]
+    timestamps = [1.0, 1e-300, 1e300, -1.0, 2.0]
+    decoded_timestamps, decoded_values = round_trip(timestamps, values)
+
+    assert decoded_timestamps.tolist() == timestamps
+    assert decoded_values.tolist() == values
+
+
+def test_split_chunks_by_duration():
+    timestamps = numpy.arange(0, 12, 0.5)
+    chunks = list(split_chunks(timestamps, duration=5, size=100))
+
+    assert chunks == [(0, 10), (10, 20), (20, 24)]
+
+
+def test_split_chunks_by_size():
+    timestamps = numpy.arange(0, 1, 0.01)
+    chunks = list(split_chunks(timestamps, duration=5, size=30))
+
+    assert chunks == [(0, 30), (30, 60), (60, 90), (90, 100)]
+
+
+def test_split_chunks_covers_everything():
+    timestamps, _ = generate(5000)
+    chunks = list(split_chunks(timestamps, duration=1, size=64))
+
+    assert chunks[0][0] == 0
+    assert chunks[-1][1] == len(timestamps)
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+    for start, end in chunks:
+        assert 0 < end - start <= 64
+        assert timestamps[end - 1] - timestamps[start] < 1
+
+
+def test_split_chunks_repeated_timestamps():
+    assert list(split_chunks([1.0, 1.0, 1.0], duration=0)) == [
+        (0, 1), (1, 2), (2, 3)]
+    assert list(split_chunks([])) == []
+
+
+def create_receiver(race, receiver_id):
+    return RaceReceiver.create(
+        receiver_id=receiver_id, frequency=5800, race=race)
+
+
+def store_chunks(receiver, timestamps, values):
+    RaceRssiChunk.insert_many([
+        dict(
+            encode_chunk(timestamps[start:end], values[start:end]),
+            receiver=receiver)
+        for start, end in split_chunks(timestamps, duration=1)]).execute()
+
+
+def store_rows(receiver, timestamps, values):
+    RaceRssi.insert_many([
+        {'timestamp': t, 'value': v, 'receiver': receiver}
+        for t, v in zip(timestamps.tolist(), values.tolist())]).execute()
+
+
+def test_load_race_rssi(database):
+    race = Race.create(name='test')
+    chunked = create_receiver(race, 1)
+    rows = create_receiver(race, 0)
+    timestamps, values = generate()
+    store_chunks(chunked, timestamps, values)
+    store_rows(rows, timestamps, values[::-1])
+
+    loaded = load_race_rssi(race.id)
+
+    # In receiver_id order, and the RaceRssi receiver comes out the same.
+    assert list(loaded) == [rows.id, chunked.id]
+    assert numpy.array_equal(loaded[chunked.id][0], timestamps)
+    assert numpy.array_equal(loaded[chunked.id][1], values)
+    assert numpy.array_equal(loaded[rows.id][0], timestamps)
+    assert numpy.array_equal(loaded[rows.id][1], values[::-1])
+
+
+def test_load_rssi_time_range(database):
+    race = Race.create(name='test')
+    chunked = create_receiver(race, 0)
+    rows = create_receiver(race, 1)
+    timestamps, values = generate()
+    store_chunks(chunked, timestamps, values)
+    store_rows(rows, timestamps, values)
+
+    start_time = timestamps[100]
+    end_time = timestamps[400]
+    loaded = load_rssi([chunked.id, rows.id], start_time, end_time)
+
+    for receiver_id in (chunked.id, rows.id):
+        assert numpy.array_equal(
+            loaded[receiver_id][0], timestamps[100:401])
+        assert numpy.array_equal(loaded[receiver_id][1], values[100:401])
+
+
+def test_load_rssi_nothing_recorded(database):
+    race = Race.create(name='test')
+    receiver = create_receiver(race, 0)
+    timestamps, values = load_rssi([receiver.id])[receiver.id]
+
+    assert len(timestamps) == 0
+    assert len(values) == 0
@@ -0,0 +1,137 @@
+import struct
+
+import pytest
+
+from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+from wizardtracker.shm_ring import (
+    MAX_RECEIVERS,
+    RECORD_SIZE,
+    RING_HEADER_SIZE,
+    ShmRingReader,
+    ShmRingWriter
+)
+
+
+@pytest.fixture
+def ring(tmp_path):
+    writer = ShmRingWriter('x', str(tmp_path), 4)
+    reader = ShmRingReader('x', str(tmp_path), 4)
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def sample(i, rssi=None):
+    return {
+        'timestamp': 1000 + i / 3,
+        'rssi': rssi if rssi is not None else [i, i + 1],
+        'sequence': i,
+    }
+
+
+def test_round_trip(ring):
+    writer, reader = ring
+    samples = [
+        sample(0),
+        sample(1, [0.1, 2 / 3, 100.123456789]),
+        {'timestamp': 5.0, 'rssi': [1, 2]},
+    ]
+    writer.write(samples)
+
+    read = reader.read()
+    assert read == samples
+    assert all(isinstance(r, int) for r in read[0]['rssi'])
+    assert reader.read() == []
+
+
+def test_reader_only_sees_new_samples(ring, tmp_path):
+    writer, reader = ring
+    writer.write([sample(0)])
+    reader.read()
+
+    late_reader = ShmRingReader('x', str(tmp_path), 4)
+    writer.write([sample(1)])
+    assert late_reader.read() == [sample(1)]
+    late_reader.close()
+
+
+def test_wraparound_drops_oldest(ring):
+    writer, reader = ring
+    writer.write([sample(i) for i in range(10)])
+
+    assert reader.read() == [sample(i) for i in range(6, 10)]
+    assert reader.dropped_count == 6
+
+
+def test_wraparound_across_writes(ring):
+    writer, reader = ring
+    for i in range(10):
+        writer.write([sample(i)])
+        assert reader.read() == [sample(i)]
+
+    assert reader.dropped_count == 0
+
+
+def test_max_count(ring):
+    writer, reader = ring
+    writer.write([sample(i) for i in range(3)])
+
+    assert reader.read(max_count=2) == [sample(0), sample(1)]
+    assert reader.read() == [sample(2)]
+
+
+def test_unfinished_record_is_not_read(ring):
+    writer, reader = ring
+    writer.write([sample(0), sample(1)])
+
+    # What the writer leaves while it's part way through a record.
+    stamp_offset = RING_HEADER_SIZE + RECORD_SIZE
+    writer._ring[stamp_offset:stamp_offset + 8] = struct.pack('<Q', 0)
+
+    assert reader.read() == [sample(0)]
+    assert reader.read() == []
+
+    writer._ring[stamp_offset:stamp_offset + 8] = struct.pack('<Q', 2)
+    assert reader.read() == [sample(1)]
+
+
+def test_ready_and_wait(ring):
+    writer, reader = ring
+    assert not reader.ready()
+
+    writer.write([sample(0)])
+    assert reader.ready()
+    reader.wait(5)
+    reader.read()
+
+    assert not reader.ready()
+    reader.wait(0.01)
+    assert reader.read() == []
+
+
+def test_rejects_what_it_cannot_hold(ring):
+    writer, _ = ring
+
+    with pytest.raises(ValueError):
+        writer.write([sample(0, list(range(MAX_RECEIVERS + 1)))])
+    with pytest.raises(ValueError):
+        writer.write([dict(sample(0), race=1)])
+
+
+def test_pubsub_over_shm(tmp_path):
+    # Never connects, the rings don't need Redis.
+    options = {'transports': {'x': 'shm'}, 'shm_directory': str(tmp_path)}
+    subscriber = NiceRedisPubsub(**options)
+    publisher = NiceRedisPubsub(**options)
+
+    received = []
+    subscriber.subscribe('x', received.append)
+    subscriber.tick_messages(0.01)
+    assert received == []
+
+    publisher.publish_batch('x', [sample(0), sample(1)])
+    subscriber.tick_messages(1)
+
+    assert received == [sample(0), sample(1)]
+    subscriber.close()
+    publisher.close()
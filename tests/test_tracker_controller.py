@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from wizardtracker.device_service.tracker.controller import (
+    TrackerController,
+    _TrackerState,
+    _decode_rssi_lines
+)
+
+
+class ListPublisher:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, rssi_data):
+        self.published.append(rssi_data)
+
+
+def test_decode_rssi_lines():
+    values = _decode_rssi_lines([b'1 2 3', b'4 5 6\r', b'65535 0 7'], 3)
+
+    assert values.tolist() == [1, 2, 3, 4, 5, 6, 65535, 0, 7]
+
+
+@pytest.mark.parametrize('lines', [
+    [b'1 2', b'3 4 5 6'],
+    [b'1 2 3', b'4 5'],
+    [b'1 2 3', b'4 5 x'],
+    [b'1 2 3', b'4 5 -6'],
+    [b'1 2 3', b'4 565536 7'],
+])
+def test_decode_rssi_lines_rejects_malformed(lines):
+    with pytest.raises(ValueError):
+        _decode_rssi_lines(lines, 3)
+
+
+@pytest.mark.parametrize('batch_decode', [True, False])
+def test_malformed_lines_are_skipped(batch_decode):
+    publisher = ListPublisher()
+    controller = TrackerController(publisher, batch_decode=batch_decode)
+    controller.receiver_count = 3
+    controller.frequencies = [5800] * 3
+    controller._state = _TrackerState.READY
+    controller._read_ns = time.perf_counter_ns()
+
+    controller._line_buffer.append_data(
+        b'r 1 2 3\nr 4 5\nv 11.1\nr 6 7 8 9\nr 10 11 12\n')
+    controller._parse_buffered_lines()
+
+    assert [p['rssi'] for p in publisher.published] == [
+        [1, 2, 3], [10, 11, 12]]
+    # The skipped lines still use up their place in the sequence.
+    assert [p['sequence'] for p in publisher.published] == [0, 3]
+    assert controller.voltage == 11.1
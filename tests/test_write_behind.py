@@ -0,0 +1,148 @@
+import os
+import pickle
+import threading
+
+import pytest
+
+from wizardtracker.timing_service.write_behind import (
+    BLOCK,
+    DROP_OLDEST,
+    SPILL,
+    WriteBehindQueue
+)
+
+
+class BlockedWriter:
+    # Holds up the writer thread on its first batch until released.
+    def __init__(self):
+        self.written = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, batch):
+        self.started.set()
+        self.release.wait(5)
+        self.written.append(batch)
+
+
+def queue(tmp_path, write, policy, size=2, **kwargs):
+    q = WriteBehindQueue(
+        'test',
+        write,
+        size=size,
+        policy=policy,
+        spill_directory=str(tmp_path),
+        **kwargs)
+    q.start()
+
+    return q
+
+
+def fill(q, writer, count):
+    # The first batch goes straight to the writer, which then waits.
+    q.put(0)
+    writer.started.wait(5)
+    for i in range(1, count):
+        q.put(i)
+
+
+def test_writes_in_order(tmp_path):
+    written = []
+    q = queue(tmp_path, written.append, BLOCK)
+    for i in range(20):
+        q.put(i)
+    q.drain()
+    q.close()
+
+    assert written == list(range(20))
+
+
+def test_unknown_policy(tmp_path):
+    with pytest.raises(ValueError):
+        WriteBehindQueue('test', print, policy='ignore')
+
+
+def test_block_waits_for_room(tmp_path):
+    writer = BlockedWriter()
+    q = queue(tmp_path, writer, BLOCK)
+    fill(q, writer, 3)
+
+    put = threading.Thread(target=q.put, args=(3,))
+    put.start()
+    put.join(0.1)
+    assert put.is_alive()
+
+    writer.release.set()
+    put.join(5)
+    q.drain()
+    q.close()
+
+    assert writer.written == [0, 1, 2, 3]
+
+
+def test_drop_oldest(tmp_path):
+    writer = BlockedWriter()
+    q = queue(tmp_path, writer, DROP_OLDEST)
+    fill(q, writer, 6)
+
+    writer.release.set()
+    q.drain()
+    q.close()
+
+    assert writer.written == [0, 4, 5]
+
+
+def test_spill_keeps_order(tmp_path):
+    writer = BlockedWriter()
+    q = queue(tmp_path, writer, SPILL)
+    fill(q, writer, 8)
+    assert os.path.exists(os.path.join(str(tmp_path), 'test.spill'))
+
+    writer.release.set()
+    q.drain()
+    q.put(8)
+    q.drain()
+    q.close()
+
+    assert writer.written == list(range(9))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_spill_recovery(tmp_path):
+    # What a crash part way through writing out a spill leaves behind.
+    def spill(path, batches):
+        with open(os.path.join(str(tmp_path), path), 'wb') as f:
+            for batch in batches:
+                pickle.dump(batch, f)
+
+    spill('test.spill.writing', [1, 2])
+    spill('test.spill', [3, 4])
+    with open(os.path.join(str(tmp_path), 'test.spill'), 'ab') as f:
+        f.write(b'\x80half a batch')
+
+    written = []
+    q = queue(tmp_path, written.append, SPILL, recover=lambda b: b * 10)
+    q.drain()
+    q.put(5)
+    q.drain()
+    q.close()
+
+    assert written == [10, 20, 30, 40, 5]
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_failed_writes_are_dropped(tmp_path):
+    written = []
+
+    def write(batch):
+        if batch == 1:
+            raise RuntimeError('disk full')
+        written.append(batch)
+
+    q = queue(tmp_path, write, BLOCK)
+    for i in range(3):
+        q.put(i)
+    q.drain()
+    q.close()
+
+    assert written == [0, 2]
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+
+import redis
+import redis.asyncio
+
+from wizardtracker import pubsub_codecs
+from wizardtracker.nice_redis_pubsub import (
+    MESSAGE_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    SHM_TRANSPORT,
+    STREAM_DATA_FIELD,
+    STREAM_TRANSPORT,
+    NiceRedisPubsub
+)
+from wizardtracker.shm_ring import ShmRingReader
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class AsyncNiceRedisPubsub(NiceRedisPubsub):
+    # Same channels, codecs and transports as NiceRedisPubsub, but for use on
+    # an asyncio event loop. publish() stays a plain call so callbacks can be
+    # shared with the threaded services, messages are queued and sent from a
+    # background task.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._outgoing = None
+        self._publish_task = None
+        self._tick_tasks = {}
+
+    async def connect(self):
+        LOGGER.info('Connecting to Redis...')
+        if not self._redis:
+            self._redis = redis.asyncio.StrictRedis(
+                host=self._host,
+                port=self._port,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT)
+
+        # Block until connected, giving messages along the way.
+        connected = False
+        while not connected:
+            try:
+                LOGGER.info('Testing Redis connection...')
+                pong = await self._redis.ping()
+                if pong:
+                    LOGGER.info('Connected to Redis successfully!')
+                    connected = True
+            except redis.exceptions.ConnectionError:
+                LOGGER.error('Connection to Redis failed. Trying again...')
+
+        self._redis_pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+
+        self._outgoing = asyncio.Queue()
+        self._publish_task = asyncio.ensure_future(self._publish_loop())
+
+    async def subscribe(self, channel, callback, batch=False):
+        if not channel in self._callbacks:
+            if self._transport(channel) == STREAM_TRANSPORT:
+                await self._subscribe_stream(channel)
+            elif self._transport(channel) == SHM_TRANSPORT:
+                self._shm_readers[channel] = ShmRingReader(
+                    channel, self._shm_directory, self._shm_capacity)
+            else:
+                await self._redis_pubsub.subscribe(channel)
+            self._callbacks[channel] = []
+
+        self._callbacks[channel].append((callback, batch))
+
+    def publish(self, channel, data):
+        if self._transport(channel) == SHM_TRANSPORT:
+            self._publish_shm(channel, data)
+            return
+
+        codec = self._codecs.get(channel, pubsub_codecs.DEFAULT_CODEC)
+        self._outgoing.put_nowait((channel, codec.encode(data)))
+
+    async def tick_messages(self, timeout=MESSAGE_TIMEOUT):
+        if not self._callbacks:
+            await asyncio.sleep(timeout)
+            return
+
+        # Unlike the threaded version, every transport waits at the same time.
+        # A wait that's still going when we return carries on into the next
+        # call rather than being started again.
+        for key, tick, args in self._ticks():
+            if key not in self._tick_tasks:
+                self._tick_tasks[key] = asyncio.ensure_future(
+                    tick(*args, timeout))
+
+        done, _ = await asyncio.wait(
+            self._tick_tasks.values(),
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED)
+
+        for key, task in list(self._tick_tasks.items()):
+            if task in done:
+                del self._tick_tasks[key]
+                task.result()
+
+    async def aclose(self):
+        for task in self._tick_tasks.values():
+            task.cancel()
+
+        if self._publish_task:
+            await self._outgoing.join()
+            self._publish_task.cancel()
+
+        self.close()
+        await self._redis_pubsub.close()
+        await self._redis.close()
+
+    def _ticks(self):
+        other_count = len(self._stream_ids) + len(self._shm_readers)
+        if other_count < len(self._callbacks):
+            yield 'pubsub', self._tick_pubsub, ()
+        if self._stream_ids:
+            yield 'streams', self._tick_streams, ()
+        for channel in self._shm_readers:
+            yield 'shm:' + channel, self._tick_shm, (channel,)
+
+    async def _subscribe_stream(self, channel):
+        try:
+            await self._redis.xgroup_create(
+                channel,
+                self._consumer_group,
+                id='$',
+                mkstream=True)
+        except redis.exceptions.ResponseError as err:
+            # The group sticks around between restarts, which is the point.
+            if 'BUSYGROUP' not in str(err):
+                raise
+
+        self._stream_ids[channel] = '0'
+
+    async def _publish_loop(self):
+        while True:
+            messages = [await self._outgoing.get()]
+            while not self._outgoing.empty():
+                messages.append(self._outgoing.get_nowait())
+
+            # Send whatever piled up while we were waiting in one round trip.
+            try:
+                pipeline = self._redis.pipeline(transaction=False)
+                for channel, payload in messages:
+                    if self._transport(channel) == STREAM_TRANSPORT:
+                        pipeline.xadd(
+                            channel,
+                            {STREAM_DATA_FIELD: payload},
+                            maxlen=self._stream_maxlen,
+                            approximate=True)
+                    else:
+                        pipeline.publish(channel, payload)
+                await pipeline.execute()
+            except redis.exceptions.RedisError:
+                LOGGER.exception(
+                    'Failed to publish %d messages.', len(messages))
+            finally:
+                for _ in messages:
+                    self._outgoing.task_done()
+
+    async def _tick_pubsub(self, timeout):
+        message = await self._redis_pubsub.get_message(timeout=timeout)
+
+        if message:
+            channel = message['channel'].decode('utf-8')
+            if channel in self._callbacks:
+                self._dispatch(channel, message['data'])
+
+    async def _tick_streams(self, timeout):
+        # XREADGROUP treats BLOCK 0 as forever, so only block for real waits.
+        block = int(timeout * 1000) or None
+        if any(i != '>' for i in self._stream_ids.values()):
+            block = None
+
+        response = await self._redis.xreadgroup(
+            self._consumer_group,
+            self._consumer_group,
+            self._stream_ids,
+            count=self._stream_read_count,
+            block=block)
+
+        for channel, entries in response or []:
+            channel = channel.decode('utf-8')
+
+            if not entries:
+                # Nothing left pending from before, switch to new entries.
+                self._stream_ids[channel] = '>'
+                continue
+
+            entry_ids = []
+            for entry_id, fields in entries:
+                if fields:
+                    self._dispatch(channel, fields[STREAM_DATA_FIELD])
+                entry_ids.append(entry_id)
+
+            await self._redis.xack(channel, self._consumer_group, *entry_ids)
+
+    async def _tick_shm(self, channel, timeout):
+        reader = self._shm_readers[channel]
+
+        await reader.wait_async(timeout)
+        self._dispatch_items(channel, reader.read())
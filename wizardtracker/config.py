@@ -0,0 +1,77 @@
+import collections
+import configparser
+
+
+CONFIG_PATH = './config.ini'
+DEFAULT_DEVICE_ID = 'default'
+
+
+def get_config():
+    config = configparser.ConfigParser()
+    # Keep option names as written, channel names are case sensitive.
+    config.optionxform = str
+    config.read(CONFIG_PATH)
+
+    return config
+
+
+def get_pubsub_options(config):
+    options = {}
+
+    if config.has_section('codecs'):
+        options['codecs'] = dict(config['codecs'])
+
+    if config.has_section('transports'):
+        options['transports'] = dict(config['transports'])
+
+    if config.has_section('streams'):
+        streams = config['streams']
+        if 'maxlen' in streams:
+            options['stream_maxlen'] = streams.getint('maxlen')
+        if 'read_count' in streams:
+            options['stream_read_count'] = streams.getint('read_count')
+
+    if config.has_section('shm'):
+        shm = config['shm']
+        if 'directory' in shm:
+            options['shm_directory'] = shm['directory']
+        if 'capacity' in shm:
+            options['shm_capacity'] = shm.getint('capacity')
+
+    return options
+
+
+def get_database_options(config):
+    # [database] has the path, and anything else in it is a pragma.
+    options = {}
+
+    if config.has_section('database'):
+        database = config['database']
+        if 'path' in database:
+            options['path'] = database['path']
+
+        options['pragmas'] = [
+            (name, value) for name, value in database.items()
+            if name != 'path']
+
+    return options
+
+
+def get_device_sections(config):
+    # [device] holds settings shared by every device, and [device.<id>]
+    # overrides them for one device.
+    device_ids = config['device'].get('ids', DEFAULT_DEVICE_ID).split(',')
+
+    sections = collections.OrderedDict()
+    for device_id in (i.strip() for i in device_ids if i.strip()):
+        name = 'device.{}'.format(device_id)
+        if not config.has_section(name):
+            config.add_section(name)
+
+        for key, value in config['device'].items():
+            if key != 'ids' and not config.has_option(name, key):
+                config.set(name, key, value)
+
+        sections[device_id] = config[name]
+
+    return sections
@@ -6,10 +6,14 @@ import time
 import coloredlogs
 import requests
 
-from flask import Flask
+from flask import Flask, Response
 from flask_socketio import SocketIO
 
+from wizardtracker import metrics
+from wizardtracker.config import get_config, get_pubsub_options
+from wizardtracker.device_client import DEVICE_CLIENT
 from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+from wizardtracker.sample_sequence import SequenceGapCounter
 
 
 def silence_log(name):
@@ -22,7 +26,6 @@ silence_log('engineio')
 silence_log('urllib3.connectionpool')
 
 
-DEVICE_BASE_URL = 'http://127.0.0.1:3091'
 LOGGER = logging.getLogger(__name__)
 
 
@@ -37,6 +40,11 @@ socketio = SocketIO()
 socketio.init_app(app)
 
 
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 class Delta5CompatNode:
     def __init__(self, d5compat, index, frequency):
         self._d5compat = d5compat
@@ -69,13 +77,7 @@ class Delta5CompatNode:
 
     @frequency.setter
     def frequency(self, new_frequency):
-        requests.post(
-            DEVICE_BASE_URL + '/set_frequency',
-            params={
-                'id': self.index,
-                'frequency': new_frequency
-            })
-
+        # Only local, Delta5Compat.set_frequencies tells the device.
         self._frequency = new_frequency
 
     @property
@@ -133,11 +135,14 @@ class Delta5Compat:
     SEND_HEARTBEAT_INTERVAL = 1
     POLL_STATUS_INTERVAL = 5
 
-    def __init__(self, socketio):
+    def __init__(self, socketio, pubsub_options=None):
         self._socketio = socketio
-        self._redis = NiceRedisPubsub()
+        self._redis = NiceRedisPubsub(
+            consumer_group='delta5_compat',
+            **(pubsub_options or {}))
 
         self._nodes = []
+        self.rssi_filtered_gaps = SequenceGapCounter('rssiFiltered')
 
         self.trigger_threshold = 175
         self._timestamp = 0
@@ -179,7 +184,51 @@ class Delta5Compat:
 
     def set_frequency(self, receiver_id, frequency):
         LOGGER.info('Setting frequency (RX%d: %dHz)...', receiver_id, frequency)
-        self._nodes[receiver_id].frequency = frequency
+
+        # From the device rather than our nodes, which don't hear about
+        # changes made through the web API. Otherwise they'd be undone.
+        try:
+            status = self._get_status()
+        except requests.RequestException:
+            LOGGER.exception('Failed to get frequencies from the device.')
+            return
+
+        # Left out until the device is ready.
+        frequencies = None
+        if isinstance(status, dict):
+            frequencies = status.get('frequencies')
+        if not isinstance(frequencies, list) or \
+                not 0 <= receiver_id < len(frequencies):
+            LOGGER.error(
+                'Device has no frequency for RX%d (not ready?).', receiver_id)
+            return
+
+        frequencies = list(frequencies)
+        frequencies[receiver_id] = frequency
+        self.set_frequencies(frequencies)
+
+    def set_frequencies(self, frequencies):
+        # The device service only writes the receivers that changed, and
+        # does it in one go.
+        try:
+            r = DEVICE_CLIENT.set_frequencies(frequencies)
+        except requests.RequestException:
+            LOGGER.exception('Failed to set frequencies %s.', frequencies)
+            return
+
+        if r.status_code != 200:
+            LOGGER.error(
+                'Setting frequencies %s failed with %d.',
+                frequencies,
+                r.status_code)
+            return
+
+        if not r.json()['success']:
+            LOGGER.error('Device rejected frequencies %s.', frequencies)
+            return
+
+        for node, frequency in zip(self._nodes, frequencies):
+            node.frequency = frequency
 
     def reset_auto_calibration(self, receiver_id=None):
         if receiver_id is None or receiver_id == -1:
@@ -221,27 +270,27 @@ class Delta5Compat:
             time.sleep(5)
 
     def _rssi_filtered_cb(self, data):
+        self.rssi_filtered_gaps.check(data)
         self._timestamp = data['timestamp']
         for i, rssi in enumerate(data['rssi']):
             self._nodes[i].rssi = int(rssi / 255.0 * 300)
 
     def _poll_status(self):
-        if time.clock() >= self._last_status_update + self.POLL_STATUS_INTERVAL:
+        now = time.perf_counter()
+        if now >= self._last_status_update + self.POLL_STATUS_INTERVAL:
             LOGGER.debug('Polling for status...')
             self._status = self._get_status()
-            self._last_status_update = time.clock()
+            self._last_status_update = now
 
     def _get_status(self):
-        r = requests.get(DEVICE_BASE_URL + '/status')
-        status = r.json()
-
-        return status
+        return DEVICE_CLIENT.status()
 
     def _send_heartbeat(self):
-        if time.clock() >= self._last_heartbeat + self.SEND_HEARTBEAT_INTERVAL:
+        now = time.perf_counter()
+        if now >= self._last_heartbeat + self.SEND_HEARTBEAT_INTERVAL:
             LOGGER.debug('Sending heartbeat...')
             self._socketio.emit('heartbeat', {'current_rssi': self.rssi})
-            self._last_heartbeat = time.clock()
+            self._last_heartbeat = now
 
 
 @socketio.on('connect')
@@ -321,7 +370,7 @@ def on_simulate_pass():
 
 
 def run():
-    d5compat = Delta5Compat(socketio)
+    d5compat = Delta5Compat(socketio, get_pubsub_options(get_config()))
     d5compat_thread = threading.Thread(target=d5compat.start)
     app.d5compat = d5compat
 
@@ -0,0 +1,205 @@
+import collections
+import json
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from wizardtracker import metrics
+
+
+DEVICE_BASE_URL = 'http://127.0.0.1:3091'
+# Connect, read.
+TIMEOUT = (1, 5)
+# Only connection failures get retried for POSTs, a command that reached the
+# device service is never sent twice.
+RETRIES = 2
+RETRY_BACKOFF = 0.1
+# Connections kept open to the device service. Busier moments open extra
+# connections that are closed after use.
+POOL_SIZE = 2
+# The device service only refreshes its snapshot this often anyway.
+STATUS_MAX_AGE = 0.1
+
+
+class DeviceStatus:
+    __slots__ = ('status_code', 'body', 'etag', 'fetched_at', '_json')
+
+    def __init__(self, status_code, body, etag, fetched_at):
+        self.status_code = status_code
+        self.body = body
+        self.etag = etag
+        self.fetched_at = fetched_at
+        self._json = None
+
+    def json(self):
+        # Shared between callers, so don't modify what comes back.
+        if self._json is None:
+            self._json = json.loads(self.body.decode('utf-8'))
+
+        return self._json
+
+
+class DeviceClient:
+    # One of these per process, shared by every thread that talks to the
+    # device service. Connections are kept open between calls, and /status
+    # is cached for a short while so that any number of pollers turn into
+    # at most one upstream request per device per STATUS_MAX_AGE.
+
+    def __init__(
+            self,
+            base_url=DEVICE_BASE_URL,
+            timeout=TIMEOUT,
+            retries=RETRIES,
+            pool_size=POOL_SIZE,
+            status_max_age=STATUS_MAX_AGE):
+        self._base_url = base_url
+        self._timeout = timeout
+        self._status_max_age = status_max_age
+
+        # Read retries only apply to idempotent methods by default.
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=RETRY_BACKOFF,
+                raise_on_status=False))
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+
+        self._status_cache = {}
+        self._status_locks = collections.defaultdict(threading.Lock)
+        self._status_generation = 0
+        self._lock = threading.Lock()
+
+        self._status_results = {
+            result: metrics.counter(
+                'wizardtracker_device_status_cache_total',
+                'Device status lookups, by how they were answered.',
+                result=result)
+            for result in ('hit', 'not_modified', 'miss')}
+
+    def get(self, path, params=None):
+        return self._session.get(
+            self._base_url + path,
+            params=params,
+            timeout=self._timeout)
+
+    def post(self, path, params=None):
+        try:
+            return self._session.post(
+                self._base_url + path,
+                params=params,
+                timeout=self._timeout)
+        finally:
+            # Anything posted can change the status, so the next read goes
+            # upstream and sees it.
+            self.invalidate_status()
+
+    def devices(self):
+        return self.get('/devices')
+
+    def ports(self, device=None):
+        return self.get('/ports', {'device': device})
+
+    def connect(self, port, device=None):
+        return self.post('/connect', {'port': port, 'device': device})
+
+    def disconnect(self, device=None):
+        return self.post('/disconnect', {'device': device})
+
+    def set_frequency(self, receiver_id, frequency, device=None):
+        return self.post('/set_frequency', {
+            'id': receiver_id,
+            'frequency': frequency,
+            'device': device
+        })
+
+    def set_frequencies(self, frequencies, device=None):
+        return self.post('/set_frequencies', {
+            'frequencies': ','.join(str(f) for f in frequencies),
+            'device': device
+        })
+
+    def status(self, device=None):
+        status = self.get_status(device)
+        if status.status_code != 200:
+            raise requests.HTTPError(
+                'Device status failed with {}.'.format(status.status_code))
+
+        return status.json()
+
+    def get_status(self, device=None):
+        status = self._fresh_status(device)
+        if status:
+            self._status_results['hit'].inc()
+            return status
+
+        # Whoever gets the lock first asks the device service, everyone
+        # queued up behind them gets their answer.
+        with self._status_locks[device]:
+            status = self._fresh_status(device)
+            if status:
+                self._status_results['hit'].inc()
+                return status
+
+            return self._fetch_status(device)
+
+    def invalidate_status(self):
+        with self._lock:
+            self._status_generation = self._status_generation + 1
+            self._status_cache.clear()
+
+    def _fresh_status(self, device):
+        status = self._status_cache.get(device)
+        if status is None:
+            return None
+
+        if time.perf_counter() - status.fetched_at >= self._status_max_age:
+            return None
+
+        return status
+
+    def _fetch_status(self, device):
+        cached = self._status_cache.get(device)
+        generation = self._status_generation
+        fetched_at = time.perf_counter()
+
+        headers = {}
+        if cached is not None:
+            headers['If-None-Match'] = cached.etag
+
+        r = self._session.get(
+            self._base_url + '/status',
+            params={'device': device},
+            headers=headers,
+            timeout=self._timeout)
+
+        if r.status_code == 304:
+            self._status_results['not_modified'].inc()
+            status = cached
+            status.fetched_at = fetched_at
+        else:
+            self._status_results['miss'].inc()
+            status = DeviceStatus(
+                r.status_code,
+                r.content,
+                r.headers.get('ETag'),
+                fetched_at)
+
+        if status.status_code != 200 or not status.etag:
+            return status
+
+        with self._lock:
+            # Don't cache a status that was already stale when it arrived.
+            if generation == self._status_generation:
+                self._status_cache[device] = status
+
+        return status
+
+
+DEVICE_CLIENT = DeviceClient()
@@ -1,4 +1,4 @@
-import configparser
+import collections
 import threading
 import time
 import signal
@@ -6,49 +6,109 @@ import sys
 import logging
 import coloredlogs
 
+from wizardtracker.config import (
+    get_config,
+    get_device_sections,
+    get_pubsub_options
+)
+from wizardtracker.wsgi_api_server import WORKER_COUNT
 from .api.server import DeviceServiceApiServer
 from .tracker.controller import TrackerController
+from .tracker import fake_controller
 from .tracker.fake_controller import FakeTrackerController
 from .rssi_publisher import RssiPublisher
 
 
+RSSI_CHANNEL = 'rssiRaw'
 LOGGER = logging.getLogger(__name__)
 
 
 class Runner:
     def __init__(self, use_fake_device=False):
-        self._config = self._get_config()
-
-        self._rssi_publisher = RssiPublisher(
-            self._config['redis']['host'],
-            self._config['redis'].getint('port'))
-
-        tracker_class = (
-            FakeTrackerController if use_fake_device else TrackerController)
-
-        self._tracker = tracker_class(
-             self._rssi_publisher,
-            baudrate=self._config['device'].getint('baudrate'))
+        self._config = get_config()
+        self._use_fake_device = use_fake_device
+
+        # Every device gets its own publisher and reader thread, so they
+        # don't contend on a shared Redis connection or loop.
+        self._rssi_publishers = []
+        self._trackers = collections.OrderedDict()
+        self._tracker_threads = []
+
+        device_sections = get_device_sections(self._config)
+        for i, (device_id, section) in enumerate(device_sections.items()):
+            # The first device keeps the plain channel name, so everything
+            # downstream works unchanged with a single device.
+            channel = section.get(
+                'channel',
+                RSSI_CHANNEL if i == 0 else '{}.{}'.format(
+                    RSSI_CHANNEL, device_id))
+
+            rssi_publisher = self._create_rssi_publisher(channel)
+            tracker = self._create_tracker(rssi_publisher, section)
+
+            self._rssi_publishers.append(rssi_publisher)
+            self._trackers[device_id] = tracker
+            self._tracker_threads.append(threading.Thread(
+                target=tracker.start,
+                name='tracker-{}'.format(device_id)))
+
+            LOGGER.info('Device %s publishes to %s.', device_id, channel)
 
         self._api_server = DeviceServiceApiServer(
-            self._tracker,
+            self._trackers,
             host=self._config['api']['listen_host'],
-            port=self._config['api'].getint('listen_port'))
-        self._tracker_thread = threading.Thread(target=self._tracker.start)
+            port=self._config['api'].getint('listen_port'),
+            worker_count=self._config['api'].getint(
+                'workers', fallback=WORKER_COUNT))
         self._api_thread = threading.Thread(target=self._api_server.start)
 
-    def _get_config(self):
-        config = configparser.ConfigParser()
-        config.read('./config.ini')
-
-        return config
+    def _create_rssi_publisher(self, channel):
+        return RssiPublisher(
+            self._config['redis']['host'],
+            self._config['redis'].getint('port'),
+            channel=channel,
+            pubsub_options=get_pubsub_options(self._config),
+            batch_size=self._config['rssi_publisher'].getint(
+                'batch_size', fallback=1),
+            batch_interval=self._config['rssi_publisher'].getint(
+                'batch_interval_ms', fallback=0) / 1000)
+
+    def _create_tracker(self, rssi_publisher, section):
+        if self._use_fake_device:
+            fake = self._config['fake_device']
+            return FakeTrackerController(
+                rssi_publisher,
+                baudrate=section.getint('baudrate'),
+                receiver_count=fake.getint(
+                    'receiver_count', fallback=fake_controller.RECEIVER_COUNT),
+                sample_rate=fake.getint(
+                    'sample_rate', fallback=fake_controller.SAMPLE_RATE),
+                lap_time=fake.getfloat(
+                    'lap_time', fallback=fake_controller.LAP_TIME),
+                ground_truth_path=fake.get('ground_truth_path') or None)
+
+        return TrackerController(
+            rssi_publisher,
+            baudrate=section.getint('baudrate'),
+            batch_decode=section.getboolean('batch_decode', fallback=True),
+            min_read_size=section.getint(
+                'min_read_size', fallback=TrackerController.MIN_READ_SIZE),
+            max_read_size=section.getint(
+                'max_read_size', fallback=TrackerController.MAX_READ_SIZE),
+            os_buffer_size=section.getint(
+                'os_buffer_size', fallback=TrackerController.OS_BUFFER_SIZE),
+            capture_directory=section.get('capture_directory') or None)
 
     def _exit_handler(self, signum, frame):
         LOGGER.info('Stopping threads...')
 
-        LOGGER.debug('Waiting for tracker thread...')
-        self._tracker.stop()
-        self._tracker_thread.join()
+        LOGGER.debug('Waiting for tracker threads...')
+        for tracker in self._trackers.values():
+            tracker.stop()
+        for thread in self._tracker_threads:
+            thread.join()
+        for rssi_publisher in self._rssi_publishers:
+            rssi_publisher.close()
 
         LOGGER.debug('Waiting for API server thread...')
         self._api_server.stop()
@@ -65,10 +125,12 @@ class Runner:
 
         logging.getLogger().setLevel(logging.INFO)
 
-        self._rssi_publisher.connect()
+        for rssi_publisher in self._rssi_publishers:
+            rssi_publisher.connect()
 
         LOGGER.info('Starting threads...')
-        self._tracker_thread.start()
+        for thread in self._tracker_threads:
+            thread.start()
         self._api_thread.start()
 
         while True:
@@ -1,12 +1,41 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, request, jsonify
 
+from wizardtracker import metrics
+
+
+LONG_POLL_TIMEOUT = 30
 
 app = Flask(__name__)
 
 
+def _get_tracker():
+    # Without a device we fall back to the first one, which keeps single
+    # device clients working as before.
+    device_id = request.args.get('device')
+    if device_id is None:
+        return next(iter(app.trackers.values()))
+
+    if device_id not in app.trackers:
+        abort(404)
+
+    return app.trackers[device_id]
+
+@app.route('/devices')
+def get_devices():
+    return jsonify({
+        'devices': [
+            {
+                'id': device_id,
+                'connected': tracker.is_connected,
+                'ready': tracker.is_ready
+            } for device_id, tracker in app.trackers.items()],
+        'success': 'true'
+    })
+
+
 @app.route('/ports')
 def get_ports():
-    ports = app.tracker.get_ports()
+    ports = _get_tracker().get_ports()
     json_ports = [
         {
             'port': p.device,
@@ -21,7 +50,7 @@ def get_ports():
 @app.route('/connect', methods=['POST'])
 def connect():
     port = request.args.get('port')
-    success = app.tracker.connect(port)
+    success = _get_tracker().connect(port)
 
     return jsonify({
         'success': success
@@ -29,7 +58,7 @@ def connect():
 
 @app.route('/disconnect', methods=['POST'])
 def disconnect():
-    success = app.tracker.disconnect()
+    success = _get_tracker().disconnect()
 
     return jsonify({
         'success': success
@@ -40,26 +69,43 @@ def set_frequency():
     receiver_id = int(request.args.get('id'))
     frequency = int(request.args.get('frequency'))
 
-    success = app.tracker.set_frequency(receiver_id, frequency)
+    success = _get_tracker().set_frequency(receiver_id, frequency)
+    return jsonify({
+        'success': success
+    })
+
+@app.route('/set_frequencies', methods=['POST'])
+def set_frequencies():
+    # Every receiver at once, e.g. ?frequencies=5658,5695,5732,5769
+    frequencies = [
+        int(frequency)
+        for frequency in request.args.get('frequencies').split(',')]
+
+    success = _get_tracker().set_frequencies(frequencies)
     return jsonify({
         'success': success
     })
 
 @app.route('/status')
 def status():
-    json_status = {
-        'connected': app.tracker.is_connected,
-        'ready': app.tracker.is_ready
-    }
-
-    if app.tracker.is_ready:
-        json_status.update({
-            'receiverCount': app.tracker.receiver_count,
-            'frequencies': app.tracker.frequencies,
-            'voltage': app.tracker.voltage,
-            'temperature': app.tracker.temperature,
-            'hz': app.tracker.hz,
-            'rssi': app.tracker.rssi
-        })
-
-    return jsonify(json_status)
+    # Snapshots come pre-serialised from the tracker's own thread, so this
+    # never touches the tracker itself.
+    status_board = _get_tracker().status_board
+
+    since = request.args.get('since', type=int)
+    if since is None:
+        snapshot = status_board.snapshot
+    else:
+        timeout = min(
+            request.args.get('timeout', LONG_POLL_TIMEOUT, type=float),
+            LONG_POLL_TIMEOUT)
+        snapshot = status_board.wait(since, timeout)
+
+    response = Response(snapshot.body, content_type='application/json')
+    response.set_etag(snapshot.etag)
+
+    return response.make_conditional(request)
+
+@app.route('/metrics')
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -1,13 +1,14 @@
-from wizardtracker.wsgi_api_server import ApiServer
+from wizardtracker.wsgi_api_server import WORKER_COUNT, ApiServer
 from .app import app
 
 
 class DeviceServiceApiServer(ApiServer):
-    def __init__(self, tracker, host, port):
+    def __init__(self, trackers, host, port, worker_count=WORKER_COUNT):
         super().__init__(
             app,
             host,
             port,
             {
-                'tracker': tracker
-            })
+                'trackers': trackers
+            },
+            worker_count)
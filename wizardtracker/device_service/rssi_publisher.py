@@ -1,12 +1,76 @@
+import time
+
+from wizardtracker import metrics
 from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
 
 
 class RssiPublisher:
-    def __init__(self, redis_host, redis_port):
-        self._redis = NiceRedisPubsub(redis_host, redis_port)
+    def __init__(
+            self,
+            redis_host,
+            redis_port,
+            channel='rssiRaw',
+            pubsub_options=None,
+            batch_size=1,
+            batch_interval=0):
+        self._redis = NiceRedisPubsub(
+            redis_host,
+            redis_port,
+            **(pubsub_options or {}))
+        self._channel = channel
+
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._batch = []
+        self._batch_time = None
+
+        self._parse_to_publish = metrics.stage_seconds('parse_to_publish')
+        self._published_age = metrics.sample_age_seconds('published')
+        self._published_samples = metrics.samples_total('published')
 
     def connect(self):
         self._redis.connect()
 
+    def close(self):
+        self._redis.close()
+
     def publish(self, rssi_data):
-        self._redis.publish('rssiRaw', rssi_data)
+        if self._batch_size <= 1:
+            start = time.perf_counter()
+            self._redis.publish(self._channel, rssi_data)
+            self._record_published(start, [rssi_data])
+            return
+
+        if not self._batch:
+            self._batch_time = time.perf_counter()
+        self._batch.append(rssi_data)
+
+        if len(self._batch) >= self._batch_size:
+            self.flush()
+        else:
+            self.tick()
+
+    def tick(self):
+        if not self._batch:
+            return
+
+        if time.perf_counter() - self._batch_time >= self._batch_interval:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+
+        self._redis.publish_batch(self._channel, self._batch)
+        self._record_published(self._batch_time, self._batch)
+        self._batch = []
+
+    def _record_published(self, start, samples):
+        # Once per message, and only the oldest sample's age, to keep this
+        # cheap at high sample rates.
+        now = time.perf_counter()
+        self._parse_to_publish.observe(now - start)
+        self._published_samples.inc(len(samples))
+
+        if 'timestamp' in samples[0]:
+            self._published_age.observe(now - samples[0]['timestamp'])
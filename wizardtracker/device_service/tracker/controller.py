@@ -1,18 +1,36 @@
+import array
 import enum
+import itertools
 import logging
+import os
+import queue
 import threading
 import serial
 import serial.tools.list_ports
 import time
 
 from wizardtracker.device_service.utils.cycletimer import CycleTimer
-
-
+from wizardtracker import metrics
+from wizardtracker.device_service.utils.read_stats import ReadStats
+from wizardtracker.sample_sequence import SEQUENCE_MODULUS
+from .status import STATUS_INTERVAL, StatusBoard, build_status
+from .serial_capture import (
+    ReplayFinished,
+    ReplaySerial,
+    SerialCaptureWriter,
+    capture_filename
+)
+
+
+LINE_BUFFER_SIZE = 65536
+READ_TIMEOUT = 0.05
+IDLE_TIMEOUT = 0.5
+CONTROL_TIMEOUT = 5
 LOGGER = logging.getLogger(__name__)
 
 
 def _decode_serial_command(line):
-    line = line.decode('ascii').strip()
+    line = str(line, 'ascii').strip()
     tokens = line.split(' ')
     command = tokens[0]
     args = tuple(tokens[1:])
@@ -29,24 +47,110 @@ def _encode_serial_command(command, *args):
 
     return command_string.encode('ascii')
 
-class NonBlockingLineReader:
-    def __init__(self):
-        self._buffer = bytearray()
+def _decode_rssi_lines(lines, receiver_count):
+    # Checked line by line, a short line and a long one would add up to
+    # the right total and put every reading after them on the wrong
+    # receiver.
+    fields = [line.split() for line in lines]
+    if any(len(f) != receiver_count for f in fields):
+        raise ValueError('Unexpected RSSI reading count.')
+
+    try:
+        return array.array(
+            'H', map(int, itertools.chain.from_iterable(fields)))
+    except OverflowError:
+        # Negative, or two readings run together by a lost '\nr '.
+        raise ValueError('RSSI reading out of range.')
+
+def _interpolate_timestamps(start_ns, end_ns, count):
+    # Lines from one read arrived at some point between the previous read and
+    # this one, so spread them evenly over that window.
+    if start_ns is None:
+        start_ns = end_ns
+
+    span = end_ns - start_ns
+    return [
+        (start_ns + span * (i + 1) // count) / 1e9 for i in range(count)]
+
+class LineRingBuffer:
+    # Lines are handed out as memoryview slices into the buffer, so they're
+    # only valid until the next readinto()/append_data() call.
+
+    def __init__(self, size=LINE_BUFFER_SIZE):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._read_index = 0
+        self._write_index = 0
+
+        # Whatever the last readinto() put in the buffer.
+        self.last_read = self._view[:0]
+
+        self.overflow_count = 0
+
+    def readinto(self, source, size):
+        free = self._make_room(size)
+        start = self._write_index
+        target = self._view[start:start + min(size, free)]
+        count = source.readinto(target) or 0
+        self._write_index = start + count
+        self.last_read = target[:count]
+
+        return count
 
     def append_data(self, data):
         if not data:
             return
 
-        self._buffer.extend(data)
+        free = self._make_room(len(data))
+        start = self._write_index
+        size = min(len(data), free)
+        self._view[start:start + size] = data[:size]
+        self._write_index = start + size
 
     def read_line(self):
-        end_index = self._buffer.find(b'\n')
-        if end_index >= 0:
-            found_line = bytes(self._buffer[:end_index + 1])
-            del self._buffer[0:end_index + 1]
-            return found_line
+        end_index = self._buffer.find(
+            b'\n', self._read_index, self._write_index)
+        if end_index < 0:
+            return None
+
+        return self._consume(end_index + 1)
+
+    def read_lines(self):
+        end_index = self._buffer.rfind(
+            b'\n', self._read_index, self._write_index)
+        if end_index < 0:
+            return None
+
+        return self._consume(end_index + 1)
+
+    def _consume(self, end_index):
+        found = self._view[self._read_index:end_index]
+
+        self._read_index = end_index
+        if self._read_index == self._write_index:
+            self._read_index = 0
+            self._write_index = 0
 
-        return None
+        return found
+
+    def _make_room(self, size):
+        free = len(self._buffer) - self._write_index
+        if free >= size or (self._read_index == 0 and free > 0):
+            return free
+
+        # Only the unterminated tail is left unread by now, so this is a
+        # short move rather than a shift of the whole buffer.
+        pending = self._write_index - self._read_index
+        self._view[:pending] = self._view[self._read_index:self._write_index]
+        self._read_index = 0
+        self._write_index = pending
+
+        if pending == len(self._buffer):
+            LOGGER.warning('Line buffer overflowed. Dropping data...')
+            self.overflow_count = self.overflow_count + 1
+            self._write_index = 0
+
+        return len(self._buffer) - self._write_index
 
 @enum.unique
 class _TrackerState(enum.Enum):
@@ -55,10 +159,35 @@ class _TrackerState(enum.Enum):
     WAITING_FOR_STATUS = 3
     READY = 4
 
-class TrackerController:
-    CHUNK_SIZE = 128
+class _ControlCommand:
+    def __init__(self, function, args):
+        self._function = function
+        self._args = args
+
+        self.result = False
+        self.done = threading.Event()
 
-    def __init__(self, rssi_publisher, baudrate=250000):
+    def run(self):
+        try:
+            self.result = self._function(*self._args)
+        except Exception:
+            LOGGER.exception('Control command failed.')
+
+class TrackerController:
+    MIN_READ_SIZE = 1
+    MAX_READ_SIZE = 4096
+    # Linux's tty layer holds 4095 bytes before it starts dropping data.
+    OS_BUFFER_SIZE = 4095
+
+    def __init__(
+            self,
+            rssi_publisher,
+            baudrate=250000,
+            batch_decode=True,
+            min_read_size=MIN_READ_SIZE,
+            max_read_size=MAX_READ_SIZE,
+            os_buffer_size=OS_BUFFER_SIZE,
+            capture_directory=None):
         self.receiver_count = None
         self.raw_mode = None
         self.frequencies = None
@@ -67,19 +196,47 @@ class TrackerController:
         self.rssi = None
 
         self._should_stop = False
-        self._control_lock = threading.RLock()
+        self._control_queue = queue.Queue()
 
         self._state = _TrackerState(_TrackerState.DISCONNECTED)
 
         self._rssi_publisher = rssi_publisher
 
-        self._serial = serial.Serial()
-        self._serial.baudrate = baudrate
-        self._serial.timeout = 0
-        self._line_reader = NonBlockingLineReader()
+        self._device_serial = serial.Serial()
+        self._device_serial.baudrate = baudrate
+        self._device_serial.timeout = READ_TIMEOUT
+        # Either the device, or a ReplaySerial while replaying a capture.
+        self._serial = self._device_serial
+        self._line_buffer = LineRingBuffer()
+        self._batch_decode = batch_decode
+
+        self._min_read_size = min_read_size
+        self._max_read_size = max_read_size
+        self._os_buffer_size = os_buffer_size
+        self._read_stats = ReadStats()
+
+        self._capture_directory = capture_directory
+        self._capture = None
+
+        # Carries on across reconnects, so consumers only see gaps for
+        # samples that really went missing.
+        self._sequence = 0
+        self._read_ns = None
+        self._last_read_ns = None
+        self._rssi_timestamps = iter(())
 
         self._read_hz_timer = CycleTimer()
 
+        self.status_board = StatusBoard()
+        self._status_time = 0
+        self._status_state = None
+
+        self._serial_bytes = metrics.counter(
+            'wizardtracker_serial_bytes_total',
+            'Bytes read from tracker devices.')
+        self._read_to_parse = metrics.stage_seconds('read_to_parse')
+        self._parsed_samples = metrics.samples_total('parsed')
+
     def start(self):
         LOGGER.info('Starting up...')
         self._loop()
@@ -87,6 +244,7 @@ class TrackerController:
         LOGGER.info('Shutting down...')
         if self._serial.is_open:
             self._serial.close()
+        self._stop_capture()
 
     def stop(self):
         self._should_stop = True
@@ -97,86 +255,300 @@ class TrackerController:
         if not port in port_devices:
             return False
 
-        with self._control_lock:
-            if self._serial.is_open:
-                return False
+        return self._run_control_command(self._connect, port)
 
-            try:
-                self._serial.port = port
-                self._serial.open()
-                self._read_hz_timer.reset()
-            except serial.SerialException as err:
-                LOGGER.error('Failed to connect device (%s): (%s).', port, err)
-                return False
+    def disconnect(self):
+        return self._run_control_command(self._disconnect)
 
-            LOGGER.info('Connected to device (%s).', port)
+    def replay(self, path, speed=1):
+        # Feeds a capture through the same parsing and publishing as a real
+        # device. A speed of 0 replays as fast as we can parse it.
+        return self._run_control_command(self._replay, path, speed)
 
-            self._state = _TrackerState.WAITING_FOR_FIRST_DATA
-            LOGGER.info('Awaiting first data from device...')
+    def set_frequency(self, receiver_id, frequency):
+        return self._run_control_command(
+            self._set_frequency, receiver_id, frequency)
 
-            return True
+    def set_frequencies(self, frequencies):
+        return self._run_control_command(
+            self._set_frequencies, list(frequencies))
 
-    def disconnect(self):
-        with self._control_lock:
-            if not self._serial.is_open:
-                return True
+    def get_ports(self):
+        ports = serial.tools.list_ports.comports()
+        return ports
 
-            self._serial.close()
-            self._state = _TrackerState(_TrackerState.DISCONNECTED)
+    def _connect(self, port):
+        if self._serial.is_open:
+            return False
+
+        self._serial = self._device_serial
+        try:
+            self._serial.port = port
+            self._serial.open()
+            self._read_hz_timer.reset()
+            self._read_stats.reset()
+            self._last_read_ns = None
+        except serial.SerialException as err:
+            LOGGER.error('Failed to connect device (%s): (%s).', port, err)
+            return False
 
-            LOGGER.info('Disconnected from device.')
+        LOGGER.info('Connected to device (%s).', port)
+
+        if self._capture_directory:
+            self._start_capture(port)
+
+        self._state = _TrackerState.WAITING_FOR_FIRST_DATA
+        LOGGER.info('Awaiting first data from device...')
+
+        return True
+
+    def _replay(self, path, speed):
+        if self._serial.is_open:
+            return False
+
+        try:
+            self._serial = ReplaySerial(path, speed)
+            self._serial.open()
+            self._read_hz_timer.reset()
+            self._read_stats.reset()
+            self._last_read_ns = None
+        except (OSError, ValueError) as err:
+            LOGGER.error('Failed to open capture (%s): (%s).', path, err)
+            self._serial = self._device_serial
+            return False
+
+        LOGGER.info('Replaying capture (%s) at %sx.', path, speed or 'max')
+
+        self._state = _TrackerState.WAITING_FOR_FIRST_DATA
+        return True
+
+    def _disconnect(self):
+        if not self._serial.is_open:
             return True
 
-    def set_frequency(self, receiver_id, frequency):
-        with self._control_lock:
-            if not self.is_ready:
-                return False
+        self._serial.close()
+        self._stop_capture()
+        self._state = _TrackerState(_TrackerState.DISCONNECTED)
+        self._rssi_publisher.flush()
+
+        LOGGER.info('Disconnected from device.')
+        return True
+
+    def _set_frequency(self, receiver_id, frequency):
+        if not self.is_ready:
+            return False
 
-            self._write_serial_command('f', receiver_id, frequency)
+        self._write_serial_command('f', receiver_id, frequency)
+        self.frequencies[receiver_id] = frequency
+
+        return True
+
+    def _set_frequencies(self, frequencies):
+        if not self.is_ready or len(frequencies) != self.receiver_count:
+            return False
+
+        # The firmware has no bulk command, but every 'f' goes out in one
+        # write and one flush. Receivers already on the right frequency are
+        # left alone.
+        changed = [
+            (receiver_id, frequency)
+            for receiver_id, frequency in enumerate(frequencies)
+            if frequency != self.frequencies[receiver_id]]
+
+        self._write_serial_commands(
+            ('f', receiver_id, frequency)
+            for receiver_id, frequency in changed)
+        for receiver_id, frequency in changed:
             self.frequencies[receiver_id] = frequency
 
-            return True
+        return True
 
-    def get_ports(self):
-        ports = serial.tools.list_ports.comports()
-        return ports
+    def _run_control_command(self, function, *args):
+        # Serial access only ever happens on the reader thread, so hand the
+        # command over and wait for it to be picked up between reads.
+        command = _ControlCommand(function, args)
+        self._control_queue.put(command)
+
+        if not command.done.wait(CONTROL_TIMEOUT):
+            LOGGER.error('Timed out waiting for control command.')
+            return False
+
+        return command.result
 
     def _loop(self):
         while not self._should_stop:
-            with self._control_lock:
-                self._parse_serial()
+            self._run_control_commands()
+            self._parse_serial()
+            self._rssi_publisher.tick()
+            self._update_status()
+
+        self._rssi_publisher.flush()
+
+    def _run_control_commands(self):
+        # There's nothing to read while disconnected, so sleep until there's
+        # a command to run instead of spinning.
+        block = not self._serial.is_open
+
+        while True:
+            try:
+                command = self._control_queue.get(block, IDLE_TIMEOUT)
+            except queue.Empty:
+                return
+
+            command.run()
+            # Publish before the caller hears back, so whatever they read
+            # next already reflects the command.
+            self._publish_status()
+            command.done.set()
+            block = False
 
     def _parse_serial(self):
         if self._serial.is_open:
             try:
-                incoming_bytes = self._serial.read(
-                    size=TrackerController.CHUNK_SIZE)
-                self._line_reader.append_data(incoming_bytes)
-
-                while True:
-                    line = self._line_reader.read_line()
-                    if not line:
-                        break
-                    self._parse_line(line)
-                    self._tick_read_hz_timer()
-            except serial.SerialException:
-                LOGGER.error('Serial connection lost.')
+                # Size the read to whatever the OS has buffered. This blocks
+                # for up to READ_TIMEOUT when there's nothing waiting.
+                waiting = self._serial.in_waiting
+                if waiting >= self._os_buffer_size:
+                    LOGGER.warning('Serial buffer full, data may be lost.')
+                    self._read_stats.record_overflow()
+
+                read_size = min(
+                    max(waiting, self._min_read_size),
+                    self._max_read_size)
+                count = self._line_buffer.readinto(self._serial, read_size)
+                self._read_ns = time.perf_counter_ns()
+                self._read_stats.record_read(count, waiting)
+
+                if self._capture and count:
+                    self._capture.write(
+                        self._read_ns / 1e9, self._line_buffer.last_read)
+
+                self._parse_buffered_lines()
+                self._last_read_ns = self._read_ns
+
+                if count:
+                    self._serial_bytes.inc(count)
+                    self._read_to_parse.observe(
+                        (time.perf_counter_ns() - self._read_ns) / 1e9)
+            except (serial.SerialException, OSError) as err:
+                # in_waiting is a bare ioctl, so a device that's gone away
+                # gives us EIO as a plain OSError rather than pyserial's.
+                if isinstance(err, ReplayFinished):
+                    LOGGER.info('Replay finished.')
+                else:
+                    LOGGER.error('Serial connection lost.')
                 self._serial.close()
+                self._stop_capture()
                 self._state = _TrackerState(_TrackerState.DISCONNECTED)
+                self._rssi_publisher.flush()
+
+    def _start_capture(self, port):
+        path = os.path.join(self._capture_directory, capture_filename(port))
+        try:
+            os.makedirs(self._capture_directory, exist_ok=True)
+            self._capture = SerialCaptureWriter(path)
+        except OSError as err:
+            LOGGER.error('Failed to start capture (%s): (%s).', path, err)
+            return
+
+        LOGGER.info('Capturing serial data to %s.', path)
+
+    def _stop_capture(self):
+        if not self._capture:
+            return
+
+        self._capture.close()
+        LOGGER.info(
+            'Captured %d bytes to %s.',
+            self._capture.byte_count,
+            self._capture.path)
+        self._capture = None
+
+    def _parse_buffered_lines(self):
+        if self._batch_decode and self.is_ready:
+            chunk = self._line_buffer.read_lines()
+            if chunk:
+                self._parse_chunk(bytes(chunk))
+            return
+
+        lines = []
+        while True:
+            line = self._line_buffer.read_line()
+            if not line:
+                break
+            lines.append(line)
+
+        self._parse_lines(lines)
+
+    def _parse_lines(self, lines):
+        rssi_count = sum(1 for l in lines if l[:2] == b'r ')
+        self._rssi_timestamps = iter(self._read_timestamps(rssi_count))
+
+        for line in lines:
+            self._parse_line(line)
+            self._tick_read_hz_timer()
+
+    def _parse_chunk(self, chunk):
+        lines = chunk.split(b'\n')
+        rssi_lines = [l[2:] for l in lines if l.startswith(b'r ')]
+
+        try:
+            readings = _decode_rssi_lines(rssi_lines, self.receiver_count)
+        except ValueError:
+            # Something in here is malformed, let the slow path sort it out.
+            self._parse_lines([l + b'\n' for l in lines if l])
+            return
+
+        # Only the occasional status line needs the slow path.
+        for line in lines:
+            if line and not line.startswith(b'r '):
+                self._parse_line(line + b'\n')
+
+        if readings:
+            timestamps = self._read_timestamps(len(rssi_lines))
+            self._publish_rssi_readings(readings, timestamps)
+            self._tick_read_hz_timer(len(rssi_lines))
+
+    def _publish_rssi_readings(self, readings, timestamps):
+        count = self.receiver_count
+
+        for timestamp, i in zip(timestamps, range(0, len(readings), count)):
+            self._rssi_publisher.publish({
+                'timestamp': timestamp,
+                'sequence': self._next_sequence(),
+                'rssi': readings[i:i + count].tolist()
+            })
+
+        self._parsed_samples.inc(len(timestamps))
+        self.rssi = tuple(readings[-count:])
+        LOGGER.debug('RSSI: %s', self.rssi)
 
     def _parse_line(self, line):
         try:
             command, args = _decode_serial_command(line)
         except UnicodeDecodeError:
             LOGGER.warning("Invalid data received. Skipping...")
+            self._skip_line(line)
             return
 
-        if self._state == _TrackerState.WAITING_FOR_FIRST_DATA:
-            self._parse_serial_waiting_for_first_data()
-        elif self._state == _TrackerState.WAITING_FOR_STATUS:
-            self._parse_serial_waiting_for_status(command, args)
-        elif self._state == _TrackerState.READY:
-            self._parse_serial_ready(command, args)
+        try:
+            if self._state == _TrackerState.WAITING_FOR_FIRST_DATA:
+                self._parse_serial_waiting_for_first_data()
+            elif self._state == _TrackerState.WAITING_FOR_STATUS:
+                self._parse_serial_waiting_for_status(command, args)
+            elif self._state == _TrackerState.READY:
+                self._parse_serial_ready(command, args)
+        except (ValueError, IndexError):
+            # Usually a line that lost some bytes when the OS buffer filled.
+            LOGGER.warning('Malformed line received. Skipping...')
+            self._skip_line(line)
+
+    def _skip_line(self, line):
+        if self.is_ready and line[:2] == b'r ':
+            # Still a sample the device sent us, so leave a gap in the
+            # sequence where it would have been.
+            next(self._rssi_timestamps, None)
+            self._next_sequence()
 
     def _parse_serial_waiting_for_first_data(self):
         LOGGER.info('First data received.')
@@ -206,14 +578,19 @@ class TrackerController:
 
     def _parse_serial_ready(self, command, args):
         if command == 'r':
-            timestamp = time.clock()
             readings = [int(r) for r in args]
+            if len(readings) != self.receiver_count:
+                raise ValueError('Unexpected RSSI reading count.')
+
+            timestamp = next(self._rssi_timestamps, self._read_ns / 1e9)
             queue_data = {
                 'timestamp': timestamp,
+                'sequence': self._next_sequence(),
                 'rssi': readings
             }
 
             self._rssi_publisher.publish(queue_data)
+            self._parsed_samples.inc()
             self.rssi = tuple(readings)
             LOGGER.debug('RSSI: %s', readings)
         elif command == 'v':
@@ -224,14 +601,39 @@ class TrackerController:
             LOGGER.debug('Temperature: %sC', self.temperature)
 
     def _write_serial_command(self, command, *args):
-        encoded_command = _encode_serial_command(
-            command, *args)
+        self._write_serial_commands([(command,) + args])
+
+    def _write_serial_commands(self, commands):
+        encoded_commands = b''.join(
+            _encode_serial_command(*command) for command in commands)
+        if not encoded_commands:
+            return
 
-        self._serial.write(encoded_command)
+        self._serial.write(encoded_commands)
         self._serial.flush()
 
-    def _tick_read_hz_timer(self):
-        self._read_hz_timer.tick()
+    def _update_status(self):
+        if self._state != self._status_state or \
+                time.perf_counter() - self._status_time >= STATUS_INTERVAL:
+            self._publish_status()
+
+    def _publish_status(self):
+        self.status_board.publish(build_status(self))
+        self._status_time = time.perf_counter()
+        self._status_state = self._state
+
+    def _read_timestamps(self, count):
+        return _interpolate_timestamps(
+            self._last_read_ns, self._read_ns, count)
+
+    def _next_sequence(self):
+        sequence = self._sequence
+        self._sequence = (sequence + 1) % SEQUENCE_MODULUS
+
+        return sequence
+
+    def _tick_read_hz_timer(self, cycles=1):
+        self._read_hz_timer.tick(cycles)
         if self._read_hz_timer.time_since_reset >= 15:
             hz = self._read_hz_timer.hz
             LOGGER.debug('RSSI Rate: %dHz (%.3fs accuracy)', hz, 1 / hz)
@@ -248,3 +650,10 @@ class TrackerController:
     @property
     def hz(self):
         return self._read_hz_timer.hz
+
+    @property
+    def read_stats(self):
+        stats = self._read_stats.as_dict()
+        stats['lineBufferOverflows'] = self._line_buffer.overflow_count
+
+        return stats
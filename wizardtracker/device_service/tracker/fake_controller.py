@@ -1,13 +1,22 @@
 import enum
+import json
 import logging
-import math
 import random
 import threading
 import time
 
 from wizardtracker.device_service.utils.cycletimer import CycleTimer
+from wizardtracker.device_service.utils.read_stats import ReadStats
+from wizardtracker.sample_sequence import SEQUENCE_MODULUS
+from .load_generator import FREQUENCIES, RssiGenerator
+from .status import STATUS_INTERVAL, StatusBoard, build_status
 
 
+RECEIVER_COUNT = 6
+SAMPLE_RATE = 100
+LAP_TIME = 6
+TICK_INTERVAL = 0.01
+IDLE_INTERVAL = 0.5
 LOGGER = logging.getLogger(__name__)
 
 
@@ -24,7 +33,14 @@ class FakeComPort:
 
 
 class FakeTrackerController:
-    def __init__(self, rssi_publisher, baudrate):
+    def __init__(
+            self,
+            rssi_publisher,
+            baudrate,
+            receiver_count=RECEIVER_COUNT,
+            sample_rate=SAMPLE_RATE,
+            lap_time=LAP_TIME,
+            ground_truth_path=None):
         self.receiver_count = None
         self.raw_mode = None
         self.frequencies = None
@@ -37,11 +53,20 @@ class FakeTrackerController:
         self._rssi_publisher = rssi_publisher
         self._state = _TrackerState(_TrackerState.DISCONNECTED)
         self._read_hz_timer = CycleTimer()
+        self._read_stats = ReadStats()
         self._control_lock = threading.RLock()
 
-        self._gen_theta = 0
-        self._gen_max = []
-        self._gen_baseline = []
+        self._receiver_count = receiver_count
+        self._sample_rate = sample_rate
+        self._lap_time = lap_time
+        self._ground_truth_path = ground_truth_path
+        self._ground_truth_file = None
+
+        self._generator = None
+        self._gen_start = None
+
+        self.status_board = StatusBoard()
+        self._status_time = 0
 
     def start(self):
         LOGGER.info('Starting up...')
@@ -55,23 +80,27 @@ class FakeTrackerController:
         with self._control_lock:
             self._state = _TrackerState.READY
 
-            self.receiver_count = 6
+            self.receiver_count = self._receiver_count
             self.raw_mode = False
             self.frequencies = [
-                5658,
-                5695,
-                5880,
-                5917,
-                5760,
-                5800]
+                FREQUENCIES[i % len(FREQUENCIES)]
+                for i in range(self.receiver_count)]
             self.voltage = 11.4
             self.temperature = 20.0
             self.rssi = [0] * self.receiver_count
 
-            self._gen_max = \
-                [random.randint(170, 255) for i in range(self.receiver_count)]
-            self._gen_baseline = \
-                [random.randint(0, 50) for i in range(self.receiver_count)]
+            self._generator = RssiGenerator(
+                self.receiver_count,
+                self._sample_rate,
+                lap_time=self._lap_time,
+                start_time=time.perf_counter_ns() / 1e9)
+            self._gen_start = time.perf_counter()
+
+            if self._ground_truth_path:
+                self._ground_truth_file = open(
+                    self._ground_truth_path, 'a', buffering=1)
+
+            self._publish_status()
 
             LOGGER.info('Connected to fake device.')
             return True
@@ -79,7 +108,13 @@ class FakeTrackerController:
     def disconnect(self):
         with self._control_lock:
             self._state = _TrackerState(_TrackerState.DISCONNECTED)
+            self._rssi_publisher.flush()
+
+            if self._ground_truth_file:
+                self._ground_truth_file.close()
+                self._ground_truth_file = None
 
+            self._publish_status()
             LOGGER.info('Disconnected from fake device.')
             return True
 
@@ -89,6 +124,20 @@ class FakeTrackerController:
                 return False
 
             self.frequencies[receiver_id] = frequency
+            self._publish_status()
+
+            return True
+
+    def set_frequencies(self, frequencies):
+        frequencies = list(frequencies)
+
+        with self._control_lock:
+            if not self.is_ready or \
+                    len(frequencies) != len(self.frequencies):
+                return False
+
+            self.frequencies = frequencies
+            self._publish_status()
 
             return True
 
@@ -101,42 +150,64 @@ class FakeTrackerController:
                 if self.is_ready:
                     self._generate_fake_rssi()
                     self._generate_fake_status()
-                    self._tick_read_hz_timer()
-
-    def _generate_fake_rssi(self):
-        for i, r in enumerate(self.rssi):
-            c = (i / self.receiver_count)
-            t = self._gen_theta - (math.pi * c)
-            v = math.sin(t)
-            d = 0.75
 
-            self.rssi[i] = \
-                (((v - d) * (1 / (1 - d))) if v > d else 0) \
-                + (math.sin(t / 3 + c) / 6) \
-                + (math.cos(t * 3 + c) / 5) \
-                + (math.sin(t * 7.5 + c) / 8)
-            self.rssi[i] = \
-                self.rssi[i] * self._gen_max[i] + self._gen_baseline[i]
+                if time.perf_counter() - self._status_time >= STATUS_INTERVAL:
+                    self._publish_status()
 
+            self._rssi_publisher.tick()
 
-        self.rssi = [r + random.randint(-50, 50) for r in self.rssi]
-        self.rssi = [r * (1 + random.random() * 0.1) for r in self.rssi]
-        self.rssi = [max(0, min(255, r)) for r in self.rssi]
+            # Sleep outside the lock so API calls don't queue up behind us.
+            time.sleep(TICK_INTERVAL if self.is_ready else IDLE_INTERVAL)
 
-        self._rssi_publisher.publish({
-            'timestamp': time.clock(),
-            'rssi': self.rssi
-        })
+        self._rssi_publisher.flush()
 
-        time.sleep(0.01)
-        self._gen_theta = self._gen_theta + 0.01
+    def _generate_fake_rssi(self):
+        # Catch up on however many samples are due since the last tick, so
+        # the rate holds no matter how long the tick took.
+        elapsed = time.perf_counter() - self._gen_start
+        due = int(elapsed * self._sample_rate) - self._generator.sample_count
+        if due > self._sample_rate:
+            LOGGER.warning('Falling behind, skipping %d samples.', due)
+            self._generator.generate(due)
+            return
+        if due <= 0:
+            return
+
+        # Sequence numbers follow the sample count, so skipped samples show
+        # up as a gap.
+        first_sequence = self._generator.sample_count
+        timestamps, values = self._generator.generate(due)
+        for i, (timestamp, rssi) in enumerate(
+                zip(timestamps.tolist(), values.tolist())):
+            self._rssi_publisher.publish({
+                'timestamp': timestamp,
+                'sequence': (first_sequence + i) % SEQUENCE_MODULUS,
+                'rssi': rssi
+            })
+
+        self.rssi = rssi
+        self._tick_read_hz_timer(due)
+        self._record_passes()
+
+    def _record_passes(self):
+        for timestamp, receiver in self._generator.pop_passes():
+            LOGGER.debug('Pass: receiver %d at %.3f', receiver, timestamp)
+            if self._ground_truth_file:
+                self._ground_truth_file.write(json.dumps({
+                    'timestamp': timestamp,
+                    'receiver': receiver
+                }) + '\n')
 
     def _generate_fake_status(self):
         self.voltage = round(11.4 + random.uniform(-0.2, 0.2), 2)
         self.temperature = round(20.0 + random.uniform(-0.2, 0.2))
 
-    def _tick_read_hz_timer(self):
-        self._read_hz_timer.tick()
+    def _publish_status(self):
+        self.status_board.publish(build_status(self))
+        self._status_time = time.perf_counter()
+
+    def _tick_read_hz_timer(self, cycles=1):
+        self._read_hz_timer.tick(cycles)
         if self._read_hz_timer.time_since_reset >= 15:
             hz = self._read_hz_timer.hz
             LOGGER.debug('RSSI Rate: %dHz (%.3fs accuracy)', hz, 1 / hz)
@@ -153,3 +224,7 @@ class FakeTrackerController:
     @property
     def hz(self):
         return self._read_hz_timer.hz
+
+    @property
+    def read_stats(self):
+        return self._read_stats.as_dict()
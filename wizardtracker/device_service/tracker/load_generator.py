@@ -0,0 +1,202 @@
+import os
+import pty
+import threading
+import time
+import tty
+
+import numpy as np
+
+
+FREQUENCIES = (5658, 5695, 5880, 5917, 5760, 5800)
+
+RSSI_MIN = 0
+RSSI_MAX = 255
+BASELINE_RANGE = (0, 50)
+PEAK_RANGE = (170, 255)
+NOISE = 12
+
+# How long a pass stands out from the noise (standard deviation, seconds),
+# and how much lap times wander from the scripted one.
+PASS_WIDTH = 0.25
+LAP_JITTER = 0.1
+
+PTY_TICK_INTERVAL = 0.005
+PTY_STATUS_INTERVAL = 1
+PTY_READ_SIZE = 1024
+
+_RSSI_STRINGS = [str(i).encode('ascii') for i in range(RSSI_MAX + 1)]
+
+
+class RssiGenerator:
+    # Makes RSSI in blocks of samples, one numpy op per block rather than
+    # per value. With a lap time set, every receiver sees a pilot pass once
+    # a lap (staggered across receivers), and the pass times are kept as
+    # ground truth for checking the timing against.
+
+    def __init__(
+            self,
+            receiver_count,
+            sample_rate,
+            lap_time=None,
+            start_time=0,
+            seed=None):
+        self.receiver_count = receiver_count
+        self.sample_rate = sample_rate
+        self._lap_time = lap_time
+        self._start_time = start_time
+        self.sample_count = 0
+
+        self._random = np.random.RandomState(seed)
+        self._baseline = self._random.randint(
+            *BASELINE_RANGE, size=receiver_count)
+        self._peak = self._random.randint(*PEAK_RANGE, size=receiver_count)
+
+        # Receiver -> pass times that might still show up in a block.
+        self._passes = [[] for _ in range(receiver_count)]
+        self._new_passes = []
+        if lap_time:
+            for i in range(receiver_count):
+                self._add_pass(i, start_time + lap_time * (i + 1) /
+                               receiver_count)
+
+    def generate(self, count):
+        indexes = np.arange(self.sample_count, self.sample_count + count)
+        timestamps = self._start_time + indexes / self.sample_rate
+        self.sample_count = self.sample_count + count
+
+        values = self._random.normal(
+            self._baseline, NOISE, (count, self.receiver_count))
+
+        if self._lap_time and count:
+            self._add_passes(timestamps, values)
+
+        values = np.clip(np.rint(values), RSSI_MIN, RSSI_MAX)
+
+        return timestamps, values.astype(np.uint16)
+
+    def pop_passes(self):
+        # (timestamp, receiver) for every pass scheduled since the last call,
+        # in the same clock as the samples.
+        passes = sorted(self._new_passes)
+        self._new_passes = []
+
+        return passes
+
+    def _add_passes(self, timestamps, values):
+        margin = PASS_WIDTH * 4
+        first = timestamps[0]
+        last = timestamps[-1]
+
+        for i, passes in enumerate(self._passes):
+            while passes[-1] < last + margin:
+                jitter = self._random.uniform(-LAP_JITTER, LAP_JITTER)
+                self._add_pass(i, passes[-1] + self._lap_time * (1 + jitter))
+
+            height = self._peak[i] - self._baseline[i]
+            for pass_time in passes:
+                if first - margin <= pass_time <= last + margin:
+                    offsets = (timestamps - pass_time) / PASS_WIDTH
+                    values[:, i] += height * np.exp(-0.5 * offsets ** 2)
+
+            self._passes[i] = [p for p in passes if p >= first - margin]
+
+    def _add_pass(self, receiver, pass_time):
+        self._passes[receiver].append(pass_time)
+        self._new_passes.append((pass_time, receiver))
+
+
+def format_rssi_lines(values):
+    return b''.join(
+        b'r ' + b' '.join([_RSSI_STRINGS[v] for v in row]) + b'\n'
+        for row in values.tolist())
+
+
+class PtyTrackerDevice:
+    # Speaks the tracker's serial protocol on a pseudo terminal, so the real
+    # TrackerController can be pointed at .port and load tested. Writes never
+    # block: whatever doesn't fit is dropped and counted, like a serial port
+    # nobody is reading fast enough.
+
+    def __init__(self, receiver_count, sample_rate, lap_time=None):
+        self.frequencies = [
+            FREQUENCIES[i % len(FREQUENCIES)] for i in range(receiver_count)]
+        self.sent_samples = 0
+        self.dropped_bytes = 0
+
+        self._generator = RssiGenerator(
+            receiver_count,
+            sample_rate,
+            lap_time=lap_time,
+            start_time=time.perf_counter())
+        self._should_stop = False
+
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._should_stop = True
+        self._thread.join()
+
+        os.close(self._master)
+        os.close(self._slave)
+
+    def pop_passes(self):
+        return self._generator.pop_passes()
+
+    def _loop(self):
+        start_time = time.perf_counter()
+        last_status = start_time
+
+        while not self._should_stop:
+            now = time.perf_counter()
+            due = int((now - start_time) * self._generator.sample_rate) - \
+                self._generator.sample_count
+
+            if due > 0:
+                _, values = self._generator.generate(due)
+                self._write(format_rssi_lines(values))
+                self.sent_samples = self.sent_samples + due
+
+            if now - last_status >= PTY_STATUS_INTERVAL:
+                self._write(b'v 11.4\nt 20.0\n')
+                last_status = now
+
+            self._handle_commands()
+            time.sleep(PTY_TICK_INTERVAL)
+
+    def _handle_commands(self):
+        try:
+            data = os.read(self._master, PTY_READ_SIZE)
+        except BlockingIOError:
+            return
+
+        for line in data.split(b'\n'):
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            if tokens[0] == b'?':
+                self._write(self._status_line())
+            elif tokens[0] == b'f' and len(tokens) == 3:
+                self.frequencies[int(tokens[1])] = int(tokens[2])
+
+    def _status_line(self):
+        return '? {} {} 0\n'.format(
+            len(self.frequencies),
+            ' '.join(str(f) for f in self.frequencies)).encode('ascii')
+
+    def _write(self, data):
+        try:
+            written = os.write(self._master, data)
+        except BlockingIOError:
+            written = 0
+
+        self.dropped_bytes = self.dropped_bytes + len(data) - written
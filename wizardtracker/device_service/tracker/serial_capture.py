@@ -0,0 +1,164 @@
+import os
+import struct
+import time
+
+import serial
+
+
+CAPTURE_MAGIC = b'WTSC'
+CAPTURE_VERSION = 1
+CAPTURE_HEADER = struct.Struct('<4sH')
+# Receive time (perf_counter seconds) and length, then the bytes themselves.
+CHUNK_HEADER = struct.Struct('<dI')
+
+CAPTURE_BUFFER_SIZE = 1024 * 1024
+FLUSH_INTERVAL = 1
+
+# Sleep at most this long in one readinto() while waiting for the next
+# chunk to come due, so a replay still notices control commands.
+REPLAY_TIMEOUT = 0.05
+
+
+class ReplayFinished(serial.SerialException):
+    pass
+
+
+def capture_filename(port):
+    return 'capture-{}-{}.wtsc'.format(
+        time.strftime('%Y%m%d-%H%M%S'),
+        os.path.basename(port))
+
+
+class SerialCaptureWriter:
+    def __init__(self, path):
+        self.path = path
+        self.chunk_count = 0
+        self.byte_count = 0
+
+        self._file = open(path, 'wb', buffering=CAPTURE_BUFFER_SIZE)
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION))
+        self._last_flush = time.perf_counter()
+
+    def write(self, timestamp, data):
+        self._file.write(CHUNK_HEADER.pack(timestamp, len(data)))
+        self._file.write(data)
+
+        self.chunk_count = self.chunk_count + 1
+        self.byte_count = self.byte_count + len(data)
+
+        # Don't sit on much, a capture is most useful after a crash.
+        if timestamp - self._last_flush >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._last_flush = timestamp
+
+    def close(self):
+        self._file.close()
+
+
+def read_capture(path):
+    # Checks the header straight away, then yields (timestamp, data) chunks.
+    f = open(path, 'rb')
+    try:
+        magic, version = CAPTURE_HEADER.unpack(f.read(CAPTURE_HEADER.size))
+    except struct.error:
+        magic, version = None, None
+
+    if magic != CAPTURE_MAGIC:
+        f.close()
+        raise ValueError('Not a serial capture ({}).'.format(path))
+    if version != CAPTURE_VERSION:
+        f.close()
+        raise ValueError('Unsupported capture version ({}).'.format(version))
+
+    return _read_chunks(f)
+
+
+def _read_chunks(f):
+    with f:
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                # The end, or the tail of a capture that was cut short.
+                return
+
+            timestamp, size = CHUNK_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return
+
+            yield timestamp, data
+
+
+class ReplaySerial:
+    # Stands in for serial.Serial, handing out a capture's chunks on their
+    # original schedule (scaled by speed), or as fast as they're read with a
+    # speed of 0. Anything written to the "device" is ignored.
+
+    def __init__(self, path, speed=1):
+        self.port = path
+        self.baudrate = None
+        self.timeout = None
+        self.is_open = False
+
+        self._path = path
+        self._speed = speed
+        self._chunks = None
+        self._pending = b''
+        self._pending_time = None
+        self._first_time = None
+        self._start_time = None
+
+    def open(self):
+        self._chunks = read_capture(self._path)
+        self._pending = b''
+        self._first_time = None
+        self._start_time = time.perf_counter()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+    @property
+    def in_waiting(self):
+        if not self._pending:
+            self._next_chunk()
+
+        return len(self._pending) if self._due_in() <= 0 else 0
+
+    def readinto(self, buffer):
+        if not self._pending:
+            self._next_chunk()
+
+        wait = self._due_in()
+        if wait > 0:
+            time.sleep(min(wait, REPLAY_TIMEOUT))
+            if self._due_in() > 0:
+                return 0
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+
+        return size
+
+    def _next_chunk(self):
+        try:
+            self._pending_time, self._pending = next(self._chunks)
+        except StopIteration:
+            raise ReplayFinished('End of capture.')
+
+        if self._first_time is None:
+            self._first_time = self._pending_time
+
+    def _due_in(self):
+        if not self._speed:
+            return 0
+
+        due = (self._pending_time - self._first_time) / self._speed
+        return due - (time.perf_counter() - self._start_time)
@@ -0,0 +1,92 @@
+import json
+import threading
+
+
+# How often the reader thread refreshes the snapshot while nothing else is
+# happening. Control commands and state changes publish straight away.
+STATUS_INTERVAL = 0.1
+
+# What the version follows. Everything else is telemetry that changes on
+# every refresh while streaming, and is only ever the latest.
+STABLE_FIELDS = ('connected', 'ready', 'receiverCount', 'frequencies')
+
+
+def _stable_status(status):
+    return tuple(status.get(field) for field in STABLE_FIELDS)
+
+
+def build_status(tracker):
+    # Only call this from whichever thread updates the tracker, that's what
+    # keeps the snapshot consistent.
+    status = {
+        'connected': tracker.is_connected,
+        'ready': tracker.is_ready
+    }
+
+    if tracker.is_connected:
+        status['serial'] = tracker.read_stats
+
+    if tracker.is_ready:
+        status.update({
+            'receiverCount': tracker.receiver_count,
+            'frequencies': list(tracker.frequencies),
+            'voltage': tracker.voltage,
+            'temperature': tracker.temperature,
+            'hz': tracker.hz,
+            'rssi': list(tracker.rssi) if tracker.rssi else None
+        })
+
+    return status
+
+
+class StatusSnapshot:
+    __slots__ = ('version', 'revision', 'status', 'body', 'etag')
+
+    def __init__(self, version, status, revision=0):
+        self.version = version
+        # Counts telemetry updates within a version, so the ETag changes
+        # whenever the body does.
+        self.revision = revision
+        self.status = status
+        self.body = json.dumps(dict(status, version=version)).encode('utf-8')
+        self.etag = 'status-{}.{}'.format(version, revision)
+
+
+class StatusBoard:
+    # The reader thread publishes, API threads read. Reading is a single
+    # attribute load, so requests never wait on the reader, and snapshots
+    # are never modified once they're out.
+    #
+    # Long polls only see changes to STABLE_FIELDS. Newer telemetry
+    # replaces the snapshot under the same version, so nobody is woken for
+    # it, but with a new ETag so nobody gets a 304 for it either.
+
+    def __init__(self):
+        self.snapshot = StatusSnapshot(0, {
+            'connected': False,
+            'ready': False
+        })
+        self._condition = threading.Condition()
+
+    def publish(self, status):
+        current = self.snapshot
+        if status == current.status:
+            return
+
+        if _stable_status(status) == _stable_status(current.status):
+            self.snapshot = StatusSnapshot(
+                current.version, status, current.revision + 1)
+            return
+
+        snapshot = StatusSnapshot(current.version + 1, status)
+        with self._condition:
+            self.snapshot = snapshot
+            self._condition.notify_all()
+
+    def wait(self, since, timeout):
+        # Long poll: returns as soon as there's a version other than since.
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.snapshot.version != since, timeout)
+
+        return self.snapshot
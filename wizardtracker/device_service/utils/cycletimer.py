@@ -6,8 +6,8 @@ class CycleTimer:
         self._cycles = 0
         self._time = time.perf_counter()
 
-    def tick(self):
-        self._cycles = self._cycles + 1
+    def tick(self, cycles=1):
+        self._cycles = self._cycles + cycles
 
     def reset(self):
         self._cycles = 0
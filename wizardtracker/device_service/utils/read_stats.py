@@ -0,0 +1,49 @@
+import time
+
+
+class ReadStats:
+    def __init__(self, window=1):
+        self._window = window
+        self.reset()
+
+    def record_read(self, size, waiting):
+        self._reads = self._reads + 1
+        self._total_bytes = self._total_bytes + size
+        self._last_size = size
+        self._max_size = max(self._max_size, size)
+        self._max_waiting = max(self._max_waiting, waiting)
+
+        self._window_bytes = self._window_bytes + size
+        elapsed = time.perf_counter() - self._window_time
+        if elapsed >= self._window:
+            self._bytes_per_second = self._window_bytes / elapsed
+            self._window_bytes = 0
+            self._window_time = time.perf_counter()
+
+    def record_overflow(self):
+        self._overflows = self._overflows + 1
+
+    def reset(self):
+        self._reads = 0
+        self._total_bytes = 0
+        self._last_size = 0
+        self._max_size = 0
+        self._max_waiting = 0
+        self._overflows = 0
+
+        self._bytes_per_second = 0
+        self._window_bytes = 0
+        self._window_time = time.perf_counter()
+
+    def as_dict(self):
+        return {
+            'reads': self._reads,
+            'totalBytes': self._total_bytes,
+            'lastReadSize': self._last_size,
+            'maxReadSize': self._max_size,
+            'averageReadSize':
+                self._total_bytes / self._reads if self._reads else 0,
+            'maxWaiting': self._max_waiting,
+            'bytesPerSecond': self._bytes_per_second,
+            'osBufferOverflows': self._overflows,
+        }
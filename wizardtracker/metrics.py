@@ -0,0 +1,206 @@
+import bisect
+import collections
+import threading
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5,
+    1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value) \
+        .replace('\\', '\\\\') \
+        .replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(k, _escape(v)) for k, v in labels))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, labels):
+        self._labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value = self._value + amount
+
+    def samples(self, name):
+        yield name, self._labels, self._value
+
+
+class Gauge:
+    def __init__(self, labels):
+        self._labels = labels
+        self._value = 0
+
+    def set(self, value):
+        self._value = value
+
+    def samples(self, name):
+        yield name, self._labels, self._value
+
+
+class Histogram:
+    # Fixed buckets and a lock around three additions, which is about as
+    # cheap as this gets in Python. Hot paths observe once per batch and
+    # pass count for the rest.
+
+    def __init__(self, labels, buckets):
+        self._labels = labels
+        self._bounds = list(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value, count=1):
+        index = bisect.bisect_left(self._bounds, value)
+
+        with self._lock:
+            self._counts[index] = self._counts[index] + count
+            self._sum = self._sum + value * count
+            self._count = self._count + count
+
+    def samples(self, name):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+            count = self._count
+
+        cumulative = 0
+        bounds = self._bounds + [float('inf')]
+        for bound, bucket_count in zip(bounds, counts):
+            cumulative = cumulative + bucket_count
+            yield (
+                name + '_bucket',
+                self._labels + (('le', _format_value(bound)),),
+                cumulative)
+
+        yield name + '_sum', self._labels, total
+        yield name + '_count', self._labels, count
+
+
+class Registry:
+    def __init__(self):
+        # Name -> (type, help, labels -> metric).
+        self._families = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, **labels):
+        return self._get(name, 'counter', help_text, labels, Counter)
+
+    def gauge(self, name, help_text, **labels):
+        return self._get(name, 'gauge', help_text, labels, Gauge)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        return self._get(
+            name,
+            'histogram',
+            help_text,
+            labels,
+            lambda l: Histogram(l, buckets))
+
+    def render(self):
+        lines = []
+
+        with self._lock:
+            families = [
+                (name, kind, help_text, list(metrics.values()))
+                for name, (kind, help_text, metrics)
+                in self._families.items()]
+
+        for name, kind, help_text, metrics in families:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+            for metric in metrics:
+                for sample_name, labels, value in metric.samples(name):
+                    lines.append('{}{} {}'.format(
+                        sample_name,
+                        _format_labels(labels),
+                        _format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+    def _get(self, name, kind, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+
+        with self._lock:
+            if name not in self._families:
+                self._families[name] = (kind, help_text, {})
+
+            family_kind, _, metrics = self._families[name]
+            if family_kind != kind:
+                raise ValueError(
+                    'Metric {} is already a {}.'.format(name, family_kind))
+
+            if key not in metrics:
+                metrics[key] = factory(key)
+
+            return metrics[key]
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help_text, **labels):
+    return REGISTRY.counter(name, help_text, **labels)
+
+
+def gauge(name, help_text, **labels):
+    return REGISTRY.gauge(name, help_text, **labels)
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS, **labels):
+    return REGISTRY.histogram(name, help_text, buckets, **labels)
+
+
+def render():
+    return REGISTRY.render()
+
+
+# The pipeline's own families, so every service names them the same way.
+
+def stage_seconds(stage):
+    return histogram(
+        'wizardtracker_stage_seconds',
+        'Time spent in one stage of the RSSI pipeline.',
+        stage=stage)
+
+
+def sample_age_seconds(stage):
+    # Samples are stamped with perf_counter when they come off the serial
+    # port, which every process on the host shares, so this works across
+    # services. Differences between stages give the time in between.
+    return histogram(
+        'wizardtracker_sample_age_seconds',
+        'Time since the sample was read from the device.',
+        stage=stage)
+
+
+def samples_total(stage):
+    return counter(
+        'wizardtracker_samples_total',
+        'RSSI samples through each stage of the pipeline.',
+        stage=stage)
@@ -1,17 +1,40 @@
+import collections
 import datetime
 import logging
 
 from peewee import *
 
 
-DB = SqliteDatabase('wizardtracker.db', pragmas=(('foreign_keys', 'on'),))
-DB.connect()
+DATABASE_PATH = 'wizardtracker.db'
+# Set on every connection. WAL lets the API read while the recorder writes,
+# and with it synchronous=normal only risks the last commits on power loss,
+# never the database. cache_size is in KiB when negative.
+PRAGMAS = (
+    ('foreign_keys', 'on'),
+    ('journal_mode', 'wal'),
+    ('synchronous', 'normal'),
+    ('cache_size', -16000),
+    ('mmap_size', 64 * 1024 * 1024),
+)
+
+# Nothing is opened until it's used, and then each thread gets its own
+# connection.
+DB = SqliteDatabase(DATABASE_PATH, pragmas=PRAGMAS)
 
 # Hush, peewee.
 PEEWEE_LOGGER = logging.getLogger('peewee')
 PEEWEE_LOGGER.setLevel(logging.INFO)
 
 
+def configure_database(path=DATABASE_PATH, pragmas=None):
+    # Before any thread has connected, or it keeps what it connected with.
+    # pragmas are added to (or override) the defaults above.
+    merged = collections.OrderedDict(PRAGMAS)
+    merged.update(pragmas or {})
+
+    DB.init(path, pragmas=list(merged.items()))
+
+
 class BaseModel(Model):
     class Meta:
         database = DB
@@ -31,8 +54,51 @@ class RaceReceiver(BaseModel):
 
 class RaceRssi(BaseModel):
     timestamp = FloatField()
+    # The index below covers reading a receiver's RSSI in time order, so
+    # the foreign key's own index would only slow inserts down.
     receiver = ForeignKeyField(
         RaceReceiver,
         backref='rssi',
-        on_delete='cascade')
+        on_delete='cascade',
+        index=False)
     value = IntegerField()
+
+    class Meta:
+        indexes = (
+            (('receiver', 'timestamp', 'value'), False),
+        )
+
+
+class RaceRssiChunk(BaseModel):
+    # One receiver's RSSI over a stretch of a race, packed into arrays by
+    # wizardtracker.models.rssi_chunks. Replaces RaceRssi's row per value.
+    receiver = ForeignKeyField(
+        RaceReceiver,
+        backref='rssi_chunks',
+        on_delete='cascade',
+        index=False)
+    start_time = FloatField()
+    end_time = FloatField()
+    sample_count = IntegerField()
+    value_type = CharField()
+    timestamp_data = BlobField()
+    value_data = BlobField()
+
+    class Meta:
+        indexes = (
+            (('receiver', 'start_time'), False),
+        )
+
+
+class RaceLapResult(BaseModel):
+    # A race's laps as /race/times returns them, and the detection
+    # parameters they were found with. Triggers (see migrations) drop it
+    # when the race's RSSI changes.
+    race = ForeignKeyField(
+        Race,
+        backref='lap_results',
+        on_delete='cascade',
+        unique=True)
+    parameters = TextField()
+    results = TextField()
+    computed_on = DateTimeField(default=datetime.datetime.now)
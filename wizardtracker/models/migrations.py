@@ -0,0 +1,83 @@
+import logging
+
+from wizardtracker.models import (
+    DB,
+    Race,
+    RaceLapResult,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _create_tables(database):
+    # What tools/gen_db.py used to do, so databases made with it are
+    # already here.
+    database.create_tables(
+        [Race, RaceReceiver, RaceRssi, RaceRssiChunk],
+        safe=True)
+
+
+def _index_rssi(database):
+    for model in (RaceRssi, RaceRssiChunk):
+        model._schema.create_indexes(safe=True)
+
+    # Made redundant by the ones above.
+    for index in ('racerssi_receiver_id', 'racerssichunk_receiver_id'):
+        database.execute_sql('DROP INDEX IF EXISTS {}'.format(index))
+
+
+def _add_lap_results(database):
+    database.create_tables([RaceLapResult], safe=True)
+
+    # Anything that adds or removes RSSI for a race, the recorder or an
+    # import, makes its stored laps stale.
+    for table in ('racerssi', 'racerssichunk'):
+        for event, row in (('insert', 'NEW'), ('delete', 'OLD')):
+            database.execute_sql(
+                'CREATE TRIGGER IF NOT EXISTS {table}_{event}_lap_results '
+                'AFTER {event_sql} ON {table} '
+                'BEGIN '
+                'DELETE FROM racelapresult WHERE race_id = ('
+                'SELECT race_id FROM racereceiver '
+                'WHERE id = {row}.receiver_id); '
+                'END'.format(
+                    table=table,
+                    event=event,
+                    event_sql=event.upper(),
+                    row=row))
+
+
+# Only ever add to the end. A database's version (SQLite's user_version) is
+# how many of these it has had.
+MIGRATIONS = [
+    _create_tables,
+    _index_rssi,
+    _add_lap_results,
+]
+
+
+def get_version(database=DB):
+    return database.execute_sql('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(database=DB):
+    version = get_version(database)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(
+            'Database is version {}, newer than this code ({}).'.format(
+                version, len(MIGRATIONS)))
+
+    for number in range(version + 1, len(MIGRATIONS) + 1):
+        LOGGER.info('Migrating database to version %d...', number)
+
+        # SQLite's schema changes are transactional, so a migration that
+        # fails part way leaves the database as it was.
+        with database.atomic():
+            MIGRATIONS[number - 1](database)
+            database.execute_sql('PRAGMA user_version = {}'.format(number))
+
+    return len(MIGRATIONS)
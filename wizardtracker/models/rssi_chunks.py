@@ -0,0 +1,202 @@
+import collections
+import zlib
+
+import numpy
+
+from wizardtracker.models import RaceReceiver, RaceRssi, RaceRssiChunk
+
+
+# Seconds of RSSI per chunk, and a cap on samples so a fast device doesn't
+# make huge ones.
+CHUNK_DURATION = 5
+CHUNK_SIZE = 4096
+
+TIMESTAMP_TYPE = numpy.dtype('<f8')
+VALUE_TYPES = tuple(numpy.dtype(t) for t in ('<u1', '<u2', '<i4', '<i8'))
+
+# Rows fetched at a time when reading RaceRssi.
+ROW_BLOCK_SIZE = 10000
+
+
+def _delta_encode(array):
+    # Neighbouring samples are close, so their differences are small and
+    # zlib does well on them. Differences wrap around in the array's own
+    # type, and so does the cumsum that undoes them, so nothing is lost.
+    deltas = numpy.empty_like(array)
+    deltas[:1] = array[:1]
+    numpy.subtract(array[1:], array[:-1], out=deltas[1:])
+
+    return zlib.compress(deltas.tobytes())
+
+
+def _delta_decode(data, dtype, out=None):
+    # The cumsum has to be in the stored type to wrap the same way the
+    # deltas did, out can be anything it fits in.
+    deltas = numpy.frombuffer(zlib.decompress(data), dtype=dtype)
+    if out is None or out.dtype == deltas.dtype:
+        return numpy.cumsum(deltas, dtype=dtype, out=out)
+
+    out[:] = numpy.cumsum(deltas, dtype=dtype)
+    return out
+
+
+def _value_type(values):
+    if not len(values):
+        return VALUE_TYPES[0]
+
+    low = values.min()
+    high = values.max()
+    for value_type in VALUE_TYPES:
+        info = numpy.iinfo(value_type)
+        if info.min <= low and high <= info.max:
+            return value_type
+
+    raise ValueError('RSSI values out of range.')
+
+
+def encode_chunk(timestamps, values):
+    # Values are stored as integers, same as RaceRssi did.
+    timestamps = numpy.asarray(timestamps, dtype=TIMESTAMP_TYPE)
+    values = numpy.asarray(values).astype(numpy.int64)
+    value_type = _value_type(values)
+
+    return {
+        'start_time': float(timestamps[0]),
+        'end_time': float(timestamps[-1]),
+        'sample_count': len(timestamps),
+        'value_type': value_type.str,
+        # Deltas of the float bits rather than the floats, so timestamps
+        # come back exactly.
+        'timestamp_data': _delta_encode(timestamps.view('<i8')),
+        'value_data': _delta_encode(values.astype(value_type)),
+    }
+
+
+def decode_chunk(chunk):
+    timestamps = _delta_decode(chunk.timestamp_data, '<i8').view(
+        TIMESTAMP_TYPE)
+    values = _delta_decode(chunk.value_data, chunk.value_type)
+
+    return timestamps, values
+
+
+def split_chunks(timestamps, duration=CHUNK_DURATION, size=CHUNK_SIZE):
+    # Start and end indexes of each chunk of sorted timestamps.
+    start = 0
+    while start < len(timestamps):
+        end = numpy.searchsorted(
+            timestamps, timestamps[start] + duration, side='left')
+        end = max(start + 1, min(end, start + size))
+        yield start, end
+        start = end
+
+
+def load_receiver_rssi(receiver_id, start_time=None, end_time=None):
+    return load_rssi([receiver_id], start_time, end_time)[receiver_id]
+
+
+def load_race_rssi(race_id, start_time=None, end_time=None):
+    # Receiver ID -> (timestamps, values), both numpy arrays in time order.
+    receivers = RaceReceiver \
+        .select(RaceReceiver.id) \
+        .where(RaceReceiver.race == race_id) \
+        .order_by(RaceReceiver.receiver_id) \
+        .tuples()
+
+    return load_rssi(
+        [receiver[0] for receiver in receivers], start_time, end_time)
+
+
+def load_rssi(receiver_ids, start_time=None, end_time=None):
+    # Only samples from start_time to end_time (inclusive) when given.
+    # Receivers recorded before chunks, and not migrated, come from their
+    # RaceRssi rows instead.
+    query = RaceRssiChunk \
+        .select(
+            RaceRssiChunk.receiver,
+            RaceRssiChunk.sample_count,
+            RaceRssiChunk.value_type,
+            RaceRssiChunk.timestamp_data,
+            RaceRssiChunk.value_data) \
+        .where(RaceRssiChunk.receiver.in_(receiver_ids)) \
+        .order_by(RaceRssiChunk.receiver, RaceRssiChunk.start_time) \
+        .tuples()
+    if start_time is not None:
+        query = query.where(RaceRssiChunk.end_time >= start_time)
+    if end_time is not None:
+        query = query.where(RaceRssiChunk.start_time <= end_time)
+
+    chunks = collections.defaultdict(list)
+    for chunk in query:
+        chunks[chunk[0]].append(chunk[1:])
+
+    loaded = collections.OrderedDict()
+    for receiver_id in receiver_ids:
+        if receiver_id in chunks:
+            timestamps, values = _decode_chunks(chunks.pop(receiver_id))
+            loaded[receiver_id] = _trim(
+                timestamps, values, start_time, end_time)
+        else:
+            loaded[receiver_id] = load_rssi_rows(
+                receiver_id, start_time, end_time)
+
+    return loaded
+
+
+def load_rssi_rows(receiver_id, start_time=None, end_time=None):
+    # Off a raw cursor a block at a time, so there's never a model instance
+    # or a whole list of tuples for every row.
+    query = RaceRssi \
+        .select(RaceRssi.timestamp, RaceRssi.value) \
+        .where(RaceRssi.receiver == receiver_id) \
+        .order_by(RaceRssi.timestamp)
+    if start_time is not None:
+        query = query.where(RaceRssi.timestamp >= start_time)
+    if end_time is not None:
+        query = query.where(RaceRssi.timestamp <= end_time)
+
+    count = query.count()
+    timestamps = numpy.empty(count, dtype=TIMESTAMP_TYPE)
+    values = numpy.empty(count, dtype=numpy.int64)
+
+    cursor = RaceRssi._meta.database.execute_sql(*query.sql())
+    loaded = 0
+    while loaded < count:
+        rows = cursor.fetchmany(min(ROW_BLOCK_SIZE, count - loaded))
+        if not rows:
+            break
+
+        end = loaded + len(rows)
+        timestamps[loaded:end], values[loaded:end] = zip(*rows)
+        loaded = end
+    cursor.close()
+
+    return timestamps[:loaded], values[:loaded]
+
+
+def _decode_chunks(chunks):
+    # Decoded straight into arrays sized up front, no concatenating.
+    count = sum(sample_count for sample_count, _, _, _ in chunks)
+    timestamps = numpy.empty(count, dtype=TIMESTAMP_TYPE)
+    values = numpy.empty(count, dtype=numpy.int64)
+
+    start = 0
+    for sample_count, value_type, timestamp_data, value_data in chunks:
+        end = start + sample_count
+        _delta_decode(timestamp_data, '<i8', timestamps[start:end].view('<i8'))
+        _delta_decode(value_data, value_type, values[start:end])
+        start = end
+
+    return timestamps, values
+
+
+def _trim(timestamps, values, start_time, end_time):
+    # Chunks at either end can run past the range.
+    start = 0
+    end = len(timestamps)
+    if start_time is not None:
+        start = numpy.searchsorted(timestamps, start_time, side='left')
+    if end_time is not None:
+        end = numpy.searchsorted(timestamps, end_time, side='right')
+
+    return timestamps[start:end], values[start:end]
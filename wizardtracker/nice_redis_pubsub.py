@@ -1,30 +1,83 @@
-import json
 import logging
+import select
+import time
 import redis
 
+from wizardtracker import pubsub_codecs
+from wizardtracker.pubsub_codecs import BATCH_KEY, unpack_batch
+from wizardtracker.shm_ring import (
+    RING_CAPACITY,
+    RING_DIRECTORY,
+    ShmRingReader,
+    ShmRingWriter
+)
+
 
 REDIS_SOCKET_TIMEOUT = 5
+MESSAGE_TIMEOUT = 0.1
+
+PUBSUB_TRANSPORT = 'pubsub'
+STREAM_TRANSPORT = 'stream'
+SHM_TRANSPORT = 'shm'
+TRANSPORTS = (PUBSUB_TRANSPORT, STREAM_TRANSPORT, SHM_TRANSPORT)
+
+STREAM_MAXLEN = 100000
+STREAM_READ_COUNT = 100
+STREAM_DATA_FIELD = b'data'
+
 LOGGER = logging.getLogger(__name__)
 
 
 class NiceRedisPubsub:
-    def __init__(self, host='localhost', port=6379):
+    def __init__(
+            self,
+            host='localhost',
+            port=6379,
+            codecs=None,
+            transports=None,
+            consumer_group='default',
+            stream_maxlen=STREAM_MAXLEN,
+            stream_read_count=STREAM_READ_COUNT,
+            shm_directory=RING_DIRECTORY,
+            shm_capacity=RING_CAPACITY,
+            redis_client=None):
         self._host = host
         self._port = port
 
-        self._redis = None
+        self._redis = redis_client
         self._redis_pubsub = None
 
         self._callbacks = {}
+        self._codecs = {}
+        self._transports = {}
+
+        # Stream channels -> the ID to read from next. '0' picks up anything
+        # delivered to us before a restart but never acknowledged.
+        self._stream_ids = {}
+        self._consumer_group = consumer_group
+        self._stream_maxlen = stream_maxlen
+        self._stream_read_count = stream_read_count
+
+        # Shared memory rings for same-host, RSSI-only channels.
+        self._shm_writers = {}
+        self._shm_readers = {}
+        self._shm_directory = shm_directory
+        self._shm_capacity = shm_capacity
+
+        for channel, codec_name in (codecs or {}).items():
+            self.set_codec(channel, codec_name)
+
+        for channel, transport in (transports or {}).items():
+            self.set_transport(channel, transport)
 
     def connect(self):
         LOGGER.info('Connecting to Redis...')
-        self._redis = redis.StrictRedis(
-            host=self._host,
-            port=self._port,
-            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
-            socket_timeout=REDIS_SOCKET_TIMEOUT,
-            decode_responses=True)
+        if not self._redis:
+            self._redis = redis.StrictRedis(
+                host=self._host,
+                port=self._port,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_timeout=REDIS_SOCKET_TIMEOUT)
 
         # Block until connected, giving messages along the way.
         connected = False
@@ -40,24 +93,183 @@ class NiceRedisPubsub:
 
         self._redis_pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
 
-    def subscribe(self, channel, callback):
+    def set_codec(self, channel, codec_name):
+        self._codecs[channel] = pubsub_codecs.get_codec(codec_name)
+
+    def set_transport(self, channel, transport):
+        if transport not in TRANSPORTS:
+            raise ValueError('Unknown transport ({}).'.format(transport))
+
+        self._transports[channel] = transport
+
+    def subscribe(self, channel, callback, batch=False):
         if not channel in self._callbacks:
-            self._redis_pubsub.subscribe(channel)
+            if self._transport(channel) == STREAM_TRANSPORT:
+                self._subscribe_stream(channel)
+            elif self._transport(channel) == SHM_TRANSPORT:
+                self._shm_readers[channel] = ShmRingReader(
+                    channel, self._shm_directory, self._shm_capacity)
+            else:
+                self._redis_pubsub.subscribe(channel)
             self._callbacks[channel] = []
 
-        self._callbacks[channel].append(callback)
+        self._callbacks[channel].append((callback, batch))
 
     def publish(self, channel, data):
-        self._redis.publish(channel, json.dumps(data))
+        if self._transport(channel) == SHM_TRANSPORT:
+            self._publish_shm(channel, data)
+            return
 
-    def tick_messages(self):
-        message = self._redis_pubsub.get_message()
+        codec = self._codecs.get(channel, pubsub_codecs.DEFAULT_CODEC)
+        payload = codec.encode(data)
 
-        if message:
-            channel = message['channel']
-            data = message['data']
+        if self._transport(channel) == STREAM_TRANSPORT:
+            self._redis.xadd(
+                channel,
+                {STREAM_DATA_FIELD: payload},
+                maxlen=self._stream_maxlen,
+                approximate=True)
+        else:
+            self._redis.publish(channel, payload)
+
+    def publish_batch(self, channel, items):
+        # Subscribers unpack these again, so callbacks still see one item at
+        # a time.
+        self.publish(channel, {BATCH_KEY: items})
+
+    def tick_messages(self, timeout=MESSAGE_TIMEOUT):
+        # Blocks for up to timeout waiting for a message, so callers can loop
+        # on this without spinning and still notice when they should stop.
+        if not self._callbacks:
+            time.sleep(timeout)
+            return
+
+        if self._shm_readers:
+            # The rings are the low latency path, so rather than waiting on
+            # each transport in turn, wait on the rings and pub/sub together
+            # and then just poll. Streams can't be waited on alongside them,
+            # so they're only polled.
+            self._wait_shm(timeout)
+            timeout = 0
+
+        ticks = []
+        if self._uses_pubsub():
+            ticks.append(self._tick_pubsub)
+        if self._stream_ids:
+            ticks.append(self._tick_streams)
+        if self._shm_readers:
+            ticks.append(self._tick_shm)
+
+        # Share the wait out between whichever transports are in use.
+        for tick in ticks:
+            tick(timeout / len(ticks))
+
+    def close(self):
+        for writer in self._shm_writers.values():
+            writer.close()
+        for reader in self._shm_readers.values():
+            reader.close()
+
+    def _transport(self, channel):
+        return self._transports.get(channel, PUBSUB_TRANSPORT)
+
+    def _uses_pubsub(self):
+        other_count = len(self._stream_ids) + len(self._shm_readers)
+        return other_count < len(self._callbacks)
 
+    def _subscribe_stream(self, channel):
+        try:
+            self._redis.xgroup_create(
+                channel,
+                self._consumer_group,
+                id='$',
+                mkstream=True)
+        except redis.exceptions.ResponseError as err:
+            # The group sticks around between restarts, which is the point.
+            if 'BUSYGROUP' not in str(err):
+                raise
+
+        self._stream_ids[channel] = '0'
+
+    def _publish_shm(self, channel, data):
+        if channel not in self._shm_writers:
+            self._shm_writers[channel] = ShmRingWriter(
+                channel, self._shm_directory, self._shm_capacity)
+
+        self._shm_writers[channel].write(unpack_batch(data))
+
+    def _tick_pubsub(self, timeout):
+        message = self._redis_pubsub.get_message(timeout=timeout)
+
+        if message:
+            channel = message['channel'].decode('utf-8')
             if channel in self._callbacks:
-                data = json.loads(data)
-                for callback in self._callbacks[channel]:
-                    callback(data)
+                self._dispatch(channel, message['data'])
+
+    def _tick_streams(self, timeout):
+        # XREADGROUP treats BLOCK 0 as forever, so only block for real waits.
+        block = int(timeout * 1000) or None
+        if any(i != '>' for i in self._stream_ids.values()):
+            block = None
+
+        response = self._redis.xreadgroup(
+            self._consumer_group,
+            self._consumer_group,
+            self._stream_ids,
+            count=self._stream_read_count,
+            block=block)
+
+        for channel, entries in response or []:
+            channel = channel.decode('utf-8')
+
+            if not entries:
+                # Nothing left pending from before, switch to new entries.
+                self._stream_ids[channel] = '>'
+                continue
+
+            entry_ids = []
+            for entry_id, fields in entries:
+                if fields:
+                    self._dispatch(channel, fields[STREAM_DATA_FIELD])
+                entry_ids.append(entry_id)
+
+            self._redis.xack(channel, self._consumer_group, *entry_ids)
+
+    def _wait_shm(self, timeout):
+        readers = list(self._shm_readers.values())
+        if any(reader.ready() for reader in readers):
+            return
+
+        waiting = readers
+        if self._uses_pubsub():
+            connection = self._redis_pubsub.connection
+            if connection and connection._sock:
+                # Already read off the socket, just not handled yet.
+                if connection.can_read(timeout=0):
+                    return
+                waiting = waiting + [connection._sock]
+
+        select.select(waiting, [], [], timeout)
+
+    def _tick_shm(self, timeout):
+        for channel, reader in self._shm_readers.items():
+            if timeout:
+                reader.wait(timeout / len(self._shm_readers))
+            self._dispatch_items(channel, reader.read())
+
+    def _dispatch(self, channel, payload):
+        data = pubsub_codecs.decode(payload)
+        self._dispatch_items(channel, unpack_batch(data))
+
+    def _dispatch_items(self, channel, items):
+        if not items:
+            return
+
+        # Batch callbacks get a publisher's batch as one list, everyone else
+        # gets them one at a time.
+        for callback, batch in self._callbacks[channel]:
+            if batch:
+                callback(items)
+            else:
+                for item in items:
+                    callback(item)
@@ -0,0 +1,200 @@
+import array
+import json
+import struct
+import sys
+
+
+BATCH_KEY = 'batch'
+
+BINARY_MAGIC = b'\xffW'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<2sBBBBH')
+
+_FLAG_BATCH = 0x01
+_FLAG_SEQUENCE = 0x02
+
+_SAMPLE_KEYS = {'timestamp', 'rssi', 'sequence'}
+
+# Value type code -> array typecode.
+_VALUE_TYPES = {
+    0: 'B',
+    1: 'H',
+    2: 'f',
+    3: 'd',
+}
+
+# Smallest first. Floats go as doubles so filtered RSSI isn't rounded, 'f'
+# is only there to read messages still sitting in streams from before.
+_PACK_TYPES = (0, 1, 3)
+
+
+def _to_little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    return values.tobytes()
+
+
+def _from_little_endian(typecode, payload, offset, count):
+    values = array.array(typecode)
+    size = values.itemsize * count
+    values.frombytes(payload[offset:offset + size])
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    return values, offset + size
+
+
+def _pack_values(values):
+    # Use the smallest type that holds every value. Integer arrays refuse
+    # floats and out of range values, which moves us on to the next type.
+    for value_type in _PACK_TYPES:
+        try:
+            return value_type, array.array(_VALUE_TYPES[value_type], values)
+        except (TypeError, OverflowError):
+            pass
+
+    raise ValueError('Values cannot be packed.')
+
+
+class JsonCodec:
+    name = 'json'
+
+    def encode(self, data):
+        return json.dumps(data).encode('utf-8')
+
+    def decode(self, payload):
+        return json.loads(payload.decode('utf-8'))
+
+
+class RssiBinaryCodec:
+    # Packs RSSI samples ({'timestamp', 'rssi'[, 'sequence']}) as a fixed
+    # header followed by column arrays. Anything that doesn't look like RSSI
+    # data falls back to JSON, which decode() tells apart by the magic bytes.
+    name = 'rssi_binary'
+
+    def __init__(self):
+        self._fallback = JsonCodec()
+
+    def encode(self, data):
+        batched = isinstance(data, dict) and BATCH_KEY in data
+        samples = data[BATCH_KEY] if batched else [data]
+
+        try:
+            return self._encode_samples(samples, batched)
+        except (KeyError, TypeError, ValueError, OverflowError,
+                struct.error):
+            return self._fallback.encode(data)
+
+    def decode(self, payload):
+        if not payload.startswith(BINARY_MAGIC):
+            return self._fallback.decode(payload)
+
+        _, version, flags, value_type, receiver_count, sample_count = \
+            BINARY_HEADER.unpack_from(payload)
+        if version != BINARY_VERSION:
+            raise ValueError(
+                'Unsupported binary message version ({}).'.format(version))
+
+        offset = BINARY_HEADER.size
+        timestamps, offset = _from_little_endian(
+            'd', payload, offset, sample_count)
+
+        sequences = None
+        if flags & _FLAG_SEQUENCE:
+            sequences, offset = _from_little_endian(
+                'I', payload, offset, sample_count)
+
+        values, offset = _from_little_endian(
+            _VALUE_TYPES[value_type],
+            payload,
+            offset,
+            sample_count * receiver_count)
+        values = values.tolist()
+
+        samples = []
+        for i, timestamp in enumerate(timestamps):
+            start = i * receiver_count
+            sample = {
+                'timestamp': timestamp,
+                'rssi': values[start:start + receiver_count]
+            }
+
+            if sequences is not None:
+                sample['sequence'] = sequences[i]
+
+            samples.append(sample)
+
+        if flags & _FLAG_BATCH:
+            return {BATCH_KEY: samples}
+
+        return samples[0]
+
+    @staticmethod
+    def _encode_samples(samples, batched):
+        if not samples:
+            raise ValueError('Nothing to encode.')
+
+        receiver_count = len(samples[0]['rssi'])
+        values = []
+        for sample in samples:
+            if not _SAMPLE_KEYS.issuperset(sample):
+                raise ValueError('Sample has fields we cannot pack.')
+            if len(sample['rssi']) != receiver_count:
+                raise ValueError('Receiver count changed mid-batch.')
+            values.extend(sample['rssi'])
+
+        flags = _FLAG_BATCH if batched else 0
+        has_sequence = all('sequence' in s for s in samples)
+        if has_sequence:
+            flags = flags | _FLAG_SEQUENCE
+
+        value_type, values = _pack_values(values)
+        header = BINARY_HEADER.pack(
+            BINARY_MAGIC,
+            BINARY_VERSION,
+            flags,
+            value_type,
+            receiver_count,
+            len(samples))
+
+        parts = [
+            header,
+            _to_little_endian(
+                array.array('d', [s['timestamp'] for s in samples]))
+        ]
+
+        if has_sequence:
+            parts.append(_to_little_endian(
+                array.array('I', [s['sequence'] for s in samples])))
+
+        parts.append(_to_little_endian(values))
+
+        return b''.join(parts)
+
+
+CODECS = {
+    JsonCodec.name: JsonCodec(),
+    RssiBinaryCodec.name: RssiBinaryCodec(),
+}
+DEFAULT_CODEC = CODECS[JsonCodec.name]
+
+
+def get_codec(name):
+    if name not in CODECS:
+        raise ValueError('Unknown codec ({}).'.format(name))
+
+    return CODECS[name]
+
+
+def unpack_batch(data):
+    if isinstance(data, dict) and BATCH_KEY in data:
+        return data[BATCH_KEY]
+
+    return [data]
+
+
+def decode(payload):
+    # Messages describe their own format, so any codec can read any payload.
+    return CODECS[RssiBinaryCodec.name].decode(payload)
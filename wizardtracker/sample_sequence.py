@@ -0,0 +1,81 @@
+import logging
+import time
+
+from wizardtracker import metrics
+
+
+# Sequence numbers go out as uint32 in the binary formats.
+SEQUENCE_MODULUS = 2 ** 32
+LOG_INTERVAL = 5
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SequenceGapCounter:
+    # Watches the sequence numbers on one channel and counts the samples that
+    # never turned up. The device service starts over from 0 when it
+    # restarts, so a sequence that goes backwards starts a new run rather
+    # than counting as a gap.
+
+    def __init__(self, name):
+        self.name = name
+        self.sample_count = 0
+        self.gap_count = 0
+        self.missing_count = 0
+
+        self._missing_total = metrics.counter(
+            'wizardtracker_sequence_missing_total',
+            'Samples missing from the sequence, by channel.',
+            channel=name)
+
+        self._last_sequence = None
+        self._last_log_time = 0
+        self._last_log_missing = 0
+
+    def check(self, sample):
+        sequence = sample.get('sequence')
+        if sequence is None:
+            return 0
+
+        self.sample_count = self.sample_count + 1
+
+        last_sequence = self._last_sequence
+        self._last_sequence = sequence
+        if last_sequence is None:
+            return 0
+
+        step = (sequence - last_sequence) % SEQUENCE_MODULUS
+        if step == 1 or step == 0 or step > SEQUENCE_MODULUS // 2:
+            return 0
+
+        missing = step - 1
+        self.gap_count = self.gap_count + 1
+        self.missing_count = self.missing_count + missing
+        self._missing_total.inc(missing)
+        self._log_gaps()
+
+        return missing
+
+    def reset(self):
+        self._last_sequence = None
+
+    def as_dict(self):
+        return {
+            'samples': self.sample_count,
+            'gaps': self.gap_count,
+            'missing': self.missing_count,
+        }
+
+    def _log_gaps(self):
+        # Under load this can happen on every message, so summarise.
+        now = time.perf_counter()
+        if now - self._last_log_time < LOG_INTERVAL:
+            return
+
+        LOGGER.warning(
+            'Missed %d samples on %s (%d in total).',
+            self.missing_count - self._last_log_missing,
+            self.name,
+            self.missing_count)
+        self._last_log_time = now
+        self._last_log_missing = self.missing_count
@@ -0,0 +1,283 @@
+import asyncio
+import errno
+import mmap
+import os
+import socket
+import struct
+import time
+
+
+RING_DIRECTORY = '/dev/shm/wizardtracker'
+RING_CAPACITY = 4096
+MAX_RECEIVERS = 32
+READER_SCAN_INTERVAL = 1
+
+RING_MAGIC = b'WTRB'
+RING_VERSION = 2
+RING_HEADER = struct.Struct('<4sIII')
+RING_HEADER_SIZE = 64
+WRITE_COUNT = struct.Struct('<Q')
+WRITE_COUNT_OFFSET = RING_HEADER.size
+
+# Each record starts with a stamp (its index + 1) that's written last, so a
+# reader can tell a finished record from one that's being overwritten.
+RECORD_STAMP = struct.Struct('<Q')
+RECORD_FIELDS = struct.Struct('<dIBB2x')
+# Doubles, so filtered RSSI comes through exactly as it would over Redis.
+RECORD_VALUES = struct.Struct('<{}d'.format(MAX_RECEIVERS))
+RECORD_SIZE = RECORD_STAMP.size + RECORD_FIELDS.size + RECORD_VALUES.size
+
+_FLAG_SEQUENCE = 0x01
+_FLAG_INTEGER = 0x02
+
+_SAMPLE_KEYS = {'timestamp', 'rssi', 'sequence'}
+
+
+def _ring_path(directory, name):
+    return os.path.join(directory, '{}.ring'.format(name))
+
+
+def _readers_path(directory, name):
+    return os.path.join(directory, '{}.readers'.format(name))
+
+
+def _open_ring(directory, name, capacity):
+    os.makedirs(_readers_path(directory, name), exist_ok=True)
+    path = _ring_path(directory, name)
+    size = RING_HEADER_SIZE + capacity * RECORD_SIZE
+
+    # Build the ring off to the side and link it into place, so nobody ever
+    # maps a half-initialised file.
+    if not os.path.exists(path):
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(RING_HEADER.pack(
+                RING_MAGIC, RING_VERSION, capacity, RECORD_SIZE))
+            f.truncate(size)
+
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+
+    with open(path, 'r+b') as f:
+        ring = mmap.mmap(f.fileno(), size)
+
+    magic, version, ring_capacity, record_size = RING_HEADER.unpack_from(ring)
+    if (magic, version, ring_capacity, record_size) != \
+            (RING_MAGIC, RING_VERSION, capacity, RECORD_SIZE):
+        ring.close()
+        raise ValueError(
+            'Ring buffer at {} has a different layout. Remove it and '
+            'restart.'.format(path))
+
+    return ring
+
+
+class ShmRingWriter:
+    def __init__(self, name, directory=RING_DIRECTORY, capacity=RING_CAPACITY):
+        self._name = name
+        self._directory = directory
+        self._capacity = capacity
+
+        self._ring = _open_ring(directory, name, capacity)
+        self._write_count = WRITE_COUNT.unpack_from(
+            self._ring, WRITE_COUNT_OFFSET)[0]
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._reader_paths = set()
+        self._last_scan = 0
+
+    def write(self, samples):
+        for sample in samples:
+            self._write_record(self._write_count, sample)
+            self._write_count = self._write_count + 1
+
+        WRITE_COUNT.pack_into(
+            self._ring, WRITE_COUNT_OFFSET, self._write_count)
+        self._notify_readers()
+
+    def close(self):
+        self._socket.close()
+        self._ring.close()
+
+    def _write_record(self, index, sample):
+        if not _SAMPLE_KEYS.issuperset(sample):
+            raise ValueError('Sample has fields the ring buffer cannot hold.')
+
+        rssi = sample['rssi']
+        if len(rssi) > MAX_RECEIVERS:
+            raise ValueError('Too many receivers for the ring buffer.')
+
+        flags = 0
+        if 'sequence' in sample:
+            flags = flags | _FLAG_SEQUENCE
+        if all(isinstance(r, int) for r in rssi):
+            flags = flags | _FLAG_INTEGER
+
+        values = list(rssi) + [0] * (MAX_RECEIVERS - len(rssi))
+        offset = RING_HEADER_SIZE + (index % self._capacity) * RECORD_SIZE
+
+        RECORD_STAMP.pack_into(self._ring, offset, 0)
+        RECORD_FIELDS.pack_into(
+            self._ring,
+            offset + RECORD_STAMP.size,
+            sample['timestamp'],
+            sample.get('sequence', 0),
+            flags,
+            len(rssi))
+        RECORD_VALUES.pack_into(
+            self._ring,
+            offset + RECORD_STAMP.size + RECORD_FIELDS.size,
+            *values)
+        RECORD_STAMP.pack_into(self._ring, offset, index + 1)
+
+    def _notify_readers(self):
+        now = time.monotonic()
+        if now - self._last_scan >= READER_SCAN_INTERVAL:
+            readers_path = _readers_path(self._directory, self._name)
+            self._reader_paths = set(
+                os.path.join(readers_path, p)
+                for p in os.listdir(readers_path))
+            self._last_scan = now
+
+        for path in list(self._reader_paths):
+            try:
+                self._socket.sendto(b'\0', path)
+            except BlockingIOError:
+                # Their queue is full, so they've got a wakeup coming anyway.
+                pass
+            except OSError as err:
+                self._reader_paths.discard(path)
+                if err.errno == errno.ECONNREFUSED:
+                    # Left behind by a reader that didn't shut down cleanly.
+                    os.unlink(path)
+
+
+class ShmRingReader:
+    def __init__(self, name, directory=RING_DIRECTORY, capacity=RING_CAPACITY):
+        self._capacity = capacity
+        self._ring = _open_ring(directory, name, capacity)
+
+        # Like pub/sub, we only see what's written after we show up.
+        self._cursor = self._write_count()
+        self.dropped_count = 0
+
+        self._socket_path = os.path.join(
+            _readers_path(directory, name),
+            '{}-{}.sock'.format(os.getpid(), id(self)))
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._socket_path)
+
+    def ready(self):
+        return self._cursor < self._write_count()
+
+    def fileno(self):
+        # Readable when the writer's woken us up, for waiting on with select.
+        return self._socket.fileno()
+
+    def wait(self, timeout):
+        if self.ready():
+            return
+
+        self._socket.settimeout(timeout)
+        try:
+            self._socket.recv(16)
+        except (socket.timeout, BlockingIOError):
+            return
+
+        self._drain_wakeups()
+
+    async def wait_async(self, timeout):
+        if self.ready():
+            return
+
+        self._socket.setblocking(False)
+        loop = asyncio.get_event_loop()
+        try:
+            await asyncio.wait_for(loop.sock_recv(self._socket, 16), timeout)
+        except asyncio.TimeoutError:
+            return
+
+        self._drain_wakeups()
+
+    def read(self, max_count=None):
+        # Before looking at the write count, so a wakeup for anything written
+        # after this is kept for the next wait.
+        self._drain_wakeups()
+
+        write_count = self._write_count()
+        if self._cursor > write_count:
+            # The writer started over with a fresh ring.
+            self._cursor = write_count
+
+        oldest = write_count - self._capacity
+        if self._cursor < oldest:
+            self.dropped_count = self.dropped_count + oldest - self._cursor
+            self._cursor = oldest
+
+        end = write_count
+        if max_count is not None:
+            end = min(end, self._cursor + max_count)
+
+        samples = []
+        while self._cursor < end:
+            sample = self._read_record(self._cursor)
+            if sample is None:
+                break
+
+            samples.append(sample)
+            self._cursor = self._cursor + 1
+
+        return samples
+
+    def close(self):
+        self._socket.close()
+        try:
+            os.unlink(self._socket_path)
+        except FileNotFoundError:
+            pass
+        self._ring.close()
+
+    def _drain_wakeups(self):
+        # Soak up any other wakeups, we're about to read everything anyway.
+        self._socket.setblocking(False)
+        try:
+            while True:
+                self._socket.recv(16)
+        except BlockingIOError:
+            pass
+
+    def _write_count(self):
+        return WRITE_COUNT.unpack_from(self._ring, WRITE_COUNT_OFFSET)[0]
+
+    def _read_record(self, index):
+        offset = RING_HEADER_SIZE + (index % self._capacity) * RECORD_SIZE
+
+        stamp = RECORD_STAMP.unpack_from(self._ring, offset)[0]
+        timestamp, sequence, flags, receiver_count = RECORD_FIELDS.unpack_from(
+            self._ring, offset + RECORD_STAMP.size)
+        values = RECORD_VALUES.unpack_from(
+            self._ring, offset + RECORD_STAMP.size + RECORD_FIELDS.size)
+
+        # Either not finished yet or overwritten while we were reading it.
+        if stamp != index + 1 or \
+                RECORD_STAMP.unpack_from(self._ring, offset)[0] != stamp:
+            return None
+
+        rssi = list(values[:receiver_count])
+        if flags & _FLAG_INTEGER:
+            rssi = [int(r) for r in rssi]
+
+        sample = {
+            'timestamp': timestamp,
+            'rssi': rssi
+        }
+
+        if flags & _FLAG_SEQUENCE:
+            sample['sequence'] = sequence
+
+        return sample
@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import logging
 import sys
@@ -6,24 +7,63 @@ import time
 
 import coloredlogs
 
+from wizardtracker.config import (
+    get_config,
+    get_database_options,
+    get_pubsub_options
+)
+from wizardtracker.models import configure_database
+from wizardtracker.models.migrations import migrate
+from wizardtracker.models.rssi_chunks import CHUNK_DURATION, CHUNK_SIZE
 from wizardtracker.timing_service.api import TimingServiceApiServer
+from wizardtracker.timing_service.filters import parse_filter_specs
 from wizardtracker.timing_service.processor import DataProcessor
 from wizardtracker.timing_service.recorder import DataRecorder
+from wizardtracker.timing_service.timing import DETECTION_PARAMETERS
+from wizardtracker.timing_service.write_behind import (
+    BLOCK,
+    QUEUE_SIZE,
+    SPILL_DIRECTORY
+)
+from wizardtracker.wsgi_api_server import WORKER_COUNT
 
 
 LOGGER = logging.getLogger(__name__)
 
 
 class Runner:
-    def __init__(self):
-        self._processor = DataProcessor()
-        self._recorder = DataRecorder()
-        self._api = TimingServiceApiServer(self._recorder, '127.0.0.1', 3092)
-
-        self._processor_thread = threading.Thread(
-            target=self._processor.start)
-        self._recorder_thread = threading.Thread(
-            target=self._recorder.start)
+    def __init__(self, use_asyncio=False):
+        self._config = get_config()
+
+        # Before any of the threads connect.
+        configure_database(**get_database_options(self._config))
+        migrate()
+
+        pubsub_options = get_pubsub_options(self._config)
+        self._detection_parameters = self._get_detection_parameters()
+
+        self._processor = DataProcessor(
+            pubsub_options,
+            filters=parse_filter_specs(
+                self._config.get('processor', 'filters', fallback='')))
+        self._recorder = self._create_recorder(pubsub_options)
+        self._api = TimingServiceApiServer(
+            self._recorder,
+            '127.0.0.1',
+            3092,
+            worker_count=self._config['api'].getint(
+                'workers', fallback=WORKER_COUNT),
+            detection_parameters=self._detection_parameters)
+
+        if use_asyncio:
+            # Processor and recorder share one event loop on one thread.
+            self._service_threads = [
+                threading.Thread(target=self._run_event_loop)]
+        else:
+            self._service_threads = [
+                threading.Thread(target=self._processor.start),
+                threading.Thread(target=self._recorder.start)]
+
         self._api_thread = threading.Thread(
             target=self._api.start)
 
@@ -35,23 +75,56 @@ class Runner:
 
         LOGGER.info('Starting threads...')
 
-        self._processor_thread.start()
-        self._recorder_thread.start()
+        for thread in self._service_threads:
+            thread.start()
         self._api_thread.start()
 
         while True:
             time.sleep(1)
 
+    def _get_detection_parameters(self):
+        if not self._config.has_section('timing'):
+            return DETECTION_PARAMETERS
+
+        timing = self._config['timing']
+        return {
+            'baseline_degree': timing.getint(
+                'baseline_degree',
+                fallback=DETECTION_PARAMETERS['baseline_degree']),
+            'peak_threshold': timing.getfloat(
+                'peak_threshold',
+                fallback=DETECTION_PARAMETERS['peak_threshold']),
+            'peak_min_distance': timing.getint(
+                'peak_min_distance',
+                fallback=DETECTION_PARAMETERS['peak_min_distance']),
+        }
+
+    def _create_recorder(self, pubsub_options):
+        if not self._config.has_section('recorder'):
+            return DataRecorder(
+                pubsub_options,
+                detection_parameters=self._detection_parameters)
+
+        recorder = self._config['recorder']
+        return DataRecorder(
+            pubsub_options,
+            chunk_size=recorder.getint('chunk_size', fallback=CHUNK_SIZE),
+            chunk_duration=recorder.getfloat(
+                'chunk_seconds', fallback=CHUNK_DURATION),
+            queue_size=recorder.getint('queue_size', fallback=QUEUE_SIZE),
+            queue_policy=recorder.get('queue_policy', fallback=BLOCK),
+            spill_directory=recorder.get(
+                'spill_directory', fallback='') or SPILL_DIRECTORY,
+            detection_parameters=self._detection_parameters)
+
     def _exit_handler(self, signum, frame):
         LOGGER.info('Stopping threads...')
 
-        LOGGER.debug('Waiting for processor thread...')
+        LOGGER.debug('Waiting for processor and recorder...')
         self._processor.stop()
-        self._processor_thread.join()
-
-        LOGGER.debug('Waiting for recorder thread...')
         self._recorder.stop()
-        self._recorder_thread.join()
+        for thread in self._service_threads:
+            thread.join()
 
         LOGGER.debug('Waiting for API server thread...')
         self._api.stop()
@@ -59,3 +132,12 @@ class Runner:
 
         LOGGER.info('Bye!')
         sys.exit(0)
+
+    def _run_event_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        loop.run_until_complete(asyncio.gather(
+            self._processor.start_async(),
+            self._recorder.start_async()))
+        loop.close()
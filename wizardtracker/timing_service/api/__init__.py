@@ -1,7 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
-from wizardtracker.wsgi_api_server import ApiServer
-from wizardtracker.timing_service.timing import get_times
+from wizardtracker import metrics
+from wizardtracker.wsgi_api_server import WORKER_COUNT, ApiServer
+from wizardtracker.timing_service.lap_results import get_lap_results
+from wizardtracker.timing_service.timing import (
+    DETECTION_PARAMETERS,
+    get_times
+)
 
 APP = Flask(__name__)
 
@@ -25,14 +30,53 @@ def stop_race():
 
 @APP.route('/race/times', methods=['GET'])
 def get_race_times():
-    race_id = request.args.get('id')
-    get_times(race_id)
+    race_id = request.args.get('id', type=int)
+    start_time = request.args.get('start', type=float)
+    end_time = request.args.get('end', type=float)
 
-    return jsonify({
-        'success': '?'
-    })
+    if start_time is not None or end_time is not None:
+        # Part of a race isn't worth storing, so worked out every time.
+        return jsonify({
+            'success': True,
+            'race': race_id,
+            'parameters': APP.detection_parameters,
+            'receivers': get_times(
+                race_id,
+                start_time,
+                end_time,
+                APP.detection_parameters)
+        })
+
+    results = get_lap_results(race_id, APP.detection_parameters)
+    if results is None:
+        return jsonify({
+            'success': False
+        }), 404
+
+    # Stored as JSON already. Pollers that send the ETag back get a 304.
+    response = Response(results, content_type='application/json')
+    response.add_etag()
+    return response.make_conditional(request)
+
+@APP.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 class TimingServiceApiServer(ApiServer):
-    def __init__(self, recorder, host, port):
-        super().__init__(APP, host, port, {'recorder': recorder})
+    def __init__(
+            self,
+            recorder,
+            host,
+            port,
+            worker_count=WORKER_COUNT,
+            detection_parameters=DETECTION_PARAMETERS):
+        super().__init__(
+            APP,
+            host,
+            port,
+            {
+                'recorder': recorder,
+                'detection_parameters': detection_parameters
+            },
+            worker_count)
@@ -0,0 +1,242 @@
+import json
+
+import numpy
+
+from numpy.lib.stride_tricks import as_strided
+
+
+DEFAULT_FILTERS = [{'type': 'ema', 'alpha': 0.05}]
+
+
+def lowpass_filter(last_value, value, alpha=0.05):
+    # The original per-sample filter, kept as the reference EmaFilter has to
+    # match exactly.
+    return last_value + (alpha * (value - last_value))
+
+
+def _per_receiver(value, receiver_count, dtype=numpy.float64):
+    try:
+        values = numpy.asarray(value, dtype=dtype)
+    except TypeError as e:
+        raise ValueError(str(e))
+
+    if values.ndim == 0:
+        return numpy.full(receiver_count, values, dtype=dtype)
+
+    if values.shape != (receiver_count,):
+        raise ValueError('Expected {} values, got {}.'.format(
+            receiver_count, len(values)))
+
+    return values.copy()
+
+
+class RssiFilter:
+    # Filters take a whole batch at a time, shaped (samples, receivers) as
+    # float64, and hand back the same shape. State is per receiver and
+    # starts from the first sample, and any parameter can be either one
+    # value for every receiver or a list with one per receiver.
+    name = None
+
+    def __init__(self, **params):
+        self.params = params
+        self._receiver_count = None
+
+    def process(self, samples):
+        receiver_count = samples.shape[1]
+        if receiver_count != self._receiver_count:
+            self._reset(samples[0])
+            self._receiver_count = receiver_count
+
+        return self._process(samples)
+
+    def as_spec(self):
+        return dict(self.params, type=self.name)
+
+    def _reset(self, first):
+        raise NotImplementedError()
+
+    def _process(self, samples):
+        raise NotImplementedError()
+
+
+class EmaFilter(RssiFilter):
+    name = 'ema'
+
+    def __init__(self, alpha=0.05):
+        super().__init__(alpha=alpha)
+
+        self._alpha = None
+        self._state = None
+
+    def _reset(self, first):
+        self._alpha = _per_receiver(self.params['alpha'], len(first))
+        self._state = first.copy()
+
+    def _process(self, samples):
+        filtered = numpy.empty_like(samples)
+        alpha = self._alpha
+        last = self._state
+        subtract = numpy.subtract
+        multiply = numpy.multiply
+        add = numpy.add
+
+        # Each step depends on the last so the batch goes a row at a time,
+        # but every row does every receiver, straight into the output. Same
+        # operations in the same order as lowpass_filter, so results match
+        # it bit for bit.
+        for row, out in zip(samples, filtered):
+            subtract(row, last, out=out)
+            multiply(alpha, out, out=out)
+            add(last, out, out=out)
+            last = out
+
+        self._state = last.copy()
+
+        return filtered
+
+
+class KalmanFilter(RssiFilter):
+    # Treats each receiver's RSSI as a random walk. More process noise
+    # follows changes faster, more measurement noise smooths harder.
+    name = 'kalman'
+
+    def __init__(self, process_noise=1.0, measurement_noise=50.0):
+        super().__init__(
+            process_noise=process_noise,
+            measurement_noise=measurement_noise)
+
+        self._q = None
+        self._r = None
+        self._x = None
+        self._p = None
+
+    def _reset(self, first):
+        self._q = _per_receiver(self.params['process_noise'], len(first))
+        self._r = _per_receiver(self.params['measurement_noise'], len(first))
+        self._x = first.copy()
+        self._p = self._r.copy()
+
+    def _process(self, samples):
+        filtered = numpy.empty_like(samples)
+        q = self._q
+        r = self._r
+        x = self._x
+        p = self._p
+
+        for i, row in enumerate(samples):
+            p += q
+            gain = p / (p + r)
+            x += gain * (row - x)
+            p *= 1 - gain
+            filtered[i] = x
+
+        return filtered
+
+
+class _WindowFilter(RssiFilter):
+    # Anything computed over the last window samples. The whole batch is
+    # done at once through a strided view of the history plus the batch.
+
+    def __init__(self, window=5):
+        super().__init__(window=window)
+
+        self._groups = None
+        self._history = None
+
+    def _reset(self, first):
+        windows = _per_receiver(
+            self.params['window'], len(first), dtype=numpy.int64)
+        if (windows < 1).any():
+            raise ValueError('Windows need at least one sample.')
+
+        # Receivers sharing a window size are done together, usually that's
+        # all of them.
+        self._groups = [
+            (window, numpy.flatnonzero(windows == window))
+            for window in numpy.unique(windows)]
+        self._history = numpy.tile(first, (windows.max() - 1, 1))
+
+    def _process(self, samples):
+        data = numpy.concatenate((self._history, samples))
+        filtered = numpy.empty_like(samples)
+        sample_count = len(samples)
+
+        for window, receivers in self._groups:
+            start = len(self._history) - (window - 1)
+            values = numpy.ascontiguousarray(data[start:, receivers])
+            windows = as_strided(
+                values,
+                shape=(sample_count, window, len(receivers)),
+                strides=(values.strides[0],) + values.strides,
+                writeable=False)
+            filtered[:, receivers] = self._reduce(windows)
+
+        self._history = data[len(data) - len(self._history):].copy()
+
+        return filtered
+
+    def _reduce(self, windows):
+        raise NotImplementedError()
+
+
+class MovingAverageFilter(_WindowFilter):
+    name = 'mean'
+
+    def _reduce(self, windows):
+        return windows.mean(axis=1)
+
+
+class MedianFilter(_WindowFilter):
+    name = 'median'
+
+    def _reduce(self, windows):
+        return numpy.median(windows, axis=1)
+
+
+FILTER_TYPES = {
+    f.name: f
+    for f in (EmaFilter, KalmanFilter, MovingAverageFilter, MedianFilter)}
+
+
+class FilterChain:
+    def __init__(self, filters):
+        self.filters = list(filters)
+
+    def process(self, samples):
+        for rssi_filter in self.filters:
+            samples = rssi_filter.process(samples)
+
+        return samples
+
+    def as_specs(self):
+        return [rssi_filter.as_spec() for rssi_filter in self.filters]
+
+
+def create_filter(spec):
+    if not isinstance(spec, dict):
+        raise ValueError('Filters should be objects ({}).'.format(spec))
+
+    params = dict(spec)
+    name = params.pop('type', None)
+    if name not in FILTER_TYPES:
+        raise ValueError('Unknown filter ({}).'.format(name))
+
+    try:
+        return FILTER_TYPES[name](**params)
+    except TypeError as e:
+        raise ValueError('Bad parameters for {} filter ({}).'.format(name, e))
+
+
+def create_filter_chain(specs):
+    # Specs look like [{"type": "ema", "alpha": 0.05}, ...], in order.
+    if not isinstance(specs, list):
+        raise ValueError('Filters should be a list.')
+
+    return FilterChain([create_filter(spec) for spec in specs])
+
+
+def parse_filter_specs(text):
+    if not text or not text.strip():
+        return DEFAULT_FILTERS
+
+    return json.loads(text)
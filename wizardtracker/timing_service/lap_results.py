@@ -0,0 +1,110 @@
+import json
+import logging
+
+from peewee import OperationalError, fn
+
+from wizardtracker import metrics
+from wizardtracker.models import (
+    Race,
+    RaceLapResult,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.timing_service.timing import (
+    DETECTION_PARAMETERS,
+    get_times
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+_CACHE_RESULTS = {
+    result: metrics.counter(
+        'wizardtracker_lap_results_total',
+        'Lap results served, and whether they had to be worked out.',
+        result=result)
+    for result in ('hit', 'computed')}
+
+
+def _dump_parameters(parameters):
+    return json.dumps(parameters, sort_keys=True)
+
+
+def compute_lap_results(race_id, parameters=DETECTION_PARAMETERS):
+    # Works the laps out and stores them, replacing whatever was there.
+    _CACHE_RESULTS['computed'].inc()
+
+    results = None
+    rssi_version = None
+    try:
+        # Reading and storing in one transaction means that if RSSI came in
+        # after the read, SQLite refuses the write rather than letting
+        # laps that are already stale be stored.
+        with RaceLapResult._meta.database.atomic():
+            rssi_version = _rssi_version(race_id)
+            results = _dump_results(race_id, parameters)
+            RaceLapResult \
+                .insert(
+                    race=race_id,
+                    parameters=_dump_parameters(parameters),
+                    results=results) \
+                .on_conflict_replace() \
+                .execute()
+    except OperationalError:
+        if results is None:
+            raise
+
+        # SQLite says "database is locked" for that and for plenty else
+        # (a busy timeout, say), so check the RSSI really did change.
+        if _rssi_version(race_id) != rssi_version:
+            # Still right as of when they were read, just not worth keeping.
+            LOGGER.debug('Race %s changed while working out laps.', race_id)
+        else:
+            LOGGER.exception('Failed to store laps for race %s.', race_id)
+
+    return results
+
+
+def _rssi_version(race_id):
+    # Changes whenever RSSI is added to or removed from the race.
+    receivers = RaceReceiver \
+        .select(RaceReceiver.id) \
+        .where(RaceReceiver.race == race_id)
+
+    return tuple(
+        model
+        .select(fn.COUNT(model.id), fn.MAX(model.id))
+        .where(model.receiver.in_(receivers))
+        .tuples()
+        .get()
+        for model in (RaceRssiChunk, RaceRssi))
+
+
+def _dump_results(race_id, parameters):
+    return json.dumps({
+        'success': True,
+        'race': race_id,
+        'parameters': parameters,
+        'receivers': get_times(race_id, parameters=parameters),
+    })
+
+
+def get_lap_results(race_id, parameters=DETECTION_PARAMETERS):
+    # JSON for /race/times, or None if there's no such race. Only worked
+    # out again when the stored laps were found with other parameters, or
+    # a trigger dropped them because the race's RSSI changed.
+    stored = RaceLapResult \
+        .select(RaceLapResult.parameters, RaceLapResult.results) \
+        .where(RaceLapResult.race == race_id) \
+        .first()
+
+    if stored and stored.parameters == _dump_parameters(parameters):
+        _CACHE_RESULTS['hit'].inc()
+        return stored.results
+
+    if not Race.select().where(Race.id == race_id).exists():
+        return None
+
+    LOGGER.debug('Working out laps for race %s.', race_id)
+    return compute_lap_results(race_id, parameters)
@@ -1,57 +1,134 @@
 import logging
+import time
 
-from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+import numpy
 
+from wizardtracker import metrics
+from wizardtracker.async_redis_pubsub import AsyncNiceRedisPubsub
+from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+from wizardtracker.sample_sequence import SequenceGapCounter
+from wizardtracker.timing_service.filters import (
+    DEFAULT_FILTERS,
+    create_filter_chain
+)
 
-LOGGER = logging.getLogger(__name__)
 
+# Publish {"filters": [...]} here to swap the filter chain while running.
+CONTROL_CHANNEL = 'processorControl'
 
-def lowpass_filter(last_value, value, alpha=0.05):
-    return last_value + (alpha * (value - last_value))
+LOGGER = logging.getLogger(__name__)
 
 
 class DataProcessor:
-    def __init__(self):
+    def __init__(self, pubsub_options=None, filters=None):
         self._should_stop = False
-        self._last_filtered_rssi = None
+        self._filters = create_filter_chain(filters or DEFAULT_FILTERS)
+        self.rssi_raw_gaps = SequenceGapCounter('rssiRaw')
 
-        self._redis = NiceRedisPubsub()
+        self._received_age = metrics.sample_age_seconds('processor')
+        self._filter_seconds = metrics.stage_seconds('filter')
+
+        self._pubsub_options = pubsub_options or {}
+        self._redis = NiceRedisPubsub(
+            consumer_group='processor',
+            **self._pubsub_options)
 
     def start(self):
         LOGGER.info('Starting up...')
 
         self._redis.connect()
-        self._redis.subscribe('rssiRaw', self._rssi_raw_cb)
+        self._redis.subscribe('rssiRaw', self._rssi_raw_cb, batch=True)
+        self._redis.subscribe(CONTROL_CHANNEL, self._control_cb)
 
         while not self._should_stop:
             self._loop()
 
         LOGGER.info('Shutting down...')
+        self._redis.close()
 
-    def stop(self):
-        self._should_stop = True
-
-    def _loop(self):
-        self._redis.tick_messages()
+    async def start_async(self):
+        LOGGER.info('Starting up (asyncio)...')
 
-    def _rssi_raw_cb(self, data):
-        timestamp = data['timestamp']
-        rssi = data['rssi']
+        self._redis = AsyncNiceRedisPubsub(
+            consumer_group='processor',
+            **self._pubsub_options)
+        await self._redis.connect()
+        await self._redis.subscribe('rssiRaw', self._rssi_raw_cb, batch=True)
+        await self._redis.subscribe(CONTROL_CHANNEL, self._control_cb)
 
-        filtered_rssi = self._filter_rssi(self._last_filtered_rssi, rssi)
-        self._last_filtered_rssi = filtered_rssi
+        while not self._should_stop:
+            await self._redis.tick_messages()
 
-        self._redis.publish('rssiFiltered', {
-            'rssi': filtered_rssi,
-            'timestamp': timestamp
-        })
+        LOGGER.info('Shutting down...')
+        await self._redis.aclose()
 
-    @staticmethod
-    def _filter_rssi(last_filtered_rssi, rssi):
-        if not last_filtered_rssi:
-            last_filtered_rssi = list(rssi)
+    def stop(self):
+        self._should_stop = True
 
-        rssi_with_last = zip(last_filtered_rssi, rssi)
-        filtered_rssi = [lowpass_filter(l, v) for l, v in rssi_with_last]
+    def _loop(self):
+        self._redis.tick_messages()
 
-        return filtered_rssi
+    def _control_cb(self, data):
+        if not isinstance(data, dict) or 'filters' not in data:
+            LOGGER.error('Ignoring control message %r.', data)
+            return
+
+        # Both callbacks run on the same thread, so the chain never changes
+        # halfway through a batch.
+        try:
+            self._filters = create_filter_chain(data['filters'])
+        except ValueError as e:
+            LOGGER.error('Ignoring filters %s (%s).', data['filters'], e)
+            return
+
+        LOGGER.info('Filters changed to %s.', self._filters.as_specs())
+
+    def _rssi_raw_cb(self, samples):
+        received_time = time.perf_counter()
+        for sample in samples:
+            self.rssi_raw_gaps.check(sample)
+            self._received_age.observe(received_time - sample['timestamp'])
+
+        try:
+            rssi = numpy.array(
+                [sample['rssi'] for sample in samples],
+                dtype=numpy.float64)
+        except ValueError:
+            # Receiver count changed partway through, take them one by one.
+            for sample in samples:
+                self._rssi_raw_cb([sample])
+            return
+
+        try:
+            filtered_rssi = self._filters.process(rssi).tolist()
+        except ValueError as e:
+            LOGGER.error(
+                'Filters %s failed (%s), going back to %s.',
+                self._filters.as_specs(),
+                e,
+                DEFAULT_FILTERS)
+            self._filters = create_filter_chain(DEFAULT_FILTERS)
+            filtered_rssi = self._filters.process(rssi).tolist()
+
+        filtered_samples = []
+        for sample, filtered in zip(samples, filtered_rssi):
+            filtered_data = {
+                'rssi': filtered,
+                'timestamp': sample['timestamp']
+            }
+
+            # Pass the device's sequence along so later consumers can spot
+            # gaps too.
+            if 'sequence' in sample:
+                filtered_data['sequence'] = sample['sequence']
+
+            filtered_samples.append(filtered_data)
+
+        if len(filtered_samples) == 1:
+            self._redis.publish('rssiFiltered', filtered_samples[0])
+        else:
+            self._redis.publish_batch('rssiFiltered', filtered_samples)
+
+        self._filter_seconds.observe(
+            time.perf_counter() - received_time,
+            len(samples))
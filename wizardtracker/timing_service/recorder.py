@@ -1,38 +1,111 @@
 import logging
 import threading
-import requests
+import time
 
+import numpy
 
-from wizardtracker.models import DB, Race, RaceReceiver, RaceRssi
+from wizardtracker import metrics
+from wizardtracker.async_redis_pubsub import AsyncNiceRedisPubsub
+from wizardtracker.device_client import DEVICE_CLIENT
+from wizardtracker.models import DB, Race, RaceReceiver, RaceRssiChunk
+from wizardtracker.models.rssi_chunks import (
+    CHUNK_DURATION,
+    CHUNK_SIZE,
+    encode_chunk
+)
 from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+from wizardtracker.sample_sequence import SequenceGapCounter
+from wizardtracker.timing_service.lap_results import compute_lap_results
+from wizardtracker.timing_service.timing import DETECTION_PARAMETERS
+from wizardtracker.timing_service.write_behind import (
+    BLOCK,
+    QUEUE_SIZE,
+    SPILL_DIRECTORY,
+    WriteBehindQueue
+)
 
 
-DEVICE_BASE_URL = 'http://127.0.0.1:3091'
-INSERT_BATCH_SIZE = 100
 LOGGER = logging.getLogger(__name__)
 
 
 class DataRecorder:
-    def __init__(self):
+    def __init__(
+            self,
+            pubsub_options=None,
+            chunk_size=CHUNK_SIZE,
+            chunk_duration=CHUNK_DURATION,
+            queue_size=QUEUE_SIZE,
+            queue_policy=BLOCK,
+            spill_directory=SPILL_DIRECTORY,
+            detection_parameters=DETECTION_PARAMETERS):
         self._lock = threading.Lock()
         self._should_stop = False
 
         self._recording = False
         self._current_race = None
-        self._current_receivers = None
-        self._current_rssi_batch = None
+        self._current_receiver_ids = None
+        self._current_timestamps = None
+        self._current_rssi = None
+        self._current_chunk_time = None
+        self._chunk_size = chunk_size
+        self._chunk_duration = chunk_duration
+        self._detection_parameters = detection_parameters
+        self.rssi_filtered_gaps = SequenceGapCounter('rssiFiltered')
 
-        self._redis = NiceRedisPubsub()
+        # Chunks are committed on their own thread, so Redis keeps being
+        # read while SQLite works. The chunk lock covers handing one over,
+        # which happens on both the Redis thread and in stop_race.
+        self._chunk_lock = threading.Lock()
+        self._write_queue = WriteBehindQueue(
+            'recorder',
+            self._insert_rssi_chunk,
+            size=queue_size,
+            policy=queue_policy,
+            spill_directory=spill_directory,
+            recover=self._recover_rssi_chunk)
+
+        self._pubsub_options = pubsub_options or {}
+        self._redis = NiceRedisPubsub(
+            consumer_group='recorder',
+            **self._pubsub_options)
+
+        self._received_age = metrics.sample_age_seconds('recorder')
+        self._commit_seconds = metrics.stage_seconds('recorder_commit')
+        self._recorded_rows = metrics.counter(
+            'wizardtracker_recorded_rows_total',
+            'RSSI values (one per receiver per sample) committed to SQLite.')
 
     def start(self):
         LOGGER.info('Starting up...')
 
+        self._write_queue.start()
         self._redis.connect()
         self._redis.subscribe('rssiFiltered', self._rssi_filtered_cb)
 
         while not self._should_stop:
             self._loop()
 
+        self._redis.close()
+        self._close_write_queue()
+
+    async def start_async(self):
+        LOGGER.info('Starting up (asyncio)...')
+
+        # With the block policy a full queue holds up the event loop too.
+        self._write_queue.start()
+        self._redis = AsyncNiceRedisPubsub(
+            consumer_group='recorder',
+            **self._pubsub_options)
+        await self._redis.connect()
+        await self._redis.subscribe('rssiFiltered', self._rssi_filtered_cb)
+
+        while not self._should_stop:
+            await self._redis.tick_messages()
+            self._flush_if_due()
+
+        await self._redis.aclose()
+        self._close_write_queue()
+
     def stop(self):
         self._should_stop = True
 
@@ -43,10 +116,10 @@ class DataRecorder:
 
             LOGGER.info('Starting race (%s)', name)
 
-            status = requests.get(DEVICE_BASE_URL + '/status').json()
+            status = DEVICE_CLIENT.status()
             with DB.atomic():
                 self._current_race = Race.create(name=name)
-                self._current_receivers = []
+                self._current_receiver_ids = []
 
                 for i in range(status['receiverCount']):
                     receiver = RaceReceiver.create(
@@ -54,10 +127,12 @@ class DataRecorder:
                         frequency=status['frequencies'][i],
                         race=self._current_race)
 
-                    self._current_receivers.append(receiver)
+                    self._current_receiver_ids.append(receiver.id)
+
+            with self._chunk_lock:
+                self._start_chunk()
+                self._recording = True
 
-            self._current_rssi_batch = []
-            self._recording = True
             return True
 
     def stop_race(self):
@@ -67,48 +142,116 @@ class DataRecorder:
 
             LOGGER.info('Stoping race (%s)...', self._current_race.name)
 
-            self._write_rssi_batch()
+            with self._chunk_lock:
+                self._recording = False
+                self._flush_rssi_chunk()
+
+            # Everything from the race is in before it's marked complete.
+            self._write_queue.drain()
+
             self._current_race.complete = True
             self._current_race.save()
+            race = self._current_race
 
-            self._recording = False
-            return True
+        # Once, so /race/times just reads them back. It works them out
+        # itself if this fails.
+        try:
+            compute_lap_results(race.id, self._detection_parameters)
+        except Exception:
+            LOGGER.exception('Failed to work out laps for %s.', race.name)
+
+        return True
 
     def _loop(self):
         self._redis.tick_messages()
+        self._flush_if_due()
 
     def _rssi_filtered_cb(self, data):
+        self.rssi_filtered_gaps.check(data)
         if not self._recording:
             return
 
         timestamp = data['timestamp']
         rssi_data = data['rssi']
 
-        for index, rssi in enumerate(rssi_data):
-            self._current_rssi_batch.append((
-                timestamp,
-                self._current_receivers[index],
-                rssi
-            ))
+        now = time.perf_counter()
+        self._received_age.observe(now - timestamp)
+
+        with self._chunk_lock:
+            # stop_race may have got in first.
+            if not self._recording:
+                return
+
+            receiver_count = len(self._current_receiver_ids)
+            if len(rssi_data) < receiver_count:
+                LOGGER.debug('Skipping sample without every receiver.')
+                return
 
-        if self._should_write_rssi_batch:
-            self._write_rssi_batch()
+            if not self._current_timestamps:
+                self._current_chunk_time = now
+
+            self._current_timestamps.append(timestamp)
+            self._current_rssi.append(rssi_data[:receiver_count])
+
+            if len(self._current_timestamps) >= self._chunk_size or \
+                    now - self._current_chunk_time >= self._chunk_duration:
+                self._flush_rssi_chunk()
+
+    def _flush_if_due(self):
+        # Quiet periods still get written within the chunk duration.
+        if not self._current_timestamps:
+            return
+
+        with self._chunk_lock:
+            if not self._current_timestamps:
+                return
+
+            age = time.perf_counter() - self._current_chunk_time
+            if age >= self._chunk_duration:
+                self._flush_rssi_chunk()
+
+    def _start_chunk(self):
+        self._current_timestamps = []
+        self._current_rssi = []
+
+    def _flush_rssi_chunk(self):
+        # Only with the chunk lock held.
+        if not self._current_timestamps:
+            return
+
+        self._write_queue.put((
+            self._current_receiver_ids,
+            self._current_timestamps,
+            self._current_rssi,
+            time.perf_counter()))
+        self._start_chunk()
+
+    def _close_write_queue(self):
+        with self._chunk_lock:
+            self._flush_rssi_chunk()
+
+        self._write_queue.close()
+
+    def _insert_rssi_chunk(self, chunk):
+        receiver_ids, timestamps, rssi, queued_at = chunk
+
+        # Encoding happens here too, off the Redis thread.
+        rssi = numpy.array(rssi)
+        rows = [
+            dict(encode_chunk(timestamps, rssi[:, i]), receiver=receiver_id)
+            for i, receiver_id in enumerate(receiver_ids)]
 
-    def _write_rssi_batch(self):
         with DB.atomic():
-            insert_fields = [
-                RaceRssi.timestamp,
-                RaceRssi.receiver,
-                RaceRssi.value]
-
-            RaceRssi \
-                .insert_many(
-                    self._current_rssi_batch,
-                    fields=insert_fields) \
-                .execute()
-
-            self._current_rssi_batch = []
-
-    @property
-    def _should_write_rssi_batch(self):
-        return len(self._current_rssi_batch) > INSERT_BATCH_SIZE
+            RaceRssiChunk.insert_many(rows).execute()
+
+        # From the chunk going on the queue to the commit.
+        if queued_at is not None:
+            self._commit_seconds.observe(time.perf_counter() - queued_at)
+        self._recorded_rows.inc(rssi.size)
+
+    @staticmethod
+    def _recover_rssi_chunk(chunk):
+        # Left over from an earlier run, whose perf_counter() means nothing
+        # to this one, so there's no commit time to measure.
+        receiver_ids, timestamps, rssi, _ = chunk
+        return receiver_ids, timestamps, rssi, None
@@ -1,47 +1,64 @@
+import collections
+
 import peakutils
-import pandas as pd
 import numpy as np
 
-from wizardtracker.models import DB, Race, RaceReceiver, RaceRssi
+from wizardtracker.models import RaceReceiver
+from wizardtracker.models.rssi_chunks import load_rssi
 
 
-def get_times(race_id):
-    receivers = RaceReceiver \
-        .select() \
-        .where(RaceReceiver.race == race_id) \
-        .prefetch(RaceRssi)
+# How passes are picked out of a receiver's RSSI. Anything stored with
+# different ones is out of date.
+DETECTION_PARAMETERS = {
+    'baseline_degree': 2,
+    'peak_threshold': 0.5,
+    'peak_min_distance': 30,
+}
+
 
-    for receiver in receivers:
-        df_data = {
-            'timestamp': [],
-            'rssi': []
-        }
+def find_passes(timestamps, values, parameters=DETECTION_PARAMETERS):
+    # Timestamps of the RSSI peaks, when the quad went past.
+    if len(values) <= parameters['baseline_degree']:
+        return timestamps[:0]
 
-        for rssi in receiver.rssi:
-            df_data['timestamp'].append(rssi.timestamp)
-            df_data['rssi'].append(rssi.value)
+    rssi = values / 255.0
+    rssi = rssi - peakutils.baseline(rssi, parameters['baseline_degree'])
 
-        df = pd.DataFrame(data=df_data)
-        max_timestamp = df['timestamp'].max()
-        df['timestamp'] = max_timestamp - df['timestamp']
-        df['rssi'] = df['rssi'] / 255.0
-        df['rssi_delta'] = -np.gradient(df['rssi'])
+    peak_indices = peakutils.indexes(
+        rssi,
+        thres=parameters['peak_threshold'],
+        min_dist=parameters['peak_min_distance'])
 
-        baseline = peakutils.baseline(df['rssi'], 2)
-        df['rssi'] = df['rssi'] - baseline
+    return timestamps[peak_indices]
 
-        peak_indices = peakutils.indexes(df['rssi'], thres=0.5, min_dist=30)
-        peak_indices = list(reversed(peak_indices))
 
-        for i, peak_index in enumerate(peak_indices):
-            df_row = df.iloc[peak_index]
+def get_times(
+        race_id,
+        start_time=None,
+        end_time=None,
+        parameters=DETECTION_PARAMETERS):
+    # Per receiver, in the shape /race/times returns. Laps run from one
+    # pass to the next.
+    receivers = RaceReceiver \
+        .select() \
+        .where(RaceReceiver.race == race_id) \
+        .order_by(RaceReceiver.receiver_id)
+    receivers = collections.OrderedDict(
+        (receiver.id, receiver) for receiver in receivers)
+
+    rssi = load_rssi(list(receivers), start_time, end_time)
 
-            if i == 0:
-                lap_time = df_row['timestamp']
-            else:
-                df_row_last = df.iloc[peak_indices[i - 1]]
-                lap_time = df_row['timestamp'] - df_row_last['timestamp']
+    times = []
+    for receiver_id, (timestamps, values) in rssi.items():
+        receiver = receivers[receiver_id]
+        durations = np.diff(find_passes(timestamps, values, parameters))
 
-            print('{} - {}s'.format(receiver.id, lap_time))
+        times.append({
+            'receiver': receiver.receiver_id,
+            'frequency': receiver.frequency,
+            'laps': [
+                {'lap': lap, 'duration': duration}
+                for lap, duration in enumerate(durations.tolist(), 1)],
+        })
 
-        print('')
+    return times
@@ -0,0 +1,236 @@
+import collections
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+from wizardtracker import metrics
+
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SPILL = 'spill'
+POLICIES = (BLOCK, DROP_OLDEST, SPILL)
+
+QUEUE_SIZE = 64
+SPILL_DIRECTORY = os.path.join(tempfile.gettempdir(), 'wizardtracker')
+
+LOGGER = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    # Hands batches to a single writer thread, so they're written in the
+    # order they were put. What happens when the writer falls behind and
+    # the queue fills up is down to the policy:
+    #
+    # block: put() waits for room, holding up whoever is putting.
+    # drop_oldest: the oldest queued batch makes way and is counted.
+    # spill: batches go to a file on disk until the writer catches up, and
+    #   anything left there after a crash is written on the next start,
+    #   after going through recover if one was given.
+
+    def __init__(
+            self,
+            name,
+            write,
+            size=QUEUE_SIZE,
+            policy=BLOCK,
+            spill_directory=SPILL_DIRECTORY,
+            recover=None):
+        if policy not in POLICIES:
+            raise ValueError('Unknown queue policy ({}).'.format(policy))
+
+        self._name = name
+        self._write = write
+        self._recover = recover
+        self._size = size
+        self._policy = policy
+        self._spill_directory = spill_directory
+        self._spill_path = os.path.join(
+            spill_directory, '{}.spill'.format(name))
+
+        self._batches = collections.deque()
+        self._spilled = 0
+        self._writing = False
+        self._should_stop = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+        self._depth = metrics.gauge(
+            'wizardtracker_write_queue_batches',
+            'Batches waiting in memory for the writer.',
+            queue=name)
+        self._spilled_depth = metrics.gauge(
+            'wizardtracker_write_queue_spilled_batches',
+            'Batches waiting on disk for the writer.',
+            queue=name)
+        self._dropped = {
+            reason: metrics.counter(
+                'wizardtracker_write_queue_dropped_batches_total',
+                'Batches that were never written.',
+                queue=name,
+                reason=reason)
+            for reason in ('overflow', 'error')}
+        self._write_seconds = metrics.histogram(
+            'wizardtracker_write_seconds',
+            'Time taken to write one batch.',
+            queue=name)
+
+    def start(self):
+        if self._policy == SPILL:
+            self._spilled = self._recover_spilled()
+            if self._spilled:
+                LOGGER.warning(
+                    'Writing %d batches left over in %s.',
+                    self._spilled,
+                    self._spill_path)
+            self._spilled_depth.set(self._spilled)
+
+        self._should_stop = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name='{}-writer'.format(self._name))
+        self._thread.start()
+
+    def put(self, batch):
+        with self._condition:
+            full = len(self._batches) >= self._size
+
+            if self._policy == SPILL and (full or self._spilled):
+                # Once something's on disk everything after it goes there
+                # too, or it would be written out of order.
+                self._spill(batch)
+            elif self._policy == BLOCK and full:
+                self._condition.wait_for(
+                    lambda: len(self._batches) < self._size)
+                self._batches.append(batch)
+            elif self._policy == DROP_OLDEST and full:
+                self._batches.popleft()
+                self._batches.append(batch)
+                self._dropped['overflow'].inc()
+            else:
+                self._batches.append(batch)
+
+            self._depth.set(len(self._batches))
+            self._condition.notify_all()
+
+    def drain(self):
+        # Waits for everything put so far to be written.
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not (self._batches or self._spilled or self._writing))
+
+    def close(self):
+        with self._condition:
+            self._should_stop = True
+            self._condition.notify_all()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: (
+                    self._batches or self._spilled or self._should_stop))
+
+                if self._batches:
+                    batches = [self._batches.popleft()]
+                elif self._spilled:
+                    batches = self._take_spilled()
+                else:
+                    return
+
+                self._writing = True
+                self._depth.set(len(self._batches))
+                self._condition.notify_all()
+
+            for batch in batches:
+                self._write_batch(batch)
+
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+
+        try:
+            self._write(batch)
+        except Exception:
+            LOGGER.exception('Failed to write a batch, dropping it.')
+            self._dropped['error'].inc()
+            return
+
+        self._write_seconds.observe(time.perf_counter() - start)
+
+    def _spill(self, batch):
+        os.makedirs(self._spill_directory, exist_ok=True)
+        with open(self._spill_path, 'ab') as spill_file:
+            pickle.dump(batch, spill_file, pickle.HIGHEST_PROTOCOL)
+
+        if not self._spilled:
+            LOGGER.warning(
+                'Writer is behind, spilling to %s.', self._spill_path)
+
+        self._spilled = self._spilled + 1
+        self._spilled_depth.set(self._spilled)
+
+    def _take_spilled(self):
+        # Moved aside so that new spills start a fresh file, and read back a
+        # batch at a time by the writer.
+        path = self._spill_path + '.writing'
+        os.replace(self._spill_path, path)
+
+        self._spilled = 0
+        self._spilled_depth.set(0)
+
+        return self._read_spilled(path)
+
+    def _read_spilled(self, path):
+        for batch in self._read_batches(path):
+            yield batch
+
+        os.remove(path)
+
+    def _recover_spilled(self):
+        # Whatever was left on disk last time, oldest first. A file we were
+        # part way through writing goes first, and has some of its batches
+        # written a second time.
+        writing_path = self._spill_path + '.writing'
+        paths = [
+            path for path in (writing_path, self._spill_path)
+            if os.path.exists(path)]
+        if not paths:
+            return 0
+
+        batches = [
+            batch for path in paths for batch in self._read_batches(path)]
+        if self._recover:
+            batches = [self._recover(batch) for batch in batches]
+
+        recovered_path = self._spill_path + '.recovered'
+        with open(recovered_path, 'wb') as spill_file:
+            for batch in batches:
+                pickle.dump(batch, spill_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(recovered_path, self._spill_path)
+        if os.path.exists(writing_path):
+            os.remove(writing_path)
+
+        return len(batches)
+
+    @staticmethod
+    def _read_batches(path):
+        with open(path, 'rb') as spill_file:
+            while True:
+                try:
+                    yield pickle.load(spill_file)
+                except EOFError:
+                    return
+                except (pickle.UnpicklingError, ValueError):
+                    # A batch that was half written when we died.
+                    LOGGER.exception('Spill file %s is damaged.', path)
+                    return
@@ -0,0 +1,122 @@
+import argparse
+import threading
+import time
+
+from wsgiref.simple_server import make_server
+
+import requests
+
+from wizardtracker.device_service.api.app import app
+from wizardtracker.device_service.tracker.fake_controller import (
+    FakeTrackerController
+)
+from wizardtracker.tools.bench_controller_latency import (
+    NullPublisher,
+    percentile
+)
+from wizardtracker.wsgi_api_server import (
+    QuietWSGIRequestHandler,
+    ThreadPoolWSGIServer
+)
+
+
+def start_wsgiref():
+    # What ApiServer used before, for comparison.
+    httpd = make_server('127.0.0.1', 0, app)
+    httpd.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    return httpd
+
+
+def start_pool(worker_count):
+    httpd = ThreadPoolWSGIServer(
+        '127.0.0.1', 0, app, worker_count=worker_count)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    return httpd
+
+
+def measure_requests(url, count, keep_alive):
+    session = requests.Session() if keep_alive else requests
+
+    start = time.perf_counter()
+    for _ in range(count):
+        session.get(url + '/status')
+
+    return count / (time.perf_counter() - start)
+
+
+def measure_with_slow_requests(url, count, slow_count, slow_seconds):
+    # Long polls stand in for any slow request (/race/times, /ports, ...).
+    version = requests.get(url + '/status').json()['version']
+    slow_url = '{}/status?since={}&timeout={}'.format(
+        url, version, slow_seconds)
+
+    slow_threads = [
+        threading.Thread(target=requests.get, args=(slow_url,))
+        for _ in range(slow_count)]
+    for thread in slow_threads:
+        thread.start()
+    time.sleep(0.1)
+
+    session = requests.Session()
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        session.get(url + '/status')
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    for thread in slow_threads:
+        thread.join()
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--slow', type=int, default=4)
+    parser.add_argument('--slow-seconds', type=float, default=1)
+    args = parser.parse_args()
+
+    app.trackers = {'default': FakeTrackerController(NullPublisher(), 0)}
+    QuietWSGIRequestHandler.log = lambda *args: None
+
+    servers = [
+        ('wsgiref', start_wsgiref()),
+        ('pool({})'.format(args.workers), start_pool(args.workers)),
+    ]
+
+    for name, httpd in servers:
+        url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+
+        new_rate = measure_requests(url, args.requests, False)
+        keep_alive_rate = measure_requests(url, args.requests, True)
+        print('{}: {:.0f} req/s new connections, {:.0f} req/s '
+              'keep-alive'.format(name, new_rate, keep_alive_rate))
+
+        # wsgiref speaks HTTP/1.0, and Werkzeug 2.1 and up close every
+        # connection regardless.
+        response = requests.get(url + '/status')
+        if response.raw.version == 10 or \
+                response.headers.get('Connection') == 'close':
+            print('{}: server closes connections, keep-alive numbers are '
+                  'new connections too'.format(name))
+
+        latencies = measure_with_slow_requests(
+            url, 50, args.slow, args.slow_seconds)
+        print('{}: /status with {} slow requests in flight: p50 {:.1f}ms, '
+              'max {:.1f}ms'.format(
+                  name,
+                  args.slow,
+                  percentile(latencies, 0.5),
+                  max(latencies)))
+
+        httpd.shutdown()
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import threading
+import time
+
+from wizardtracker.device_service.tracker.controller import TrackerController
+from wizardtracker.device_service.tracker.load_generator import (
+    PtyTrackerDevice
+)
+
+
+class NullPublisher:
+    def publish(self, rssi_data):
+        pass
+
+    def tick(self):
+        pass
+
+    def flush(self):
+        pass
+
+
+def measure_idle_cpu(seconds):
+    start_cpu = time.process_time()
+    time.sleep(seconds)
+    return (time.process_time() - start_cpu) / seconds
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--hz', type=int, default=1000)
+    parser.add_argument('--idle-seconds', type=float, default=3)
+    parser.add_argument('--commands', type=int, default=200)
+    args = parser.parse_args()
+
+    controller = TrackerController(NullPublisher())
+    controller_thread = threading.Thread(target=controller.start)
+    controller_thread.start()
+
+    print('Idle CPU (disconnected): {:.1f}%'.format(
+        measure_idle_cpu(args.idle_seconds) * 100))
+
+    device = PtyTrackerDevice(args.receivers, args.hz)
+    device.start()
+
+    start = time.perf_counter()
+    controller._run_control_command(controller._connect, device.port)
+    print('Connect: {:.2f}ms'.format((time.perf_counter() - start) * 1000))
+
+    while not controller.is_ready:
+        time.sleep(0.01)
+
+    latencies = []
+    for i in range(args.commands):
+        start = time.perf_counter()
+        controller.set_frequency(i % args.receivers, 5800)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print('set_frequency while streaming at {}Hz: p50 {:.2f}ms, '
+          'p99 {:.2f}ms, max {:.2f}ms'.format(
+              args.hz,
+              percentile(latencies, 0.5),
+              percentile(latencies, 0.99),
+              max(latencies)))
+
+    # A whole heat's worth, one receiver at a time and then in bulk.
+    latencies = []
+    bulk_latencies = []
+    for i in range(args.commands // args.receivers):
+        frequencies = [5650 + i + r for r in range(args.receivers)]
+
+        start = time.perf_counter()
+        for receiver_id, frequency in enumerate(frequencies):
+            controller.set_frequency(receiver_id, frequency)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        controller.set_frequencies([f + 1000 for f in frequencies])
+        bulk_latencies.append((time.perf_counter() - start) * 1000)
+
+    print('{} receivers: set_frequency each p50 {:.2f}ms, '
+          'set_frequencies p50 {:.2f}ms'.format(
+              args.receivers,
+              percentile(latencies, 0.5),
+              percentile(bulk_latencies, 0.5)))
+
+    controller.stop()
+    controller_thread.join()
+    device.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import time
+
+import numpy
+
+from wizardtracker.timing_service.filters import (
+    create_filter_chain,
+    lowpass_filter
+)
+
+
+CHAINS = [
+    ('ema', [{'type': 'ema', 'alpha': 0.05}]),
+    ('mean', [{'type': 'mean', 'window': 5}]),
+    ('median', [{'type': 'median', 'window': 5}]),
+    ('kalman', [{'type': 'kalman'}]),
+    ('median+ema', [
+        {'type': 'median', 'window': 5},
+        {'type': 'ema', 'alpha': 0.05}
+    ]),
+]
+
+
+def generate_rssi(sample_count, receiver_count):
+    rng = numpy.random.default_rng(0)
+    return rng.integers(0, 256, (sample_count, receiver_count)).tolist()
+
+
+def filter_reference(samples):
+    # What DataProcessor._filter_rssi used to do, one sample at a time.
+    filtered = []
+    last = list(samples[0])
+    for rssi in samples:
+        last = [lowpass_filter(l, v) for l, v in zip(last, rssi)]
+        filtered.append(last)
+
+    return filtered
+
+
+def filter_chain(specs, samples, batch_size):
+    # Includes getting in and out of numpy, the processor pays for that too.
+    chain = create_filter_chain(specs)
+
+    filtered = []
+    for i in range(0, len(samples), batch_size):
+        batch = numpy.array(samples[i:i + batch_size], dtype=numpy.float64)
+        filtered.extend(chain.process(batch).tolist())
+
+    return filtered
+
+
+def time_per_sample(function, samples, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best / len(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000)
+    args = parser.parse_args()
+
+    for receiver_count in (8, 32):
+        samples = generate_rssi(args.samples, receiver_count)
+
+        reference = filter_reference(samples)
+        for batch_size in (1, 8, 64):
+            filtered = filter_chain(CHAINS[0][1], samples, batch_size)
+            if filtered != reference:
+                raise AssertionError('EMA no longer matches lowpass_filter.')
+        print('{} receivers: ema matches lowpass_filter exactly'.format(
+            receiver_count))
+
+        print('{} receivers: reference {:.1f}us/sample'.format(
+            receiver_count,
+            time_per_sample(filter_reference, samples, samples)))
+
+        for name, specs in CHAINS:
+            print('{} receivers: {} {}'.format(
+                receiver_count,
+                name,
+                ', '.join(
+                    'batch {} {:.1f}us/sample'.format(
+                        batch_size,
+                        time_per_sample(
+                            filter_chain, samples, specs, samples, batch_size))
+                    for batch_size in (1, 8, 64))))
+
+
+if __name__ == '__main__':
+    main()
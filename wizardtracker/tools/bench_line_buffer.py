@@ -0,0 +1,83 @@
+import argparse
+import io
+import random
+import time
+
+from wizardtracker.device_service.tracker.controller import LineRingBuffer
+
+
+class BytearrayLineReader:
+    # The old NonBlockingLineReader, kept here as the baseline.
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def readinto(self, source, size):
+        data = source.read(size)
+        self._buffer.extend(data)
+        return len(data)
+
+    def read_line(self):
+        end_index = self._buffer.find(b'\n')
+        if end_index >= 0:
+            found_line = bytes(self._buffer[:end_index + 1])
+            del self._buffer[0:end_index + 1]
+            return found_line
+
+        return None
+
+
+def generate_stream(line_count, receiver_count):
+    lines = []
+    for _ in range(line_count):
+        readings = [random.randint(0, 255) for _ in range(receiver_count)]
+        lines.append('r ' + ' '.join(str(r) for r in readings))
+
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def replay(reader, stream, burst_size):
+    source = io.BytesIO(stream)
+    line_count = 0
+
+    start = time.perf_counter()
+    while reader.readinto(source, burst_size):
+        while reader.read_line():
+            line_count = line_count + 1
+    elapsed = time.perf_counter() - start
+
+    return elapsed, line_count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--input',
+        help='raw device stream to replay instead of generated data')
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument(
+        '--burst-sizes',
+        type=lambda s: [int(b) for b in s.split(',')],
+        default=[128, 4096, 32768])
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = generate_stream(args.lines, args.receivers)
+
+    print('Replaying {} bytes'.format(len(stream)))
+
+    for burst_size in args.burst_sizes:
+        for name, reader_class in (
+                ('bytearray', BytearrayLineReader),
+                ('ring', LineRingBuffer)):
+            elapsed, line_count = replay(reader_class(), stream, burst_size)
+            print('{:>6} byte bursts, {:>9}: {:.3f}s, {:.2f}us/line'.format(
+                burst_size, name, elapsed, elapsed / line_count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import random
+import time
+
+from wizardtracker.device_service.tracker.controller import (
+    TrackerController,
+    _TrackerState
+)
+
+
+class NullPublisher:
+    def __init__(self):
+        self.count = 0
+
+    def publish(self, rssi_data):
+        self.count = self.count + 1
+
+
+def generate_stream(line_count, receiver_count):
+    lines = []
+    for i in range(line_count):
+        if i % 500 == 0:
+            lines.append('v {:.2f}'.format(random.uniform(11, 12)))
+        elif i % 500 == 250:
+            lines.append('t {:.1f}'.format(random.uniform(20, 40)))
+        else:
+            readings = [random.randint(0, 255) for _ in range(receiver_count)]
+            lines.append('r ' + ' '.join(str(r) for r in readings))
+
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def make_controller(receiver_count, batch_decode):
+    publisher = NullPublisher()
+    controller = TrackerController(publisher, batch_decode=batch_decode)
+    controller.receiver_count = receiver_count
+    controller.frequencies = [5800] * receiver_count
+    controller._state = _TrackerState.READY
+
+    return controller, publisher
+
+
+def run(stream, receiver_count, chunk_size, batch_decode):
+    controller, publisher = make_controller(receiver_count, batch_decode)
+
+    start = time.perf_counter()
+    for i in range(0, len(stream), chunk_size):
+        controller._line_buffer.append_data(stream[i:i + chunk_size])
+        # Stamped the way _parse_serial does after each read.
+        controller._read_ns = time.perf_counter_ns()
+        controller._parse_buffered_lines()
+        controller._last_read_ns = controller._read_ns
+    elapsed = time.perf_counter() - start
+
+    return elapsed, publisher.count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=200000)
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--chunk-size', type=int, default=128)
+    args = parser.parse_args()
+
+    stream = generate_stream(args.lines, args.receivers)
+    print('{} lines, {} receivers, {} bytes, {} byte chunks'.format(
+        args.lines, args.receivers, len(stream), args.chunk_size))
+
+    for name, batch_decode in (('per-line', False), ('batched', True)):
+        elapsed, count = run(
+            stream, args.receivers, args.chunk_size, batch_decode)
+        print('{:>10}: {:.3f}s, {:.2f}us/line, {} samples'.format(
+            name, elapsed, elapsed / args.lines * 1e6, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import random
+import time
+
+from wizardtracker.pubsub_codecs import BATCH_KEY, CODECS, decode
+
+
+def make_sample(receiver_count, filtered, sequence):
+    if filtered:
+        rssi = [random.uniform(0, 255) for _ in range(receiver_count)]
+    else:
+        rssi = [random.randint(0, 255) for _ in range(receiver_count)]
+
+    return {
+        'timestamp': time.perf_counter(),
+        'sequence': sequence,
+        'rssi': rssi
+    }
+
+
+def make_message(receiver_count, batch_size, filtered):
+    samples = [
+        make_sample(receiver_count, filtered, i) for i in range(batch_size)]
+    if batch_size == 1:
+        return samples[0]
+
+    return {BATCH_KEY: samples}
+
+
+def time_per_call(function, argument, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(argument)
+
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    print('{:>12} {:>9} {:>5} {:>6} {:>7} {:>11} {:>11}'.format(
+        'codec', 'data', 'rx', 'batch', 'bytes', 'encode us', 'decode us'))
+
+    for receiver_count in (8, 32):
+        for batch_size in (1, 16):
+            for filtered in (False, True):
+                message = make_message(receiver_count, batch_size, filtered)
+
+                for name, codec in CODECS.items():
+                    payload = codec.encode(message)
+                    encode_us = time_per_call(
+                        codec.encode, message, args.iterations)
+                    decode_us = time_per_call(
+                        decode, payload, args.iterations)
+
+                    print(
+                        '{:>12} {:>9} {:>5} {:>6} {:>7} {:>11.2f} {:>11.2f}'
+                        .format(
+                            name,
+                            'filtered' if filtered else 'raw',
+                            receiver_count,
+                            batch_size,
+                            len(payload),
+                            encode_us,
+                            decode_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import argparse
+import configparser
+import threading
+import time
+
+from wizardtracker.nice_redis_pubsub import MESSAGE_TIMEOUT, NiceRedisPubsub
+
+
+class LatencySubscriber:
+    def __init__(self, host, port, timeout):
+        self.latencies = []
+        self._timeout = timeout
+        self._should_stop = False
+
+        self._redis = NiceRedisPubsub(host, port)
+        self._redis.connect()
+        self._redis.subscribe('benchDispatch', self._message_cb)
+
+    def start(self):
+        while not self._should_stop:
+            self._redis.tick_messages(timeout=self._timeout)
+
+    def stop(self):
+        self._should_stop = True
+
+    def _message_cb(self, data):
+        self.latencies.append(time.perf_counter() - data['sent'])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(host, port, timeout, idle_seconds, messages, hz):
+    subscriber = LatencySubscriber(host, port, timeout)
+    subscriber_thread = threading.Thread(target=subscriber.start)
+
+    start_cpu = time.process_time()
+    subscriber_thread.start()
+    time.sleep(idle_seconds)
+    idle_cpu = (time.process_time() - start_cpu) / idle_seconds
+
+    publisher = NiceRedisPubsub(host, port)
+    publisher.connect()
+    for _ in range(messages):
+        publisher.publish('benchDispatch', {'sent': time.perf_counter()})
+        time.sleep(1 / hz)
+
+    time.sleep(0.5)
+    stop_time = time.perf_counter()
+    subscriber.stop()
+    subscriber_thread.join()
+    stop_delay = time.perf_counter() - stop_time
+
+    return idle_cpu, subscriber.latencies, stop_delay
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read('./config.ini')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--idle-seconds', type=float, default=5)
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--hz', type=int, default=200)
+    args = parser.parse_args()
+
+    host = config['redis']['host']
+    port = config['redis'].getint('port')
+
+    for name, timeout in (('polling', 0), ('blocking', MESSAGE_TIMEOUT)):
+        idle_cpu, latencies, stop_delay = run(
+            host,
+            port,
+            timeout,
+            args.idle_seconds,
+            args.messages,
+            args.hz)
+
+        print('{:>8}: idle CPU {:.1f}%, latency p50 {:.3f}ms '
+              'p99 {:.3f}ms, stop {:.0f}ms'.format(
+                  name,
+                  idle_cpu * 100,
+                  percentile(latencies, 0.5) * 1000,
+                  percentile(latencies, 0.99) * 1000,
+                  stop_delay * 1000))
+
+
+if __name__ == '__main__':
+    main()
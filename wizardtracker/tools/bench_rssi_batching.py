@@ -0,0 +1,78 @@
+import argparse
+import configparser
+import threading
+import time
+
+from wizardtracker.device_service.rssi_publisher import RssiPublisher
+from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+
+
+class CountingSubscriber:
+    def __init__(self, host, port):
+        self.count = 0
+        self._should_stop = False
+
+        self._redis = NiceRedisPubsub(host, port)
+        self._redis.connect()
+        self._redis.subscribe('rssiRaw', self._rssi_raw_cb)
+
+    def start(self):
+        while not self._should_stop:
+            self._redis.tick_messages()
+
+    def stop(self):
+        self._should_stop = True
+
+    def _rssi_raw_cb(self, data):
+        self.count = self.count + 1
+
+
+def run(host, port, batch_size, samples, receiver_count):
+    subscriber = CountingSubscriber(host, port)
+    subscriber_thread = threading.Thread(target=subscriber.start)
+    subscriber_thread.start()
+
+    publisher = RssiPublisher(
+        host, port, batch_size=batch_size, batch_interval=0.01)
+    publisher.connect()
+
+    rssi = list(range(receiver_count))
+    start = time.perf_counter()
+    for i in range(samples):
+        publisher.publish({'timestamp': i, 'rssi': rssi})
+    publisher.flush()
+
+    while subscriber.count < samples:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    subscriber.stop()
+    subscriber_thread.join()
+
+    return elapsed
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read('./config.ini')
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument(
+        '--batch-sizes',
+        type=lambda s: [int(b) for b in s.split(',')],
+        default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    host = config['redis']['host']
+    port = config['redis'].getint('port')
+
+    for batch_size in args.batch_sizes:
+        elapsed = run(host, port, batch_size, args.samples, args.receivers)
+        print('batch size {:>3}: {:.0f} samples/s end to end'.format(
+            batch_size, args.samples / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy
+
+from peewee import SqliteDatabase
+
+from wizardtracker.models import (
+    PRAGMAS,
+    Race,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.models.migrations import migrate
+from wizardtracker.models.rssi_chunks import (
+    encode_chunk,
+    load_race_rssi,
+    load_rssi_rows,
+    split_chunks
+)
+
+
+MODELS = [Race, RaceReceiver, RaceRssi, RaceRssiChunk]
+
+
+def generate_race(receiver_count, sample_rate, seconds):
+    rng = numpy.random.default_rng(0)
+    sample_count = int(seconds * sample_rate)
+    timestamps = 1000 + numpy.arange(sample_count) / sample_rate
+    values = rng.integers(
+        0, 256, (sample_count, receiver_count), dtype=numpy.int64)
+
+    return timestamps, values
+
+
+def create_race(db, name, timestamps, values, chunks):
+    race = Race.create(name=name)
+    receiver_ids = [
+        RaceReceiver.create(receiver_id=i, frequency=5800, race=race).id
+        for i in range(values.shape[1])]
+
+    with db.atomic():
+        if chunks:
+            RaceRssiChunk.insert_many([
+                dict(
+                    encode_chunk(timestamps[start:end], values[start:end, i]),
+                    receiver=receiver_id)
+                for start, end in split_chunks(timestamps)
+                for i, receiver_id in enumerate(receiver_ids)]).execute()
+        else:
+            db.cursor().executemany(
+                'INSERT INTO racerssi (timestamp, receiver_id, value) '
+                'VALUES (?, ?, ?)',
+                (
+                    (timestamp, receiver_id, value)
+                    for timestamp, sample in zip(
+                        timestamps.tolist(), values.tolist())
+                    for receiver_id, value in zip(receiver_ids, sample)))
+
+    return race.id
+
+
+def load_prefetch(race_id):
+    # What timing.get_times used to do.
+    receivers = RaceReceiver \
+        .select() \
+        .where(RaceReceiver.race == race_id) \
+        .order_by(RaceReceiver.receiver_id) \
+        .prefetch(RaceRssi)
+
+    loaded = {}
+    for receiver in receivers:
+        timestamps = []
+        values = []
+        for rssi in receiver.rssi:
+            timestamps.append(rssi.timestamp)
+            values.append(rssi.value)
+        loaded[receiver.id] = (
+            numpy.array(timestamps), numpy.array(values))
+
+    return loaded
+
+
+def load_rows(race_id):
+    receivers = RaceReceiver \
+        .select(RaceReceiver.id) \
+        .where(RaceReceiver.race == race_id) \
+        .order_by(RaceReceiver.receiver_id)
+
+    return {
+        receiver.id: load_rssi_rows(receiver.id)
+        for receiver in receivers}
+
+
+def measure(load, *args):
+    # Timed and traced separately, tracemalloc slows allocating right down.
+    gc.collect()
+    start = time.perf_counter()
+    loaded = load(*args)
+    elapsed = time.perf_counter() - start
+    loaded = None
+
+    gc.collect()
+    tracemalloc.start()
+    loaded = load(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak, loaded
+
+
+def check(loaded, timestamps, values):
+    for i, (loaded_timestamps, loaded_values) in enumerate(loaded.values()):
+        if not (numpy.array_equal(loaded_timestamps, timestamps) and
+                numpy.array_equal(loaded_values, values[:, i])):
+            raise AssertionError('Loaded RSSI doesn\'t match.')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--hz', type=int, default=100)
+    parser.add_argument('--minutes', type=float, default=60)
+    parser.add_argument(
+        '--range-minutes',
+        type=float,
+        default=1,
+        help='length of the time range loaded from the middle of the race')
+    parser.add_argument(
+        '--skip-prefetch',
+        action='store_true',
+        help='the old way takes a while and a lot of memory')
+    args = parser.parse_args()
+
+    timestamps, values = generate_race(
+        args.receivers, args.hz, args.minutes * 60)
+    print('{} receivers, {}Hz, {} minutes: {} rows'.format(
+        args.receivers, args.hz, args.minutes, values.size))
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = SqliteDatabase(
+            os.path.join(directory, 'bench.db'), pragmas=PRAGMAS)
+
+        with db.bind_ctx(MODELS):
+            migrate(db)
+            rows_race = create_race(db, 'rows', timestamps, values, False)
+            chunks_race = create_race(db, 'chunks', timestamps, values, True)
+
+            middle = timestamps[len(timestamps) // 2]
+            start_time = middle - args.range_minutes * 30
+            end_time = middle + args.range_minutes * 30
+            in_range = (timestamps >= start_time) & (timestamps <= end_time)
+
+            loads = [
+                ('rows, prefetch', load_prefetch, (rows_race,)),
+                ('rows, raw cursor', load_rows, (rows_race,)),
+                ('chunks', load_race_rssi, (chunks_race,)),
+                (
+                    'chunks, {} minutes'.format(args.range_minutes),
+                    load_race_rssi,
+                    (chunks_race, start_time, end_time)),
+            ]
+            if args.skip_prefetch:
+                loads = loads[1:]
+
+            for name, load, load_args in loads:
+                elapsed, peak, loaded = measure(load, *load_args)
+                if len(load_args) > 1:
+                    check(loaded, timestamps[in_range], values[in_range])
+                else:
+                    check(loaded, timestamps, values)
+                loaded = None
+
+                print('{}: {:.3f}s, peak {:.1f}MB'.format(
+                    name, elapsed, peak / 1e6))
+
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy
+
+from peewee import SqliteDatabase
+
+from wizardtracker.device_service.tracker.load_generator import RssiGenerator
+from wizardtracker.models import Race, RaceReceiver, RaceRssi, RaceRssiChunk
+from wizardtracker.models.rssi_chunks import (
+    encode_chunk,
+    load_race_rssi,
+    split_chunks
+)
+from wizardtracker.timing_service.filters import EmaFilter
+
+
+MODELS = [Race, RaceReceiver, RaceRssi, RaceRssiChunk]
+INSERT_ROWS = 10000
+
+
+def generate_race(receiver_count, sample_rate, seconds):
+    # Filtered like the recorder would see it, then stored as integers.
+    generator = RssiGenerator(
+        receiver_count, sample_rate, lap_time=20, start_time=1000, seed=0)
+    timestamps, values = generator.generate(int(seconds * sample_rate))
+    filtered = EmaFilter().process(values.astype(numpy.float64))
+
+    return timestamps, filtered.astype(numpy.int64)
+
+
+def create_race(receiver_count):
+    race = Race.create(name='bench')
+    return [
+        RaceReceiver.create(receiver_id=i, frequency=5800, race=race).id
+        for i in range(receiver_count)]
+
+
+def store_rows(db, receiver_ids, timestamps, values):
+    timestamps = timestamps.tolist()
+    rows = [
+        (timestamp, receiver_id, value)
+        for i, receiver_id in enumerate(receiver_ids)
+        for timestamp, value in zip(timestamps, values[:, i].tolist())]
+
+    fields = [RaceRssi.timestamp, RaceRssi.receiver, RaceRssi.value]
+    with db.atomic():
+        for start in range(0, len(rows), INSERT_ROWS):
+            RaceRssi \
+                .insert_many(rows[start:start + INSERT_ROWS], fields=fields) \
+                .execute()
+
+
+def store_chunks(db, receiver_ids, timestamps, values):
+    rows = [
+        dict(
+            encode_chunk(timestamps[start:end], values[start:end, i]),
+            receiver=receiver_id)
+        for start, end in split_chunks(timestamps)
+        for i, receiver_id in enumerate(receiver_ids)]
+
+    with db.atomic():
+        RaceRssiChunk.insert_many(rows).execute()
+
+
+def load_rows(race_id):
+    # What timing.get_times used to do.
+    receivers = RaceReceiver \
+        .select() \
+        .where(RaceReceiver.race == race_id) \
+        .prefetch(RaceRssi)
+
+    return {
+        receiver.id: (
+            [rssi.timestamp for rssi in receiver.rssi],
+            [rssi.value for rssi in receiver.rssi])
+        for receiver in receivers}
+
+
+def build(path, store, receiver_count, timestamps, values):
+    db = SqliteDatabase(path)
+    with db.bind_ctx(MODELS):
+        db.create_tables(MODELS)
+        receiver_ids = create_race(receiver_count)
+
+        start = time.perf_counter()
+        store(db, receiver_ids, timestamps, values)
+        elapsed = time.perf_counter() - start
+    db.close()
+
+    return elapsed, os.path.getsize(path)
+
+
+def time_load(path, load):
+    db = SqliteDatabase(path)
+    with db.bind_ctx(MODELS):
+        start = time.perf_counter()
+        loaded = load(Race.select().get().id)
+        elapsed = time.perf_counter() - start
+    db.close()
+
+    return elapsed, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--hz', type=int, default=100)
+    parser.add_argument('--minutes', type=float, default=10)
+    args = parser.parse_args()
+
+    timestamps, values = generate_race(
+        args.receivers, args.hz, args.minutes * 60)
+    print('{} receivers, {}Hz, {} minutes: {} values'.format(
+        args.receivers, args.hz, args.minutes, values.size))
+
+    with tempfile.TemporaryDirectory() as directory:
+        rows_path = os.path.join(directory, 'rows.db')
+        chunks_path = os.path.join(directory, 'chunks.db')
+
+        for name, path, store, load in (
+                ('rows', rows_path, store_rows, load_rows),
+                ('chunks', chunks_path, store_chunks, load_race_rssi)):
+            write_time, size = build(
+                path, store, args.receivers, timestamps, values)
+            load_time, loaded = time_load(path, load)
+            print('{}: {:.1f}MB, write {:.2f}s, load {:.3f}s'.format(
+                name, size / 1e6, write_time, load_time))
+
+        # Chunks have to give back exactly what went in.
+        for i, (loaded_timestamps, loaded_values) in enumerate(
+                loaded.values()):
+            if not (numpy.array_equal(loaded_timestamps, timestamps) and
+                    numpy.array_equal(loaded_values, values[:, i])):
+                raise AssertionError('Chunks changed the data.')
+        print('chunks: round trip is exact')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import threading
+import time
+
+from wizardtracker.config import get_config, get_pubsub_options
+from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+
+
+class LatencySubscriber:
+    def __init__(self, host, port, pubsub_options):
+        self.latencies = []
+        self._should_stop = False
+
+        self._redis = NiceRedisPubsub(host, port, **pubsub_options)
+        self._redis.connect()
+        self._redis.subscribe('benchRssi', self._rssi_cb)
+
+    def start(self):
+        while not self._should_stop:
+            self._redis.tick_messages()
+
+        self._redis.close()
+
+    def stop(self):
+        self._should_stop = True
+
+    def _rssi_cb(self, data):
+        self.latencies.append(time.perf_counter() - data['timestamp'])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(host, port, pubsub_options, samples, receiver_count, hz):
+    subscriber = LatencySubscriber(host, port, pubsub_options)
+    subscriber_thread = threading.Thread(target=subscriber.start)
+    subscriber_thread.start()
+
+    publisher = NiceRedisPubsub(host, port, **pubsub_options)
+    publisher.connect()
+    # Give the publisher a chance to spot the subscriber.
+    publisher.publish('benchRssi', {'timestamp': 0, 'rssi': [0]})
+    time.sleep(1.5)
+    subscriber.latencies = []
+
+    rssi = list(range(receiver_count))
+    start_cpu = time.process_time()
+    for _ in range(samples):
+        publisher.publish('benchRssi', {
+            'timestamp': time.perf_counter(),
+            'rssi': rssi
+        })
+        time.sleep(1 / hz)
+
+    time.sleep(0.5)
+    cpu = time.process_time() - start_cpu
+
+    subscriber.stop()
+    subscriber_thread.join()
+    publisher.close()
+
+    return subscriber.latencies, cpu / samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--hz', type=int, default=500)
+    args = parser.parse_args()
+
+    config = get_config()
+    host = config['redis']['host']
+    port = config['redis'].getint('port')
+    pubsub_options = get_pubsub_options(config)
+
+    for transport in ('pubsub', 'shm'):
+        pubsub_options['transports'] = {'benchRssi': transport}
+        latencies, cpu_per_sample = run(
+            host,
+            port,
+            pubsub_options,
+            args.samples,
+            args.receivers,
+            args.hz)
+
+        print('{:>6}: {} received, latency p50 {:.3f}ms p99 {:.3f}ms, '
+              '{:.1f}us CPU/sample'.format(
+                  transport,
+                  len(latencies),
+                  percentile(latencies, 0.5) * 1000,
+                  percentile(latencies, 0.99) * 1000,
+                  cpu_per_sample * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy
+
+from peewee import OperationalError, SqliteDatabase
+
+from wizardtracker.models import (
+    PRAGMAS,
+    Race,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk
+)
+from wizardtracker.models.migrations import migrate
+from wizardtracker.models.rssi_chunks import encode_chunk, load_race_rssi
+
+
+MODELS = [Race, RaceReceiver, RaceRssi, RaceRssiChunk]
+CHUNK_SECONDS = 5
+
+# Where things were before: rollback journal, synchronous=full and only
+# the foreign key's index on RaceRssi.
+SETUPS = [
+    ('before', (('foreign_keys', 'on'),), True),
+    ('tuned', PRAGMAS, False),
+]
+
+
+def generate_race(receiver_count, sample_rate, seconds, seed):
+    rng = numpy.random.default_rng(seed)
+    sample_count = int(seconds * sample_rate)
+    timestamps = 1000 + numpy.arange(sample_count) / sample_rate
+    values = rng.integers(
+        0, 256, (len(timestamps), receiver_count), dtype=numpy.int64)
+
+    return timestamps, values
+
+
+def create_database(path, pragmas, legacy_indexes):
+    db = SqliteDatabase(path, pragmas=pragmas)
+    with db.bind_ctx(MODELS):
+        migrate(db)
+
+        if legacy_indexes:
+            db.execute_sql(
+                'DROP INDEX racerssi_receiver_id_timestamp_value')
+            db.execute_sql(
+                'CREATE INDEX racerssi_receiver_id ON racerssi (receiver_id)')
+
+    return db
+
+
+def create_race(receiver_count):
+    race = Race.create(name='bench')
+    return race.id, [
+        RaceReceiver.create(receiver_id=i, frequency=5800, race=race).id
+        for i in range(receiver_count)]
+
+
+def fill_rows(db, receiver_ids, timestamps, values):
+    # Setup rather than what's being timed, so straight to the cursor. Every
+    # receiver for a sample together, the way the recorder wrote them.
+    rows = (
+        (timestamp, receiver_id, value)
+        for timestamp, sample in zip(timestamps.tolist(), values.tolist())
+        for receiver_id, value in zip(receiver_ids, sample))
+
+    with db.atomic():
+        db.cursor().executemany(
+            'INSERT INTO racerssi (timestamp, receiver_id, value) '
+            'VALUES (?, ?, ?)',
+            rows)
+
+
+def chunk_commits(receiver_ids, timestamps, values, sample_rate):
+    # Each one is what the recorder commits every CHUNK_SECONDS.
+    size = CHUNK_SECONDS * sample_rate
+    for start in range(0, len(timestamps), size):
+        end = start + size
+        yield [
+            dict(
+                encode_chunk(timestamps[start:end], values[start:end, i]),
+                receiver=receiver_id)
+            for i, receiver_id in enumerate(receiver_ids)]
+
+
+def write_chunks(db, commits):
+    elapsed = []
+    for rows in commits:
+        start = time.perf_counter()
+        with db.atomic():
+            RaceRssiChunk.insert_many(rows).execute()
+        elapsed.append(time.perf_counter() - start)
+
+    return elapsed
+
+
+def read_receiver_rows(db, receiver_id):
+    return db.execute_sql(
+        'SELECT timestamp, value FROM racerssi '
+        'WHERE receiver_id = ? ORDER BY timestamp',
+        (receiver_id,)).fetchall()
+
+
+def read_while_writing(db, receiver_ids, commits, reads):
+    # The API reading a race while the recorder commits another.
+    stop = threading.Event()
+    errors = []
+
+    def writer():
+        with db.bind_ctx(MODELS):
+            while not stop.is_set():
+                try:
+                    write_chunks(db, commits)
+                except OperationalError as e:
+                    errors.append(e)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+
+    elapsed = []
+    try:
+        for i in range(reads):
+            start = time.perf_counter()
+            try:
+                read_receiver_rows(db, receiver_ids[i % len(receiver_ids)])
+            except OperationalError as e:
+                errors.append(e)
+            elapsed.append(time.perf_counter() - start)
+    finally:
+        stop.set()
+        thread.join()
+
+    return elapsed, errors
+
+
+def milliseconds(elapsed):
+    return 'median {:.2f}ms, max {:.2f}ms'.format(
+        numpy.median(elapsed) * 1000, max(elapsed) * 1000)
+
+
+def run(name, path, pragmas, legacy_indexes, args):
+    db = create_database(path, pragmas, legacy_indexes)
+
+    with db.bind_ctx(MODELS):
+        # Older races first, so the one being read isn't alone in the table.
+        receiver_ids = []
+        for seed in range(args.races):
+            timestamps, values = generate_race(
+                args.receivers, args.hz, args.minutes * 60, seed)
+            race_id, receiver_ids = create_race(args.receivers)
+            fill_rows(db, receiver_ids, timestamps, values)
+
+        commits = list(chunk_commits(
+            receiver_ids, timestamps, values, args.hz))
+        elapsed = write_chunks(db, commits)
+        print('{}: chunk commits: {}'.format(name, milliseconds(elapsed)))
+
+        elapsed = []
+        for receiver_id in receiver_ids:
+            start = time.perf_counter()
+            read_receiver_rows(db, receiver_id)
+            elapsed.append(time.perf_counter() - start)
+        print('{}: one receiver\'s rows: {}'.format(
+            name, milliseconds(elapsed)))
+
+        start = time.perf_counter()
+        load_race_rssi(race_id)
+        print('{}: race from chunks: {:.1f}ms'.format(
+            name, (time.perf_counter() - start) * 1000))
+
+        elapsed, errors = read_while_writing(
+            db, receiver_ids, commits, args.reads)
+        print('{}: reads while writing: {}, {} failed'.format(
+            name, milliseconds(elapsed), len(errors)))
+
+    db.close()
+    print('{}: {:.1f}MB'.format(name, os.path.getsize(path) / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--races', type=int, default=5)
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument('--hz', type=int, default=100)
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--reads', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{} races of {} receivers, {}Hz, {} minutes'.format(
+        args.races, args.receivers, args.hz, args.minutes))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, pragmas, legacy_indexes in SETUPS:
+            path = os.path.join(directory, '{}.db'.format(name))
+            run(name, path, pragmas, legacy_indexes, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,7 @@
-from wizardtracker.models import (
-    DB,
-    Race,
-    RaceReceiver,
-    RaceRssi
-)
+from wizardtracker.config import get_config, get_database_options
+from wizardtracker.models import configure_database
+from wizardtracker.models.migrations import migrate
 
 
-DB.create_tables([Race, RaceReceiver, RaceRssi])
+configure_database(**get_database_options(get_config()))
+migrate()
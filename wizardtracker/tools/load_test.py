@@ -0,0 +1,188 @@
+import argparse
+import json
+import threading
+import time
+
+from wizardtracker.config import get_config, get_pubsub_options
+from wizardtracker.device_service.rssi_publisher import RssiPublisher
+from wizardtracker.device_service.tracker.controller import TrackerController
+from wizardtracker.device_service.tracker.load_generator import (
+    PtyTrackerDevice
+)
+
+
+SETTLE_TIME = 0.5
+# Below this share of the sent samples coming out the other end, we call the
+# pipeline saturated.
+SATURATION_RATIO = 0.98
+
+
+class CountingPublisher:
+    def __init__(self, publisher=None):
+        self.count = 0
+        self._publisher = publisher
+
+    def publish(self, rssi_data):
+        self.count = self.count + 1
+        if self._publisher:
+            self._publisher.publish(rssi_data)
+
+    def tick(self):
+        if self._publisher:
+            self._publisher.tick()
+
+    def flush(self):
+        if self._publisher:
+            self._publisher.flush()
+
+
+def create_redis_publisher():
+    config = get_config()
+
+    publisher = RssiPublisher(
+        config['redis']['host'],
+        config['redis'].getint('port'),
+        pubsub_options=get_pubsub_options(config),
+        batch_size=config['rssi_publisher'].getint('batch_size', fallback=1),
+        batch_interval=config['rssi_publisher'].getint(
+            'batch_interval_ms', fallback=0) / 1000)
+    publisher.connect()
+
+    return publisher
+
+
+def run_step(controller, publisher, receivers, hz, seconds, lap_time):
+    device = PtyTrackerDevice(receivers, hz, lap_time=lap_time)
+    device.start()
+
+    controller._run_control_command(controller._connect, device.port)
+    while not controller.is_ready:
+        time.sleep(0.01)
+    time.sleep(SETTLE_TIME)
+
+    start_sent = device.sent_samples
+    start_dropped = device.dropped_bytes
+    start_count = publisher.count
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+
+    time.sleep(seconds)
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+    sent = device.sent_samples - start_sent
+    received = publisher.count - start_count
+    stats = controller.read_stats
+
+    controller.disconnect()
+    device.stop()
+
+    return {
+        'hz': hz,
+        'sentHz': sent / elapsed,
+        'receivedHz': received / elapsed,
+        'ratio': received / sent if sent else 0,
+        'droppedBytes': device.dropped_bytes - start_dropped,
+        'lineBufferOverflows': stats['lineBufferOverflows'],
+        'osBufferOverflows': stats['osBufferOverflows'],
+        'averageReadSize': stats['averageReadSize'],
+        'cpu': cpu / elapsed,
+        'passes': device.pop_passes(),
+    }
+
+
+def sweep(args):
+    redis_publisher = create_redis_publisher() if args.redis else None
+    publisher = CountingPublisher(redis_publisher)
+
+    controller = TrackerController(publisher)
+    controller_thread = threading.Thread(target=controller.start)
+    controller_thread.start()
+
+    print('{} receivers, {}s per step{}'.format(
+        args.receivers,
+        args.seconds,
+        ', publishing to Redis' if args.redis else ''))
+
+    saturated_at = None
+    for hz in args.hz:
+        result = run_step(
+            controller,
+            publisher,
+            args.receivers,
+            hz,
+            args.seconds,
+            args.lap_time)
+
+        print('{hz:>6}Hz: received {receivedHz:8.0f}Hz of {sentHz:8.0f}Hz '
+              '({ratio:6.1%}), dropped {droppedBytes} bytes, '
+              'overflows {osBufferOverflows}/{lineBufferOverflows}, '
+              'avg read {averageReadSize:.0f}B, CPU {cpu:.0%}'.format(
+                  **result))
+
+        if saturated_at is None and (
+                result['ratio'] < SATURATION_RATIO or
+                result['droppedBytes']):
+            saturated_at = hz
+
+    if saturated_at is None:
+        print('Kept up at every rate.')
+    else:
+        print('Saturated at {}Hz.'.format(saturated_at))
+
+    controller.stop()
+    controller_thread.join()
+    if redis_publisher:
+        redis_publisher.close()
+
+
+def serve(args):
+    # Just the device, for pointing something else at the pty.
+    device = PtyTrackerDevice(
+        args.receivers, args.hz[0], lap_time=args.lap_time)
+    device.start()
+    print('Serving {} receivers at {}Hz on {}'.format(
+        args.receivers, args.hz[0], device.port))
+
+    ground_truth = open(args.ground_truth, 'a') if args.ground_truth else None
+
+    try:
+        while True:
+            time.sleep(1)
+            for timestamp, receiver in device.pop_passes():
+                if ground_truth:
+                    ground_truth.write(json.dumps({
+                        'timestamp': timestamp,
+                        'receiver': receiver
+                    }) + '\n')
+                    ground_truth.flush()
+    except KeyboardInterrupt:
+        pass
+
+    print('Sent {} samples, dropped {} bytes.'.format(
+        device.sent_samples, device.dropped_bytes))
+    device.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--receivers', type=int, default=8)
+    parser.add_argument(
+        '--hz',
+        type=lambda s: [int(h) for h in s.split(',')],
+        default=[500, 1000, 2000, 4000, 8000])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--lap-time', type=float, default=None)
+    parser.add_argument('--redis', action='store_true')
+    parser.add_argument('--serve', action='store_true')
+    parser.add_argument('--ground-truth')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+    else:
+        sweep(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import logging
+
+import coloredlogs
+
+from wizardtracker.config import get_config, get_database_options
+from wizardtracker.models import (
+    DB,
+    RaceReceiver,
+    RaceRssi,
+    RaceRssiChunk,
+    configure_database
+)
+from wizardtracker.models.migrations import migrate
+from wizardtracker.models.rssi_chunks import (
+    encode_chunk,
+    load_rssi_rows,
+    split_chunks
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def migrate_receiver(receiver_id, delete):
+    timestamps, values = load_rssi_rows(receiver_id)
+    if not len(timestamps):
+        return 0, 0
+
+    rows = [
+        dict(
+            encode_chunk(timestamps[start:end], values[start:end]),
+            receiver=receiver_id)
+        for start, end in split_chunks(timestamps)]
+
+    with DB.atomic():
+        RaceRssiChunk.insert_many(rows).execute()
+
+        if delete:
+            RaceRssi.delete() \
+                .where(RaceRssi.receiver == receiver_id) \
+                .execute()
+
+    return len(timestamps), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Moves RSSI from RaceRssi rows into RaceRssiChunk.')
+    parser.add_argument(
+        '--delete',
+        action='store_true',
+        help='delete the rows once each receiver is moved')
+    parser.add_argument(
+        '--vacuum',
+        action='store_true',
+        help='give the space back afterwards (needs --delete to help)')
+    args = parser.parse_args()
+
+    coloredlogs.install(
+        level=logging.INFO,
+        fmt='[%(name)s] %(levelname)s %(message)s')
+
+    configure_database(**get_database_options(get_config()))
+    migrate()
+
+    # Receivers that already have chunks were moved by an earlier run.
+    moved = RaceRssiChunk.select(RaceRssiChunk.receiver).distinct()
+    receivers = RaceReceiver \
+        .select(RaceReceiver.id) \
+        .where(RaceReceiver.id.not_in(moved)) \
+        .order_by(RaceReceiver.id)
+
+    total_rows = 0
+    total_chunks = 0
+    for receiver in receivers:
+        rows, chunks = migrate_receiver(receiver.id, args.delete)
+        if rows:
+            LOGGER.info(
+                'Receiver %d: %d rows into %d chunks.',
+                receiver.id,
+                rows,
+                chunks)
+
+        total_rows = total_rows + rows
+        total_chunks = total_chunks + chunks
+
+    LOGGER.info('Moved %d rows into %d chunks.', total_rows, total_chunks)
+
+    if args.vacuum:
+        LOGGER.info('Vacuuming...')
+        DB.execute_sql('VACUUM')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import threading
+import time
+
+from wizardtracker.device_service.tracker.controller import TrackerController
+from wizardtracker.device_service.tracker.serial_capture import read_capture
+from wizardtracker.tools.load_test import (
+    CountingPublisher,
+    create_redis_publisher
+)
+
+
+def describe_capture(path):
+    chunk_count = 0
+    byte_count = 0
+    first_time = None
+    last_time = None
+
+    for timestamp, data in read_capture(path):
+        chunk_count = chunk_count + 1
+        byte_count = byte_count + len(data)
+        if first_time is None:
+            first_time = timestamp
+        last_time = timestamp
+
+    duration = last_time - first_time if chunk_count else 0
+    print('{}: {} chunks, {} bytes over {:.1f}s'.format(
+        path, chunk_count, byte_count, duration))
+
+    return byte_count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path')
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1,
+        help='playback speed, 0 for as fast as possible')
+    parser.add_argument('--redis', action='store_true')
+    args = parser.parse_args()
+
+    byte_count = describe_capture(args.path)
+
+    redis_publisher = create_redis_publisher() if args.redis else None
+    publisher = CountingPublisher(redis_publisher)
+
+    controller = TrackerController(publisher)
+    controller_thread = threading.Thread(target=controller.start)
+    controller_thread.start()
+
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    if controller.replay(args.path, args.speed):
+        # The controller drops the connection once the capture runs out.
+        while controller.is_connected:
+            time.sleep(0.01)
+
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+
+    controller.stop()
+    controller_thread.join()
+    if redis_publisher:
+        redis_publisher.close()
+
+    print('Replayed {} samples in {:.2f}s: {:.0f} samples/s, {:.2f}MB/s, '
+          'CPU {:.0%}'.format(
+              publisher.count,
+              elapsed,
+              publisher.count / elapsed,
+              byte_count / elapsed / 1000000,
+              cpu / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,33 @@
 import threading
 import time
 
-from flask import Flask
+from flask import Flask, Response
 from flask_socketio import SocketIO
 
+from wizardtracker import metrics
+from wizardtracker.config import get_config, get_pubsub_options
 from .rssi_streamer import RssiStreamer
 
 
 socketio = SocketIO()
 
-rssi_streamer = RssiStreamer(socketio)
+rssi_streamer = RssiStreamer(socketio, get_pubsub_options(get_config()))
 rssi_streamer_thread = threading.Thread(target=rssi_streamer.start)
 
 
 def init_rssi_streamer():
     rssi_streamer_thread.start()
 
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 def create_app():
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'a big secret'
 
     from .device_api import device_api
     app.register_blueprint(device_api, url_prefix='/device')
+    app.add_url_rule('/metrics', 'metrics', get_metrics)
 
     socketio.init_app(app)
     return app
@@ -1,49 +1,62 @@
-import requests
-
 from flask import Blueprint, Response, request
 
-
-DEVICE_BASE_URL = 'http://127.0.0.1:3091'
+from wizardtracker.device_client import DEVICE_CLIENT
 
 
 device_api = Blueprint('device_api', __name__)
 
 
+def _proxy(r):
+    return Response(
+        r.text,
+        status=r.status_code,
+        content_type='application/json')
+
+@device_api.route('/devices')
+def devices():
+    return _proxy(DEVICE_CLIENT.devices())
+
 @device_api.route('/ports')
 def ports():
-    r = requests.get(DEVICE_BASE_URL + '/ports')
-
-    return Response(r.text, content_type='application/json')
+    return _proxy(DEVICE_CLIENT.ports(request.args.get('device')))
 
 @device_api.route('/status')
 def status():
-    r = requests.get(DEVICE_BASE_URL + '/status')
+    # Served from the shared cache, so however many browsers are polling
+    # the device service only sees one request per interval.
+    status = DEVICE_CLIENT.get_status(request.args.get('device'))
 
-    return Response(r.text, content_type='application/json')
+    return Response(
+        status.body,
+        status=status.status_code,
+        content_type='application/json')
 
 @device_api.route('/connect', methods=['POST'])
 def connect():
     port = request.args.get('port')
 
-    r = requests.post(
-        DEVICE_BASE_URL + '/connect',
-        params={'port': port})
-
-    return Response(r.text, content_type='application/json')
+    return _proxy(DEVICE_CLIENT.connect(port, request.args.get('device')))
 
 @device_api.route('/disconnect', methods=['POST'])
 def disconnect():
-    r = requests.post(DEVICE_BASE_URL + '/disconnect')
-
-    return Response(r.text, content_type='application/json')
+    return _proxy(DEVICE_CLIENT.disconnect(request.args.get('device')))
 
 @device_api.route('/set_frequency', methods=['POST'])
 def set_frequency():
     receiver_id = int(request.args.get('id'))
     frequency = int(request.args.get('frequency'))
 
-    r = requests.post(
-        DEVICE_BASE_URL + '/set_frequency',
-        params={'id': receiver_id, 'frequency': frequency})
+    return _proxy(DEVICE_CLIENT.set_frequency(
+        receiver_id,
+        frequency,
+        request.args.get('device')))
+
+@device_api.route('/set_frequencies', methods=['POST'])
+def set_frequencies():
+    frequencies = [
+        int(frequency)
+        for frequency in request.args.get('frequencies').split(',')]
 
-    return Response(r.text, content_type='application/json')
+    return _proxy(DEVICE_CLIENT.set_frequencies(
+        frequencies,
+        request.args.get('device')))
@@ -1,7 +1,9 @@
 import logging
 import time
 
+from wizardtracker import metrics
 from wizardtracker.nice_redis_pubsub import NiceRedisPubsub
+from wizardtracker.sample_sequence import SequenceGapCounter
 
 
 LOGGER = logging.getLogger(__name__)
@@ -13,16 +15,27 @@ class RssiStreamer:
 
     MESSAGES_PER_SECOND = 5
 
-    def __init__(self, socketio):
+    def __init__(self, socketio, pubsub_options=None):
         self._should_stop = False
 
         self._socketio = socketio
-        self._redis = NiceRedisPubsub()
+        self._redis = NiceRedisPubsub(
+            consumer_group='web_api',
+            **(pubsub_options or {}))
 
         self._rssi_raw = None
+        self._rssi_raw_timestamp = None
+        self._rssi_raw_received = None
         self._rssi_filtered = None
+        self.rssi_raw_gaps = SequenceGapCounter('rssiRaw')
+        self.rssi_filtered_gaps = SequenceGapCounter('rssiFiltered')
 
-        self._last_message_time = time.clock()
+        self._last_message_time = time.perf_counter()
+
+        self._raw_age = metrics.sample_age_seconds('streamer_raw')
+        self._filtered_age = metrics.sample_age_seconds('streamer_filtered')
+        self._emitted_age = metrics.sample_age_seconds('emitted')
+        self._redis_to_emit = metrics.stage_seconds('redis_to_emit')
 
     def start(self):
         self._redis.connect()
@@ -32,6 +45,8 @@ class RssiStreamer:
         while not self._should_stop:
             self._loop()
 
+        self._redis.close()
+
     def stop(self):
         self._should_stop = True
 
@@ -40,10 +55,17 @@ class RssiStreamer:
         self._tick_socketio_messages()
 
     def _rssi_raw_cb(self, data):
+        self.rssi_raw_gaps.check(data)
         self._rssi_raw = data['rssi']
+        self._rssi_raw_timestamp = data['timestamp']
+        self._rssi_raw_received = time.perf_counter()
+        self._raw_age.observe(
+            self._rssi_raw_received - self._rssi_raw_timestamp)
 
     def _rssi_filtered_cb(self, data):
+        self.rssi_filtered_gaps.check(data)
         self._rssi_filtered = data['rssi']
+        self._filtered_age.observe(time.perf_counter() - data['timestamp'])
 
     def _tick_socketio_messages(self):
         if not self._rssi_raw or not self._rssi_filtered:
@@ -52,9 +74,14 @@ class RssiStreamer:
         if self._due_next_message:
             self._socketio.emit('rssiRaw', {'rssi': self._rssi_raw})
             self._socketio.emit('rssiFiltered', {'rssi': self._rssi_filtered})
-            self._last_message_time = time.clock()
+            self._last_message_time = time.perf_counter()
+
+            self._redis_to_emit.observe(
+                self._last_message_time - self._rssi_raw_received)
+            self._emitted_age.observe(
+                self._last_message_time - self._rssi_raw_timestamp)
 
     @property
     def _due_next_message(self):
         message_delay = 1 / self.MESSAGES_PER_SECOND
-        return time.clock() >= self._last_message_time + message_delay
+        return time.perf_counter() >= self._last_message_time + message_delay
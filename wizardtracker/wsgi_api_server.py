@@ -1,23 +1,225 @@
+import queue
+import selectors
+import socket
 import threading
+import time
 import logging
 
-from wsgiref.simple_server import WSGIRequestHandler, make_server
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 
 
+WORKER_COUNT = 8
+# Idle keep-alive connections are closed after this long.
+KEEP_ALIVE_TIMEOUT = 5
+IDLE_CHECK_INTERVAL = 0.5
+
 LOGGER = logging.getLogger(__name__)
 
 
 class QuietWSGIRequestHandler(WSGIRequestHandler):
-    def log_message(self, format, *args):
-        LOGGER.debug('%s {}'.format(format), self.client_address[0], *args)
+    # HTTP/1.1 so clients can keep their connection open between requests.
+    # Each one handles a single request at a time, and the server waits for
+    # the next without tying up a worker (see ThreadPoolWSGIServer).
+    protocol_version = 'HTTP/1.1'
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    keep_alive = False
+
+    def handle(self):
+        self.keep_alive = False
+        super().handle()
+
+    def handle_one_request(self):
+        super().handle_one_request()
+
+        # Stop handle() carrying on to the next request.
+        self.keep_alive = not self.close_connection
+        self.close_connection = True
+
+    def finish(self):
+        if not self.keep_alive:
+            super().finish()
+
+    def resume(self):
+        # The next request on a kept-alive connection, the way
+        # BaseRequestHandler.__init__ does the first.
+        try:
+            self.handle()
+        finally:
+            self.finish()
+
+    def request_waiting(self):
+        # Anything already in rfile's buffer or on the socket, without
+        # blocking. A buffered request wouldn't wake up a selector.
+        self.connection.setblocking(False)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            # Let a worker find out what's wrong.
+            return True
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def log(self, type, message, *args):
+        log = LOGGER.error if type == 'error' else LOGGER.debug
+        log('%s {}'.format(message), self.address_string(), *args)
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    # Requests are handed to a fixed set of worker threads, so a slow
+    # request only ties up one of them. Between requests, keep-alive
+    # connections wait in a selector on their own thread rather than on a
+    # worker, so idle clients (browsers, scrapers, pooled clients) can't
+    # use up the pool. Size it for the requests in flight at once,
+    # including long polls.
+    multithread = True
+
+    def __init__(self, host, port, app, worker_count=WORKER_COUNT):
+        super().__init__(host, port, app, handler=QuietWSGIRequestHandler)
+
+        self._worker_count = worker_count
+        self._requests = queue.Queue()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+        # Workers pass kept-alive connections to the idle thread through
+        # here, and poke it through the socket pair.
+        self._idle_handlers = queue.Queue()
+        self._idle_wakeup, self._idle_wakeup_writer = socket.socketpair()
+        self._idle_wakeup.setblocking(False)
+        self._idle_wakeup_writer.setblocking(False)
+
+        # Daemon threads, so a long poll can't hold up shutting down.
+        for i in range(worker_count):
+            threading.Thread(
+                target=self._work,
+                name='api-worker-{}'.format(i),
+                daemon=True).start()
+
+        threading.Thread(
+            target=self._watch_idle,
+            name='api-idle',
+            daemon=True).start()
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address, None))
+
+    def server_close(self):
+        super().server_close()
+
+        for _ in range(self._worker_count):
+            self._requests.put(None)
+        self._keep_alive(None)
+
+        # Wake up anyone sat reading a request.
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _work(self):
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+
+            request, client_address, handler = item
+            with self._connections_lock:
+                self._connections.add(request)
+
+            keep_alive = False
+            try:
+                if handler is None:
+                    handler = self.RequestHandlerClass(
+                        request, client_address, self)
+                else:
+                    handler.resume()
+                keep_alive = handler.keep_alive
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                with self._connections_lock:
+                    self._connections.discard(request)
+
+                if not keep_alive:
+                    self.shutdown_request(request)
+                elif handler.request_waiting():
+                    self._requests.put((request, client_address, handler))
+                else:
+                    self._keep_alive(handler)
+
+    def _keep_alive(self, handler):
+        self._idle_handlers.put(handler)
+        try:
+            self._idle_wakeup_writer.send(b'\0')
+        except BlockingIOError:
+            # Plenty of wakeups queued up already.
+            pass
+
+    def _watch_idle(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._idle_wakeup, selectors.EVENT_READ)
+        deadlines = {}
+
+        while True:
+            for key, _ in selector.select(IDLE_CHECK_INTERVAL):
+                if key.fileobj is self._idle_wakeup:
+                    continue
+
+                # The next request's arrived (or the client's gone, which
+                # the worker finds out about).
+                handler = key.data
+                selector.unregister(handler.connection)
+                del deadlines[handler]
+                self._requests.put(
+                    (handler.request, handler.client_address, handler))
+
+            try:
+                while self._idle_wakeup.recv(4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+            while not self._idle_handlers.empty():
+                handler = self._idle_handlers.get()
+                if handler is None:
+                    for idle in deadlines:
+                        self._close_idle(selector, idle)
+                    selector.close()
+                    return
+
+                selector.register(
+                    handler.connection, selectors.EVENT_READ, handler)
+                deadlines[handler] = time.monotonic() + KEEP_ALIVE_TIMEOUT
+
+            now = time.monotonic()
+            for handler, deadline in list(deadlines.items()):
+                if now >= deadline:
+                    del deadlines[handler]
+                    self._close_idle(selector, handler)
+
+    def _close_idle(self, selector, handler):
+        selector.unregister(handler.connection)
+        handler.keep_alive = False
+        handler.finish()
+        self.shutdown_request(handler.request)
 
 
 class ApiServer:
-    def __init__(self, app, host, port, app_globals=None):
+    def __init__(
+            self,
+            app,
+            host,
+            port,
+            app_globals=None,
+            worker_count=WORKER_COUNT):
         self._app = app
         self._app_globals = app_globals if app_globals else {}
         self._host = host
         self._port = port
+        self._worker_count = worker_count
 
         self._httpd = None
         self._lock = threading.Lock()
@@ -28,12 +230,16 @@ class ApiServer:
         for key, value in self._app_globals.items():
             setattr(self._app, key, value)
 
-        self._httpd = make_server(
+        self._httpd = ThreadPoolWSGIServer(
             self._host,
             self._port,
             self._app,
-            handler_class=QuietWSGIRequestHandler)
-        LOGGER.info('Listening on %s:%d...', self._host, self._port)
+            worker_count=self._worker_count)
+        LOGGER.info(
+            'Listening on %s:%d (%d workers)...',
+            self._host,
+            self._port,
+            self._worker_count)
 
         self._lock.release()
         self._httpd.serve_forever()
@@ -42,4 +248,5 @@ class ApiServer:
         self._lock.acquire(True)
         LOGGER.info('Shutting down...')
         self._httpd.shutdown()
+        self._httpd.server_close()
         self._lock.release()